@@ -15,9 +15,17 @@
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 import pox.lib.packet as pkt
-from pox.lib.util import dpid_to_str, str_to_dpid
+from pox.lib.util import dpid_to_str, str_to_bool
 from pox.lib.revent import *
 from pox.lib.addresses import EthAddr
+from pox.lib.recoco import Timer
+import gox_queries
+import gox_writer
+from gox_executor import DB_KEY
+from gox_routing import Route, RouteCache
+from gox_reroute import Rerouter
+from gox_metrics import instrumented
+import gox_sweeper
 import time
 
 
@@ -27,19 +35,165 @@ log = core.getLogger()
 FLOW_IDLE_TIMEOUT = 10
 FLOW_HARD_TIMEOUT = 30
 
+# Path computations in flight
+FLIGHT_TIMEOUT = 2      # Seconds before the packets waiting for a path are flooded
+FLIGHT_SETTLE_TIME = 1  # Seconds during which late PacketIns of an installed path are only forwarded
+FLIGHT_MAX_PACKETS = 64 # Packets buffered per host pair, the next ones are dropped
+
+# Packets to unknown hosts, and broadcast packets
+UNKNOWN_TTL = 5         # Seconds during which a MAC address which was not found is not looked up again
+UNKNOWN_RATE = 10       # Packets per second and per source flooded by the controller...
+UNKNOWN_BURST = 20      # ... after a burst of this many packets
+UNKNOWN_HOLD_TIME = 5   # Seconds during which a source over its rate is handled by a short-lived entry
+LIMIT_PRIORITY = of.OFP_DEFAULT_PRIORITY + 2    # Above the ARP entry of the proxy
+
+# Single round trip on a cache miss: checks both hosts, returns their stored path,
+# or computes and stores it if there is none
+gox_queries.register("forwarding.lookupPath", '''
+        MATCH (h1:Host {mac: $mac1})
+        MATCH (h2:Host {mac: $mac2})
+        OPTIONAL MATCH (h1)-[e1:Path_to]->(h2)
+        OPTIONAL MATCH (h1)<-[e2:Path_to]-(h2)
+        CALL {
+            WITH h1, h2, e1, e2
+            WITH e1, e2 WHERE e1 IS NOT NULL AND e2 IS NOT NULL
+            RETURN e1.switches AS switches, e1.in_ports AS in_ports, e1.out_ports AS out_ports,
+                   e2.in_ports AS r_in_ports, e2.out_ports AS r_out_ports
+          UNION
+            WITH h1, h2, e1, e2
+            WITH h1, h2 WHERE e1 IS NULL OR e2 IS NULL
+            MATCH p = shortestPath( (h1)-[:Connected_to*]->(h2) )
+            WITH h1, h2,
+            [n in nodes(p)[1..-1]| n.dpid] AS switches,
+            [r in relationships(p)[1..]| r.orig_port] AS out_ports,
+            [r in relationships(p)[..-1]| r.dst_port] AS in_ports
+            MERGE (h1)-[p1:Path_to]->(h2)
+            SET p1.switches = switches,
+                p1.out_ports = out_ports,
+                p1.in_ports = in_ports,
+                p1.last_used = $now,
+                p1.hits = 0
+            MERGE (h1)<-[p2:Path_to]-(h2)
+            SET p2.switches = reverse(switches),
+                p2.out_ports = reverse(in_ports),
+                p2.in_ports = reverse(out_ports),
+                p2.last_used = $now,
+                p2.hits = 0
+            RETURN switches, in_ports, out_ports,
+                   reverse(out_ports) AS r_in_ports, reverse(in_ports) AS r_out_ports
+        }
+        RETURN switches, in_ports, out_ports, r_in_ports, r_out_ports
+        ''')
+
+class Flight(object):
+    """
+    Path computation and installation in progress between two hosts, with the PacketIns waiting for it.
+    Once the path is installed, the flight is kept for FLIGHT_SETTLE_TIME seconds so that the PacketIns
+    sent before the flow entries landed are forwarded along the path without installing it again
+    """
+
+    def __init__(self, mac1, mac2):
+        self.mac1 = mac1
+        self.mac2 = mac2
+        self.route = None       # Route from mac1 to mac2, once installed
+        self.events = []        # Buffered PacketIn events
+        self.timer = None
+
+    def routeFrom(self, mac):
+        """
+        Returns the installed route taken by the packets sent by mac
+        """
+        if mac == self.mac1:
+            return self.route
+        return self.route.reverse()
+
+
 class GoxForwarding(object):
     """
-    Forward packets according to the shortest path defined in neo4j's 
-    Graph Data Science library. It uses Dijkstra's algorithm.
+    Forward packets according to the shortest path between hosts.
+
+    With routing="local", paths are computed by GOX's RoutingEngine from its in-memory
+    topology, and stored in neo4j in the background. With routing="cypher", they are
+    looked up or computed by neo4j with its shortestPath function, in a single query.
+
+    The most recently used paths are kept in a RouteCache of path_cache_size entries,
+    invalidated when hosts leave, when paths are rerouted, and when their entries time out,
+    since the Rerouter only reroutes the installed paths.
+
+    Concurrent PacketIns for the same host pair share a single path computation and installation:
+    the first one starts a Flight, the next ones wait for it and are then sent along the new path.
+
+    With mode="pair" (default), entries match the source and the destination MAC addresses and are
+    installed reactively, when a host pair starts communicating. With mode="destination", every switch
+    gets one entry per host, matching only the destination MAC address, along the shortest path tree
+    of the RoutingEngine towards the switch of the host. Entries are installed proactively when the
+    host joins and updated when the tree changes, so that first packets never reach the controller.
+
+    In pair mode with local routing, multipath="hash" or "least-loaded" spreads the host pairs over up to
+    multipath_k equal-cost shortest paths, by hashing the pair or by picking the path whose busiest link
+    is the least loaded according to the PortStatsCollector.
 
     Inspired from forwarding.l2_learning and Gavel's routing script
     """
 
-    def __init__(self):
+    def __init__(self, routing="local", path_cache_size=4096, mode="pair", arp_proxy=True,
+                 idle_timeout=FLOW_IDLE_TIMEOUT, hard_timeout=FLOW_HARD_TIMEOUT, multipath="none", multipath_k=4):
         core.openflow.addListeners(self)
 
-        self.db_session = core.DatabaseInstance.session
-        log.info("GoxForwarding ready")
+        if routing not in ("local", "cypher"):
+            raise ValueError("Unknown routing mode {}, use local or cypher".format(routing))
+        if mode not in ("pair", "destination"):
+            raise ValueError("Unknown forwarding mode {}, use pair or destination".format(mode))
+        if multipath not in ("none", "hash", "least-loaded"):
+            raise ValueError("Unknown multipath selection {}, use none, hash or least-loaded".format(multipath))
+        if multipath != "none" and routing != "local":
+            raise ValueError("Multipath selection needs local routing")
+        self.routing = routing
+        self.mode = mode
+        self.arp_proxy = arp_proxy
+        self.arp_replies = 0
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.multipath = multipath
+        self.multipath_k = multipath_k
+        self.link_load = None                     # load(dpid, port) of the links, for least-loaded selection
+        if core.hasComponent("PortStatsCollector"):
+            self.link_load = core.PortStatsCollector.load
+        elif multipath == "least-loaded":
+            log.warn("Least-loaded multipath selection without port statistics, launch gox with port_stats")
+        self.executor = core.DatabaseExecutor     # Runs the queries outside of POX's thread
+        self.topology = core.NetworkEventHandler.topology
+        self.routing_engine = core.RoutingEngine
+        self.path_index = core.Rerouter.index     # Installed paths, rerouted when a link or a switch fails
+        self.flow_shadow = core.FlowShadow
+        self.path_cache = RouteCache(path_cache_size)
+        self.flights = {}                         # Sorted (mac1, mac2) -> Flight
+        self.unknown = {}                         # MAC address not found -> expiry time of the negative entry
+        self.buckets = {}                         # Source MAC -> [tokens, time of the last refill]
+        self.unknown_flooded = 0
+        self.unknown_limited = 0
+        self.broadcast_dropped = 0
+        self.unknown_timer = Timer(UNKNOWN_TTL, self._pruneUnknown, recurring=True)
+        core.Rerouter.addListeners(self)
+        core.Rerouter.select = self.selectPath   # Rerouted pairs are spread over the paths like the new ones
+        self.routing_engine.addListeners(self)
+        self.topology.addListeners(self)
+        self.path_sweeper = None                  # Ages the stored paths, which are touched when installed
+        if core.hasComponent("PathSweeper"):
+            self.path_sweeper = core.PathSweeper
+            self.path_sweeper.addListeners(self)
+            if self.path_sweeper.ttl and self.path_sweeper.ttl < max(idle_timeout, hard_timeout):
+                log.warn("The path TTL ({0}s) is shorter than the flow timeouts, installed paths may be evicted".format(self.path_sweeper.ttl))
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        if core.hasComponent("WarmStart"):
+            # Paths stored before the restart, rerouted if the topology changed meanwhile
+            for (mac1, mac2), route in core.WarmStart.paths.items():
+                self.path_index.add(mac1, mac2, route)
+                self.path_cache.put(mac1, mac2, route)
+        if mode == "destination":
+            for mac in list(self.topology.hosts):
+                self.installDestination(mac)
+        log.info("GoxForwarding ready ({0} routing, {1} mode)".format(routing, mode))
         
     
     def craftOpenflowMessage(self, src_mac, dst_mac, out_port, data = None):
@@ -47,8 +201,8 @@ class GoxForwarding(object):
         Method for crafting an openflow message to forward packets to an output port on a given switch (identified by its dpid)
         """
         msg = of.ofp_flow_mod()
-        # msg.idle_timeout = FLOW_IDLE_TIMEOUT
-        # msg.hard_timeout = FLOW_HARD_TIMEOUT
+        msg.idle_timeout = self.idle_timeout
+        msg.hard_timeout = self.hard_timeout
         msg.match = of.ofp_match()
         # msg.match.in_port = in_port
         msg.match.dl_src = src_mac
@@ -58,96 +212,453 @@ class GoxForwarding(object):
         msg.actions.append(of.ofp_action_output(port=out_port))
         return msg
         
-    def pathExists(self, mac1, mac2):
-        """
-        Returns a boolean telling if a path between mac1 and mac2 already exists in the database
+    def sendOFMessages(self, mac1, mac2, switches, in_ports, out_ports, r_in_ports, r_out_ports, event, callback = None):
         """
-        query = '''
-                MATCH (h1:Host {{mac:"{mac1}"}})-[r:Path_to]-(h2:Host {{mac:"{mac2}"}})
-                RETURN r
-                '''.format(mac1=mac1, mac2=mac2)
-        result = self.db_session.run(query)
-        return result.peek() != None
-
-    def sendOFMessages(self, mac1, mac2, switches, in_ports, out_ports, r_in_ports, r_out_ports, event):
-        """
-        docstring
+        Sends the entries of the path from mac1 to mac2 and of its reverse to the switches, through
+        the FlowShadow which skips the entries they already have. Once the switches confirmed
+        their installation, the packet of the event is sent along the path and callback is called
         """
         packet_out_port = None
+        event_dpid = dpid_to_str(event.dpid)
         for i in range(len(switches)):
-            connection = core.openflow.getConnection(str_to_dpid(switches[i]))
-            connection.send(self.craftOpenflowMessage(EthAddr(mac1), EthAddr(mac2), int(out_ports[i])))
+            # The PacketIn shows that the entry of its switch is missing
+            missing = switches[i] == event_dpid
+            self.flow_shadow.install(switches[i], self.craftOpenflowMessage(EthAddr(mac1), EthAddr(mac2), int(out_ports[i])), missing)
             j = len(switches)-i-1
-            connection.send(self.craftOpenflowMessage(EthAddr(mac2), EthAddr(mac1), int(r_out_ports[j])))
+            self.flow_shadow.install(switches[i], self.craftOpenflowMessage(EthAddr(mac2), EthAddr(mac1), int(r_out_ports[j])))
 
-            if connection == event.connection:
+            if missing:
                 packet_out_port = int(out_ports[i])
 
-        if packet_out_port is not None:
-            packet = event.parsed
-            event.connection.send(self.craftOpenflowMessage(packet.src, packet.dst, packet_out_port, event.ofp))
+        if self.path_sweeper is not None:
+            self.path_sweeper.touch(mac1, mac2)
+
+        def installed ():
+            if packet_out_port is not None:
+                self.sendPacket(event, packet_out_port)
+            if callback is not None:
+                callback()
 
+        self.flow_shadow.flush(installed)
 
-    def installExistingPath(self, mac1, mac2, event):
+
+    def selectPath(self, mac1, mac2):
         """
-        Function using the neo4j database for retrieving the previously calculated
-        path between 2 hosts and sending it back to the corresponding switches
+        Returns the route from mac1 to mac2 computed by the RoutingEngine: the shortest path, or one of
+        the equal-cost ones with multipath. Returns None if the hosts are not connected
         """
-        query = '''
-                MATCH (h1:Host {{mac:"{mac1}"}})-[r1:Path_to]->(h2:Host {{mac:"{mac2}"}})
-                MATCH (h1:Host {{mac:"{mac1}"}})<-[r2:Path_to]-(h2:Host {{mac:"{mac2}"}})
-                WITH r1.switches AS switches,
-                     r1.in_ports AS in_ports, r2.in_ports AS r_in_ports,
-                     r1.out_ports AS out_ports, r2.out_ports AS r_out_ports
-                    
-                RETURN *
-                '''.format(mac1=mac1, mac2=mac2)
-        result = self.db_session.run(query)
+        if self.multipath == "none":
+            return self.routing_engine.shortestPath(mac1, mac2)
+        return self.routing_engine.multiPath(mac1, mac2, self.multipath_k, self.multipath, self.link_load)
 
-        for record in result:
-            self.sendOFMessages(mac1, mac2, record["switches"], record["in_ports"], record["out_ports"], record["r_in_ports"], record["r_out_ports"], event)
+    def localPath(self, mac1, mac2):
+        """
+        Function using the RoutingEngine for computing the shortest path between
+        2 hosts. The path is stored in the neo4j database in the background.
+        Returns None if the hosts are not connected
+        """
+        route = self.selectPath(mac1, mac2)
+        if route is None:
+            return None
+        if core.hasComponent("TopologyWriter"):
+            core.TopologyWriter.savePath(mac1, mac2, route)
+        else:
+            # After the mutations of the DatabaseInstance, which creates the hosts
+            self.executor.run("topology.savePath", {"rows": [gox_writer.pathRow(mac1, mac2, route)]}, key=DB_KEY)
+        return route
 
-    def installNewPath(self, mac1, mac2, event):
+    def lookupPath(self, mac1, mac2, callback):
         """
-        Function using the neo4j database for getting the shortest path between
-        2 hosts given their mac adress
+        Function using a single neo4j query for checking both hosts, and retrieving their
+        stored path or calculating a new one. callback is given the route, or None if the hosts
+        are unknown or not connected
         """
+        def found(records):
+            if not records:
+                callback(None)
+                return
+            callback(Route(records[0]["switches"], records[0]["in_ports"], records[0]["out_ports"]))
 
-        query = '''
-                MATCH (h1:Host {{mac:"{mac1}"}})
-                MATCH (h2:Host {{mac:"{mac2}"}})
-                MATCH p = shortestPath( (h1)-[:Connected_to*]->(h2) )
+        self.executor.run("forwarding.lookupPath", {"mac1": mac1, "mac2": mac2, "now": gox_sweeper.now()}, found, errback=lambda error: callback(None))
 
-                WITH h1, h2, p, 
-                [n in nodes(p)[1..-1]| n.dpid] AS switches, 
-                [r in relationships(p)[1..]| r.orig_port] AS out_ports, 
-                [r in relationships(p)[..-1]| r.dst_port] AS in_ports
+    def findPath(self, mac1, mac2, callback):
+        """
+        Gives to callback the route from mac1 to mac2, from the path cache or computed according to the routing mode
+        """
+        route = self.path_cache.get(mac1, mac2)
+        if route is not None:
+            callback(route)
+        elif self.routing == "local":
+            callback(self.localPath(mac1, mac2))
+        else:
+            self.lookupPath(mac1, mac2, callback)
 
-                WITH *,
-                reverse(switches) AS r_switches,
-                reverse(in_ports) AS r_in_ports,
-                reverse(out_ports) AS r_out_ports
+    def installPath(self, mac1, mac2, route, event, callback = None):
+        """
+        Sends the route from mac1 to mac2 and its reverse to the switches, and caches it.
+        callback is called once the switches installed it
+        """
+        reverse = route.reverse()
+        self.sendOFMessages(mac1, mac2, route.switches, route.in_ports, route.out_ports, reverse.in_ports, reverse.out_ports, event, callback)
+        self.indexPath(mac1, mac2, route)
+        self.path_cache.put(mac1, mac2, route)
 
-                MERGE (h1)-[p1:Path_to]->(h2)
-                ON CREATE SET p1.switches=switches,
-                              p1.out_ports=out_ports,
-                              p1.in_ports=in_ports
+    def indexPath(self, mac1, mac2, route):
+        """
+        Records the installed route from mac1 to mac2, and its reverse, so that they can be
+        rerouted when one of their links or switches fails
+        """
+        self.path_index.add(mac1, mac2, route)
+        self.path_index.add(mac2, mac1, route.reverse())
 
-                MERGE (h1)<-[p2:Path_to]-(h2)
-                ON CREATE SET p2.switches = r_switches,
-                              p2.out_ports = r_in_ports,
-                              p2.in_ports = r_out_ports
-                
-                RETURN switches, in_ports, out_ports, r_out_ports, r_in_ports
-                '''.format(mac1=mac1, mac2=mac2)
-        result = self.db_session.run(query)
-        
-        for record in result:
-            self.sendOFMessages(mac1, mac2, record["switches"], record["in_ports"], record["out_ports"], record["r_out_ports"], record["r_in_ports"], event)
+    def floodPacket(self, event):
+        """ Floods the packet of a PacketIn event, along the spanning tree of gox_spanning if it is launched """
+        msg = of.ofp_packet_out()
+        msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
+        msg.data = event.ofp
+        event.connection.send(msg)
+
+    def forwardPacket(self, event, route):
+        """
+        Sends the packet of a PacketIn event to the next hop of the route, or floods it
+        if the switch it comes from is not on the route
+        """
+        dpid = dpid_to_str(event.dpid)
+        if dpid not in route.switches:
+            self.floodPacket(event)
+            return
+        self.sendPacket(event, int(route.out_ports[route.switches.index(dpid)]))
+
+    def sendPacket(self, event, port):
+        """ Sends the packet of a PacketIn event to a port of its switch """
+        msg = of.ofp_packet_out()
+        msg.actions.append(of.ofp_action_output(port = port))
+        msg.data = event.ofp
+        msg.in_port = event.port
+        event.connection.send(msg)
+
+    def routePacket(self, mac1, mac2, event):
+        """
+        Installs the path from mac1 to mac2 and sends the packet along it. If the path of this host pair
+        is already being installed, the packet waits for it instead of installing it a second time
+        """
+        if self.isUnknown(mac1) or self.isUnknown(mac2):
+            self.unknownPacket(event)
+            return
+
+        key = (mac1, mac2) if mac1 < mac2 else (mac2, mac1)
+        flight = self.flights.get(key)
+        if flight is not None:
+            if flight.route is not None:
+                self.forwardPacket(event, flight.routeFrom(mac1))
+            elif len(flight.events) < FLIGHT_MAX_PACKETS:
+                flight.events.append(event)
+            return
+
+        flight = Flight(mac1, mac2)
+        self.flights[key] = flight
+        flight.timer = core.callDelayed(FLIGHT_TIMEOUT, self._expireFlight, key, flight)
+
+        def found(route):
+            if route is None:
+                self._endFlight(key, flight)
+                self.missed(mac1, mac2)
+                self.unknownPacket(event) # Unknown hosts, or no path between them
+                return
+            self.installPath(mac1, mac2, route, event, lambda: self._landFlight(key, flight, route))
+
+        self.findPath(mac1, mac2, found)
+
+    def _landFlight(self, key, flight, route):
+        """
+        The path of the flight is installed: its waiting packets are sent along it
+        """
+        if self.flights.get(key) is not flight:
+            return  # Expired while the switches were installing it
+        flight.route = route
+        for event in flight.events:
+            self.forwardPacket(event, flight.routeFrom(str(event.parsed.src)))
+        flight.events = []
+        flight.timer.cancel()
+        flight.timer = core.callDelayed(FLIGHT_SETTLE_TIME, self._endFlight, key, flight)
+
+    def _endFlight(self, key, flight):
+        if flight.timer is not None:
+            flight.timer.cancel()
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        # Waiting packets are flooded within the rate of their source, like the other packets without a path
+        for event in flight.events:
+            self.unknownPacket(event)
+        flight.events = []
+
+    def _expireFlight(self, key, flight):
+        if flight.route is None:
+            log.warn("No path installed between {0} and {1} after {2}s, flooding {3} waiting packets".format(
+                     flight.mac1, flight.mac2, FLIGHT_TIMEOUT, len(flight.events)))
+        flight.timer = None
+        self._endFlight(key, flight)
+
+    def isUnknown(self, mac):
+        """
+        Returns True if mac was not found during the last UNKNOWN_TTL seconds
+        """
+        expiry = self.unknown.get(mac)
+        if expiry is None:
+            return False
+        if expiry < time.time():
+            del self.unknown[mac]
+            return False
+        return True
+
+    def missed(self, mac1, mac2):
+        """
+        No path was found between mac1 and mac2: the unknown ones are not looked up again for a while
+        """
+        for mac in (mac1, mac2):
+            if mac not in self.topology.hosts:
+                self.unknown[mac] = time.time() + UNKNOWN_TTL
+
+    def allow(self, mac):
+        """
+        Token bucket of the source mac: returns True if the controller can still flood one of its packets
+        """
+        now = time.time()
+        bucket = self.buckets.get(mac)
+        if bucket is None:
+            bucket = self.buckets[mac] = [UNKNOWN_BURST, now]
+        bucket[0] = min(UNKNOWN_BURST, bucket[0] + (now - bucket[1]) * UNKNOWN_RATE)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def unknownPacket(self, event):
+        """
+        Floods a packet without a path. Once its source is over its rate, the switch floods
+        the next packets from this source to this destination itself, for a while
+        """
+        if self.allow(str(event.parsed.src)):
+            self.unknown_flooded += 1
+            self.floodPacket(event)
+            return
+        self.limitPacket(event)
+
+    def limitPacket(self, event):
+        """
+        Installs on the switch of the event a short-lived entry matching the source and the destination
+        of its packet on its input port, flooding them, so that they stop reaching the controller
+        """
+        packet = event.parsed
+        self.unknown_limited += 1
+        self.installShortFlow(event, UNKNOWN_HOLD_TIME, of.ofp_match(in_port = event.port, dl_src = packet.src, dl_dst = packet.dst),
+                              [of.ofp_action_output(port = of.OFPP_FLOOD)], LIMIT_PRIORITY)
+
+    def installShortFlow(self, event, duration, match=None, actions=(), priority=of.OFP_DEFAULT_PRIORITY):
+        """
+        Installs on the switch of the event an entry for duration seconds, or (idle, hard) timeouts,
+        matching the packet of the event by default. Without actions, the packets are dropped.
+        The packet of the event is handled by the new entry
+        """
+        if not isinstance(duration, tuple):
+            duration = (duration, duration)
+        msg = of.ofp_flow_mod()
+        msg.priority = priority
+        msg.match = match if match is not None else of.ofp_match.from_packet(event.parsed)
+        msg.idle_timeout = duration[0]
+        msg.hard_timeout = duration[1]
+        msg.actions.extend(actions)
+        msg.buffer_id = event.ofp.buffer_id
+        event.connection.send(msg)
+        if event.ofp.buffer_id is None and actions:
+            self.floodPacket(event)
+
+    def _pruneUnknown(self):
+        now = time.time()
+        for mac in [mac for mac, expiry in self.unknown.items() if expiry < now]:
+            del self.unknown[mac]
+        # Buckets refilled to their burst are the same as missing ones
+        full = (UNKNOWN_BURST - 1) / float(UNKNOWN_RATE)
+        for mac in [mac for mac, bucket in self.buckets.items() if now - bucket[1] > full]:
+            del self.buckets[mac]
+
+    def destinationPort(self, mac, dpid):
+        """
+        Returns the port the switch dpid sends the packets destined to mac to, or None if mac is unreachable
+        """
+        location = self.topology.hostLocation(mac)
+        if location is None:
+            return None
+        if dpid == location[0]:
+            return location[1]
+        return self.routing_engine.tree(location[0]).next_port.get(dpid)
+
+    def installDestination(self, mac, switches=None, missing=False, callback=None):
+        """
+        Installs on every switch, or only on the given ones, the entry sending the packets
+        destined to mac towards its switch. The entry is deleted from the switches that cannot reach it.
+        missing sends the entries even if the FlowShadow says the switches already have them.
+        callback is called once the switches installed them
+        """
+        location = self.topology.hostLocation(mac)
+        if location is None:
+            return
+        if switches is None:
+            switches = list(self.routing_engine.tree(location[0]).distances)
+        for dpid in switches:
+            port = self.destinationPort(mac, dpid)
+            if port is None:
+                msg = of.ofp_flow_mod(command = of.OFPFC_DELETE_STRICT)
+                msg.match = of.ofp_match(dl_dst = EthAddr(mac))
+                self.flow_shadow.delete(dpid, msg)
+                continue
+            msg = of.ofp_flow_mod(command = of.OFPFC_ADD)
+            msg.match = of.ofp_match(dl_dst = EthAddr(mac))
+            msg.actions.append(of.ofp_action_output(port = port))
+            self.flow_shadow.install(dpid, msg, missing)
+        self.flow_shadow.flush(callback)
+
+    def removeDestination(self, mac):
+        """
+        Deletes the entries sending the packets destined to mac from every switch
+        """
+        msg = of.ofp_flow_mod(command = of.OFPFC_DELETE)
+        msg.match = of.ofp_match(dl_dst = EthAddr(mac))
+        for connection in core.openflow.connections:
+            self.flow_shadow.delete(dpid_to_str(connection.dpid), msg)
+        self.flow_shadow.flush()
+
+    def routeToDestination(self, mac, event):
+        """
+        Sends the packet towards the host mac, reinstalling the missing entry of the switch it comes from
+        """
+        dpid = dpid_to_str(event.dpid)
+        port = self.destinationPort(mac, dpid)
+        if port is None:
+            self.unknownPacket(event) # Unknown host, or no path to it
+            return
+        self.installDestination(mac, [dpid], True, lambda: self.sendPacket(event, port))
+
+    def answerArp(self, event, packet):
+        """
+        Answers an ARP request for the IP address of a known host with a reply crafted by the controller,
+        instead of flooding it. Returns True if the request was answered
+        """
+        a = packet.payload
+        if a.prototype != pkt.arp.PROTO_TYPE_IP or a.hwtype != pkt.arp.HW_TYPE_ETHERNET:
+            return False
+        if str(a.protosrc) != "0.0.0.0":
+            core.NetworkEventHandler.learnIp(str(a.hwsrc), str(a.protosrc))
+        if a.opcode != pkt.arp.REQUEST:
+            return False
+        mac = self.topology.macOf(str(a.protodst))
+        if mac is None or mac == str(a.hwsrc):
+            return False
+
+        reply = pkt.arp()
+        reply.hwtype = a.hwtype
+        reply.prototype = a.prototype
+        reply.hwlen = a.hwlen
+        reply.protolen = a.protolen
+        reply.opcode = pkt.arp.REPLY
+        reply.hwdst = a.hwsrc
+        reply.protodst = a.protosrc
+        reply.protosrc = a.protodst
+        reply.hwsrc = EthAddr(mac)
+        frame = pkt.ethernet(type = packet.type, src = reply.hwsrc, dst = a.hwsrc)
+        frame.payload = reply
+
+        msg = of.ofp_packet_out()
+        msg.data = frame.pack()
+        msg.actions.append(of.ofp_action_output(port = of.OFPP_IN_PORT))
+        msg.in_port = event.port
+        event.connection.send(msg)
+        self.arp_replies += 1
+        return True
+
+    @instrumented
+    def _handle_LinkUp(self, event):
+        # A host is attached to its switch
+        if self.mode == "destination" and event.dpid1 in self.topology.hosts:
+            self.installDestination(event.dpid1)
+
+    @instrumented
+    def _handle_PathsRerouted(self, event):
+        for mac1, mac2 in event.pairs:
+            self.path_cache.invalidate(mac1, mac2)
+            self.path_cache.invalidate(mac2, mac1)
+            key = (mac1, mac2) if mac1 < mac2 else (mac2, mac1)
+            if key in self.flights and self.flights[key].route is not None:
+                self._endFlight(key, self.flights[key])
+
+    @instrumented
+    def _handle_RoutesChanged(self, event):
+        for mac1, mac2 in event.pairs:
+            self.path_cache.invalidate(mac1, mac2)
+            self.path_cache.invalidate(mac2, mac1)
+        if self.mode == "destination":
+            for root, switches in event.trees.items():
+                for mac in self.routing_engine.hostsAt(root):
+                    self.installDestination(mac, switches)
+
+    def _handle_HostJoin(self, event):
+        self.unknown.pop(event.mac, None)
+
+    @instrumented
+    def _handle_HostLeave(self, event):
+        self.path_cache.invalidateHost(event.mac)
+        if self.mode == "destination":
+            self.removeDestination(event.mac)
+
+    @instrumented
+    def _handle_PathsEvicted(self, event):
+        # Their Path_to relationships are deleted, and so are their entries:
+        # the next packets will compute, store and install them again
+        for mac1, mac2 in event.pairs:
+            self.path_cache.invalidate(mac1, mac2)
+            self.path_cache.invalidate(mac2, mac1)
+        flow_mods = core.Rerouter.removePaths(event.pairs)
+        if flow_mods:
+            log.debug("{} entries of evicted paths deleted".format(flow_mods))
+
+    def _handle_FlowRemoved(self, event):
+        if event.deleted:
+            return  # Deleted by GOX, which already updated its index
+        match = event.ofp.match
+        if match.dl_src is None or match.dl_dst is None:
+            return
+        src, dst = str(match.dl_src), str(match.dl_dst)
+        route = self.path_index.get(src, dst)
+        # The entry of the first switch timed out: packets from src to dst will come back to the controller,
+        # the path does not need to be rerouted anymore. Not rerouted, its cached route could go through
+        # a failed link: it is computed again by the next packets
+        if route is not None and route.switches and route.switches[0] == dpid_to_str(event.dpid):
+            self.path_index.remove(src, dst)
+            self.path_cache.invalidate(src, dst)
+            self.path_cache.invalidate(dst, src)
+
+    def _handle_ConnectionUp(self, event):
+        if self.arp_proxy and core.hasComponent("SpanningTree") and core.SpanningTree.flood_entries:
+            # Broadcast frames are flooded by the switches, ARP requests still come to the proxy
+            msg = of.ofp_flow_mod()
+            msg.priority = of.OFP_DEFAULT_PRIORITY + 1
+            msg.match = of.ofp_match(dl_type = pkt.ethernet.ARP_TYPE, dl_dst = EthAddr("ff:ff:ff:ff:ff:ff"))
+            msg.actions.append(of.ofp_action_output(port = of.OFPP_CONTROLLER))
+            self.flow_shadow.install(dpid_to_str(event.dpid), msg)
+            self.flow_shadow.flush()
+
+    def _handle_GoingDownEvent(self, event):
+        log.info("Path cache: {size} paths, {hits} hits, {misses} misses, {evictions} evictions".format(**self.path_cache.getStats()))
+        if self.arp_proxy:
+            log.info("ARP proxy: {} requests answered".format(self.arp_replies))
+        log.info("Unknown destinations: {0} packets flooded, {1} short-lived entries installed, {2} broadcast packets dropped".format(
+                 self.unknown_flooded, self.unknown_limited, self.broadcast_dropped))
 
 # <Record switches=['00-00-00-00-00-03', '00-00-00-00-00-01', '00-00-00-00-00-02'] in_ports=['1', '2', '6'] out_ports=['6', '1', '2'] r_switches=['00-00-00-00-00-02', '00-00-00-00-00-01', '00-00-00-00-00-03'] r_out_ports=['2', '1', '6'] r_in_ports=['6', '2', '1']>
 
 
+    @instrumented(hot=True)
     def _handle_PacketIn(self, event):
         """
         Handle packets coming from the switch so as to route them with the shortestpath
@@ -158,10 +669,7 @@ class GoxForwarding(object):
         
         def flood (message = None):
             """ Floods the packet """
-            msg = of.ofp_packet_out()
-            msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
-            msg.data = event.ofp
-            event.connection.send(msg)
+            self.floodPacket(event)
             
         def drop (duration = None):
             """
@@ -169,14 +677,7 @@ class GoxForwarding(object):
             dropping similar ones for a while
             """
             if duration is not None:
-                if not isinstance(duration, tuple):
-                    duration = (duration,duration)
-                msg = of.ofp_flow_mod()
-                msg.match = of.ofp_match.from_packet(packet)
-                msg.idle_timeout = duration[0]
-                msg.hard_timeout = duration[1]
-                msg.buffer_id = event.ofp.buffer_id
-                self.connection.send(msg)
+                self.installShortFlow(event, duration)
             elif event.ofp.buffer_id is not None:
                 msg = of.ofp_packet_out()
                 msg.buffer_id = event.ofp.buffer_id
@@ -191,28 +692,40 @@ class GoxForwarding(object):
 
         mac1=str(packet.src)
         mac2=str(packet.dst)
+
+        if self.arp_proxy and packet.type == packet.ARP_TYPE and self.answerArp(event, packet):
+            return
         
         if packet.dst.is_multicast :
+            # Broadcast storm, or ARP scan of addresses the proxy does not know: the packets over the rate
+            # are dropped by the controller, not by a switch entry which would also black-hole the
+            # next ARP requests and DHCP of the host
+            if not self.allow(mac1):
+                self.broadcast_dropped += 1
+                drop()
+                return
             flood() 
-        elif core.DatabaseInstance.hostExists(mac1) and core.DatabaseInstance.hostExists(mac2) :
-            if self.pathExists(mac1, mac2):
-                self.installExistingPath(mac1, mac2, event)
-            else:
-                self.installNewPath(mac1, mac2, event)
-            
+            return
+
+        if self.mode == "destination":
+            self.routeToDestination(mac2, event)
         else:
-            flood() # If we cannot find the destination, we just flood the packet
+            self.routePacket(mac1, mac2, event)
         
         
 
 
-def launch():
+def launch(routing="local", path_cache_size=4096, mode="pair", arp_proxy=True,
+           idle_timeout=FLOW_IDLE_TIMEOUT, hard_timeout=FLOW_HARD_TIMEOUT, multipath="none", multipath_k=4):
     # subscribe to PacketIn event
     if not core.hasComponent("Gox"):
         log.error("Impossible to launch gox_l2_forwarding without launching Gox before")
         return
 
-    core.registerNew(GoxForwarding)
+    # Arguments given on the command line are strings
+    core.registerNew(Rerouter, core.NetworkEventHandler.topology, core.RoutingEngine, int(idle_timeout), int(hard_timeout))
+    core.registerNew(GoxForwarding, routing, int(path_cache_size), mode, str_to_bool(arp_proxy),
+                     int(idle_timeout), int(hard_timeout), multipath, int(multipath_k))
 
 
 
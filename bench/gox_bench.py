@@ -0,0 +1,614 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark harness for GOX
+
+Drives `NetworkEventHandler` and `GoxForwarding` with synthetic ConnectionUp, LinkEvent, HostEvent and
+PacketIn streams for linear, tree, fat-tree and random topologies, without network nor database:
+
+* `FakeDriver` stands in for the neo4j driver. It counts the queries of every statement and can add a latency to them,
+* `StubConnection` stands in for the OpenFlow connection of a switch. It records the messages sent to it
+  and answers barriers.
+
+Every scenario runs in its own process, with POX's core but without its OpenFlow server, and reports:
+topology and PacketIn events/sec, PacketIn-to-flow-mod latency percentiles, queries per event and flow-mods per flow.
+
+Usage, from the root of the repository, with POX in the PYTHONPATH (or given with --pox):
+
+    python bench/gox_bench.py                           # Runs the default suite
+    python bench/gox_bench.py --topology fattree --size 8 --flows 5000 --db-latency 0.002
+    python bench/gox_bench.py --save-baseline           # Stores the results of the suite in bench/baseline.json
+
+A baseline is only meaningful on the machine, Python and POX it was measured with: it records them with the results.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import struct
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+
+SUITE = [
+    {"topology": "linear", "size": 16},
+    {"topology": "tree", "size": 4},
+    {"topology": "fattree", "size": 4},
+    {"topology": "random", "size": 64},
+    {"topology": "fattree", "size": 4, "mode": "destination"},
+    {"topology": "fattree", "size": 4, "routing": "cypher", "db_latency": 0.001},
+    {"topology": "fattree", "size": 4, "write_behind": False, "db_latency": 0.001},
+]
+
+DEFAULTS = {"topology": "fattree", "size": 4, "fanout": 2, "hosts": 2, "flows": 1000, "seed": 1,
+            "routing": "local", "mode": "pair", "write_behind": True, "db_latency": 0.0, "switch_latency": 0.0,
+            "db_workers": 4, "link_window": 0.1}
+
+
+# Synthetic topologies: lists of switches (int dpids), links (dpid1, port1, dpid2, port2)
+# and hosts (mac, dpid, port)
+
+class Topology(object):
+
+    def __init__(self):
+        self.switches = []
+        self.links = []
+        self.hosts = []
+        self.ports = {}         # dpid -> last used port
+
+    def addSwitch(self):
+        dpid = len(self.switches) + 1
+        self.switches.append(dpid)
+        self.ports[dpid] = 0
+        return dpid
+
+    def _port(self, dpid):
+        self.ports[dpid] += 1
+        return self.ports[dpid]
+
+    def connect(self, dpid1, dpid2):
+        self.links.append((dpid1, self._port(dpid1), dpid2, self._port(dpid2)))
+
+    def attachHosts(self, dpid, count):
+        for _ in range(count):
+            index = len(self.hosts) + 1
+            mac = "02:00:00:{0:02x}:{1:02x}:{2:02x}".format(index >> 16 & 0xff, index >> 8 & 0xff, index & 0xff)
+            self.hosts.append((mac, dpid, self._port(dpid)))
+
+
+def linear(size, hosts, **kw):
+    topology = Topology()
+    for _ in range(size):
+        dpid = topology.addSwitch()
+        if dpid > 1:
+            topology.connect(dpid - 1, dpid)
+        topology.attachHosts(dpid, hosts)
+    return topology
+
+def tree(size, hosts, fanout=2, **kw):
+    """ size is the depth of the tree, hosts are attached to its leaves """
+    topology = Topology()
+    level = [topology.addSwitch()]
+    for _ in range(size - 1):
+        children = []
+        for parent in level:
+            for _ in range(fanout):
+                child = topology.addSwitch()
+                topology.connect(parent, child)
+                children.append(child)
+        level = children
+    for leaf in level:
+        topology.attachHosts(leaf, hosts)
+    return topology
+
+def fattree(size, **kw):
+    """ size is the k of the fat-tree: k pods, (k/2)^2 core switches and k/2 hosts per edge switch """
+    k = size
+    topology = Topology()
+    cores = [topology.addSwitch() for _ in range((k // 2) ** 2)]
+    for pod in range(k):
+        aggregations = [topology.addSwitch() for _ in range(k // 2)]
+        edges = [topology.addSwitch() for _ in range(k // 2)]
+        for i, aggregation in enumerate(aggregations):
+            for core in cores[i * (k // 2):(i + 1) * (k // 2)]:
+                topology.connect(core, aggregation)
+            for edge in edges:
+                topology.connect(aggregation, edge)
+        for edge in edges:
+            topology.attachHosts(edge, k // 2)
+    return topology
+
+def randomTopology(size, hosts, seed=1, degree=3, **kw):
+    """ Connected random graph of size switches with an average degree of degree """
+    rand = random.Random(seed)
+    topology = Topology()
+    connected = set()
+    for _ in range(size):
+        dpid = topology.addSwitch()
+        if dpid > 1:
+            peer = rand.randrange(1, dpid)
+            topology.connect(peer, dpid)
+            connected.add((peer, dpid))
+        topology.attachHosts(dpid, hosts)
+    for _ in range(size * degree // 2 - (size - 1)):
+        dpid1, dpid2 = sorted(rand.sample(topology.switches, 2))
+        if (dpid1, dpid2) not in connected:
+            topology.connect(dpid1, dpid2)
+            connected.add((dpid1, dpid2))
+    return topology
+
+TOPOLOGIES = {"linear": linear, "tree": tree, "fattree": fattree, "random": randomTopology}
+
+
+# Stand-ins for the neo4j driver, the DatabaseInstance and the OpenFlow connections
+
+class FakeResult(list):
+
+    def single(self):
+        return self[0] if self else None
+
+    def peek(self):
+        return self[0] if self else None
+
+    def data(self):
+        return [dict(record) for record in self]
+
+
+class FakeSession(object):
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, text, params=None):
+        return self.driver.query(text, params or {})
+
+    def write_transaction(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    read_transaction = write_transaction
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeDriver(object):
+    """
+    Counts the queries run by GOX, per statement of gox_queries, and waits latency seconds for each one.
+    responders map statement names to functions computing the records of their result from their parameters
+    """
+
+    def __init__(self, latency=0.0, responders=None):
+        self.latency = latency
+        self.responders = responders or {}
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.names = None       # Cypher text -> statement name
+
+    def session(self):
+        return FakeSession(self)
+
+    def query(self, text, params):
+        if self.names is None:
+            import gox_queries
+            self.names = dict((statement, name) for name, statement in gox_queries.STATEMENTS.items())
+        name = self.names.get(text, "unregistered")
+        self.count(name)
+        responder = self.responders.get(name)
+        return FakeResult(responder(params) if responder is not None else [])
+
+    def count(self, name):
+        """
+        Counts a query of the statement name, and waits for its latency
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def close(self):
+        pass
+
+
+class FakeDatabaseInstance(object):
+    """
+    Same methods as gox_db's DatabaseInstance, each one running a query on the fake driver
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.session = driver.session()
+
+    def _query(self, *args):
+        self.driver.count("gox_db")
+        return False
+
+    entityExists = hostExists = switchExists = linkExists = _query
+    addSwitch = delSwitch = addHost = delHost = addLink = delLink = _query
+
+
+class StubConnection(object):
+    """
+    Records the OpenFlow messages sent to a switch, and answers its barriers after latency seconds
+    """
+
+    OFPT_PACKET_OUT = 13
+    OFPT_FLOW_MOD = 14
+    OFPT_BARRIER_REQUEST = 18
+
+    def __init__(self, dpid, bench, latency=0.0):
+        from pox.lib.addresses import EthAddr
+        self.dpid = dpid
+        self.eth_addr = EthAddr("00:00:00:00:00:{0:02x}".format(dpid & 0xff))
+        self.bench = bench
+        self.latency = latency
+        self.counts = {}
+
+    def send(self, data):
+        if not isinstance(data, bytes):
+            data = data.pack()
+        offset = 0
+        while offset < len(data):
+            _, kind, length, xid = struct.unpack_from("!BBHI", data, offset)
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if kind == self.OFPT_FLOW_MOD:
+                # ofp_match: wildcards, in_port, dl_src, dl_dst
+                dl_src, dl_dst = struct.unpack_from("!6s6s", data, offset + 8 + 6)
+                self.bench.flowMod(self.dpid, dl_src, dl_dst)
+            elif kind == self.OFPT_BARRIER_REQUEST:
+                self.bench.barrier(self, xid)
+            offset += length
+
+
+class BarrierIn(object):
+
+    def __init__(self, connection, xid):
+        self.connection = connection
+        self.dpid = connection.dpid
+        self.xid = xid
+
+
+class Link(object):
+
+    def __init__(self, dpid1, port1, dpid2, port2):
+        self.dpid1 = dpid1
+        self.port1 = port1
+        self.dpid2 = dpid2
+        self.port2 = port2
+
+
+class LinkEvent(object):
+
+    def __init__(self, link, added):
+        self.link = link
+        self.added = added
+        self.removed = not added
+
+    def port_for_dpid(self, dpid):
+        return self.link.port1 if dpid == self.link.dpid1 else self.link.port2
+
+
+class HostEntry(object):
+
+    def __init__(self, mac, dpid, port):
+        from pox.lib.addresses import EthAddr
+        self.macaddr = EthAddr(mac)
+        self.dpid = dpid
+        self.port = port
+        self.ipAddrs = {}
+
+
+class HostEvent(object):
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.join = True
+        self.leave = False
+        self.move = False
+
+
+class ConnectionEvent(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dpid = connection.dpid
+
+
+# Benchmark run, in its own process
+
+class Bench(object):
+
+    def __init__(self, options):
+        self.options = options
+        self.latencies = []
+        self.pending = {}           # (dpid, dl_dst) -> [(dl_src, PacketIn time)]
+        self.flow_mods = 0
+        self.barriers = 0           # Barriers not answered yet
+        self.lock = threading.Lock()
+
+    def setUp(self):
+        """
+        Registers GOX's components on POX's core, with the fake driver and stub connections
+        """
+        import pox.core
+        if pox.core.core is None:
+            pox.core.initialize()
+        from pox.core import core
+        import pox.openflow
+        pox.openflow.launch()
+        self.core = core
+
+        import gox_queries
+        from gox_network import NetworkEventHandler
+        from gox_writer import TopologyWriter
+        from gox_executor import DatabaseExecutor
+        from gox_routing import RoutingEngine
+        from gox_flows import FlowShadow
+        from gox_reroute import Rerouter
+        from gox_l2_forwarding import GoxForwarding
+
+        options = self.options
+        self.driver = FakeDriver(options["db_latency"], {"forwarding.lookupPath": self._lookupPath})
+        db_instance = FakeDatabaseInstance(self.driver)
+        queries = core.registerNew(gox_queries.QueryRegistry, db_instance.session)
+        executor = core.registerNew(DatabaseExecutor, self.driver, queries, options["db_workers"])
+        writer = None
+        if options["write_behind"]:
+            writer = core.registerNew(TopologyWriter, self.driver, queries)
+        self.handler = core.registerNew(NetworkEventHandler, db_instance, False, writer, executor, options["link_window"])
+        core.registerNew(RoutingEngine, self.handler.topology)
+        core.registerNew(FlowShadow, 0)
+        core.registerNew(Rerouter, self.handler.topology, core.RoutingEngine)
+        self.forwarding = core.registerNew(GoxForwarding, options["routing"], 4096, options["mode"])
+        core.goUp()
+
+    def _lookupPath(self, params):
+        # neo4j's answer to forwarding.lookupPath, computed by the RoutingEngine
+        route = self.core.RoutingEngine.shortestPath(params["mac1"], params["mac2"])
+        if route is None:
+            return []
+        return [{"switches": route.switches, "in_ports": route.in_ports, "out_ports": route.out_ports}]
+
+    def flowMod(self, dpid, dl_src, dl_dst):
+        now = time.time()
+        with self.lock:
+            self.flow_mods += 1
+            waiting = self.pending.get((dpid, dl_dst))
+            if not waiting:
+                return
+            wildcard = dl_src == b"\0" * 6
+            for entry in list(waiting):
+                if wildcard or entry[0] == dl_src:
+                    waiting.remove(entry)
+                    self.latencies.append(now - entry[1])
+            if not waiting:
+                del self.pending[(dpid, dl_dst)]
+
+    def barrier(self, connection, xid):
+        with self.lock:
+            self.barriers += 1
+        def answer():
+            with self.lock:
+                self.barriers -= 1
+            self.core.FlowShadow._handle_openflow_BarrierIn(BarrierIn(connection, xid))
+        if connection.latency:
+            self.core.callDelayed(connection.latency, answer)
+        else:
+            self.core.callLater(answer)
+
+    def idle(self):
+        """
+        Returns True once every queued query, write, flow-mod and barrier has been handled
+        """
+        core = self.core
+        executor = core.DatabaseExecutor
+        stats = executor.getStats()
+        if stats["depth"] or stats["completed"] + stats["failed"] < stats["submitted"]:
+            return False
+        if core.hasComponent("TopologyWriter") and core.TopologyWriter.pending:
+            return False
+        if self.handler.link_events.pending:
+            return False
+        shadow = core.FlowShadow
+        with self.lock:
+            barriers = self.barriers
+        return not barriers and not shadow.waiting and not shadow.queued
+
+    def replay(self, events):
+        """
+        Dispatches the (handler, event) pairs on POX's thread, and returns the time taken to handle them
+        """
+        done = threading.Event()
+        start = time.time()
+        for handler, event in events:
+            self.core.callLater(handler, event)
+        self.core.callLater(done.set)
+        done.wait()
+        while not self.idle():
+            time.sleep(0.0005)
+        return time.time() - start
+
+    def packetIn(self, connection, mac1, mac2, port):
+        from pox.openflow import PacketIn
+        import pox.openflow.libopenflow_01 as of
+        import pox.lib.packet as pkt
+        from pox.lib.addresses import EthAddr
+        packet = pkt.ethernet(src=EthAddr(mac1), dst=EthAddr(mac2), type=0x88b5)
+        packet.payload = b"gox-bench"
+        ofp = of.ofp_packet_in(data=packet.pack(), in_port=port, reason=of.OFPR_NO_MATCH)
+        event = PacketIn(connection, ofp)
+        key = (connection.dpid, EthAddr(mac2).toRaw())
+        src = EthAddr(mac1).toRaw()
+
+        def dispatch(event):
+            with self.lock:
+                self.pending.setdefault(key, []).append((src, time.time()))
+            self.forwarding._handle_PacketIn(event)
+        return dispatch, event
+
+    def run(self):
+        options = self.options
+        topology = TOPOLOGIES[options["topology"]](**options)
+        rand = random.Random(options["seed"])
+
+        self.setUp()
+        connections = dict((dpid, StubConnection(dpid, self, options["switch_latency"])) for dpid in topology.switches)
+        for dpid, connection in connections.items():
+            self.core.openflow._connections[dpid] = connection
+
+        # Discovery raises a LinkEvent for both directions of a link
+        events = [(self.handler._handle_openflow_ConnectionUp, ConnectionEvent(connections[dpid])) for dpid in topology.switches]
+        for dpid1, port1, dpid2, port2 in topology.links:
+            events.append((self.handler._handle_openflow_discovery_LinkEvent, LinkEvent(Link(dpid1, port1, dpid2, port2), True)))
+            events.append((self.handler._handle_openflow_discovery_LinkEvent, LinkEvent(Link(dpid2, port2, dpid1, port1), True)))
+        events += [(self.handler._handle_host_tracker_HostEvent, HostEvent(HostEntry(*host))) for host in topology.hosts]
+        topology_time = self.replay(events)
+        topology_queries = self.driver.total()
+        topology_flow_mods = self.flow_mods
+
+        packet_ins = []
+        for _ in range(options["flows"]):
+            (mac1, dpid, port), (mac2, _, _) = rand.sample(topology.hosts, 2)
+            packet_ins.append(self.packetIn(connections[dpid], mac1, mac2, port))
+        traffic_time = self.replay(packet_ins)
+
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        from pox.core import core
+        return {"scenario": dict(options),
+                "pox": getattr(core, "version_string", "unknown"),
+                "switches": len(topology.switches), "links": len(topology.links), "hosts": len(topology.hosts),
+                "topology_events": len(events),
+                "topology_events_per_sec": len(events) / topology_time,
+                "packet_in_per_sec": len(packet_ins) / traffic_time,
+                "latency_samples": len(latencies),
+                "latency_p50_ms": percentile(0.5),
+                "latency_p90_ms": percentile(0.9),
+                "latency_p99_ms": percentile(0.99),
+                "queries_per_topology_event": float(topology_queries) / len(events),
+                "queries_per_packet_in": float(self.driver.total() - topology_queries) / len(packet_ins),
+                "flow_mods_per_flow": float(self.flow_mods - topology_flow_mods) / len(packet_ins),
+                "queries": dict(self.driver.counts)}
+
+
+# Suite, reporting and baseline
+
+def scenarioName(scenario):
+    return " ".join("{0}={1}".format(key, scenario[key]) for key in sorted(scenario) if DEFAULTS.get(key) != scenario[key]
+                    or key in ("topology", "size"))
+
+def runScenario(scenario, pox=None):
+    """
+    Runs a scenario in a new process, and returns its results
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--run", json.dumps(scenario)]
+    if pox:
+        command += ["--pox", pox]
+    output = subprocess.check_output(command)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+def report(results):
+    print("{0:<55} {1:>10} {2:>10} {3:>8} {4:>8} {5:>9} {6:>9} {7:>9}".format(
+          "scenario", "topo ev/s", "pktin/s", "p50 ms", "p99 ms", "q/topo", "q/pktin", "fm/flow"))
+    for result in results:
+        print("{0:<55} {1:>10.0f} {2:>10.0f} {3:>8} {4:>8} {5:>9.2f} {6:>9.2f} {7:>9.2f}".format(
+              scenarioName(result["scenario"]), result["topology_events_per_sec"], result["packet_in_per_sec"],
+              "-" if result["latency_p50_ms"] is None else "{:.2f}".format(result["latency_p50_ms"]),
+              "-" if result["latency_p99_ms"] is None else "{:.2f}".format(result["latency_p99_ms"]),
+              result["queries_per_topology_event"], result["queries_per_packet_in"], result["flow_mods_per_flow"]))
+
+def environment(results):
+    """
+    Returns the description of the machine, Python and POX the results were measured with
+    """
+    return {"machine": platform.node(), "platform": platform.platform(), "python": platform.python_version(),
+            "pox": results[0].get("pox", "unknown") if results else "unknown"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GOX benchmark harness")
+    parser.add_argument("--pox", help="directory of POX, if it is not in the PYTHONPATH")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES))
+    parser.add_argument("--size", type=int, help="switches (linear, random), depth (tree) or k (fattree)")
+    parser.add_argument("--fanout", type=int)
+    parser.add_argument("--hosts", type=int, help="hosts per edge switch")
+    parser.add_argument("--flows", type=int, help="PacketIns of new host pairs")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--routing", choices=["local", "cypher"])
+    parser.add_argument("--mode", choices=["pair", "destination"])
+    parser.add_argument("--no-write-behind", dest="write_behind", action="store_false", default=None)
+    parser.add_argument("--db-latency", dest="db_latency", type=float, help="seconds added to every query")
+    parser.add_argument("--switch-latency", dest="switch_latency", type=float, help="seconds before a barrier is answered")
+    parser.add_argument("--db-workers", dest="db_workers", type=int)
+    parser.add_argument("--link-window", dest="link_window", type=float, help="seconds during which LinkEvents are coalesced")
+    parser.add_argument("--save-baseline", action="store_true", help="stores the results in " + BASELINE)
+    parser.add_argument("--json", action="store_true", help="prints the results as JSON")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.pox:
+        sys.path.insert(0, args.pox)
+    sys.path[:0] = [os.path.join(ROOT, "gox"), os.path.join(ROOT, "app")]
+
+    if args.run:
+        import logging
+        logging.getLogger().setLevel(logging.ERROR)
+        options = dict(DEFAULTS)
+        options.update(json.loads(args.run))
+        print(json.dumps(Bench(options).run()))
+        sys.stdout.flush()
+        os._exit(0)     # Does not wait for POX's threads
+
+    overrides = dict((key, value) for key, value in vars(args).items() if key in DEFAULTS and value is not None)
+    scenarios = [overrides] if overrides else SUITE
+    results = []
+    for scenario in scenarios:
+        options = dict(DEFAULTS)
+        options.update(scenario)
+        results.append(runScenario(options, args.pox))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+    if args.save_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump({"environment": environment(results), "results": results}, f, indent=2, sort_keys=True)
+        print("Baseline stored in {}".format(BASELINE))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,8 +21,21 @@ import pox.lib.util as poxutil                # Various util functions
 
 from gox_db import DatabaseInstance
 from gox_network import NetworkEventHandler
+from gox_writer import TopologyWriter
+from gox_executor import DatabaseExecutor
+from gox_routing import RoutingEngine
+from gox_flows import FlowShadow
+from gox_warmstart import WarmDatabaseInstance, WarmStart
+from gox_snapshot import Snapshot, SnapshotError, TopologySnapshot
+from gox_metrics import Instrumentation
+from gox_spanning import SpanningTree
+from gox_sweeper import PathSweeper
+from gox_stats import PortStatsCollector
+from gox_trigger import TriggerRegistry
+from gox_loader import TopologyLoader
 from pox.host_tracker.host_tracker import host_tracker
 from pox.openflow.discovery import Discovery
+import os
 
 # Create a logger for this component
 log = core.getLogger()
@@ -32,14 +45,63 @@ class Gox(object):
 
 
 @poxutil.eval_args
-def launch (uri, username="neo4j", password="password"):
+def launch (uri, username="neo4j", password="password", consistency_check=False,
+            write_behind=True, write_batch=1000, write_delay=0.05, flow_reconcile=30,
+            db_workers=4, db_queue=1024, warm_start=False, warm_grace=30,
+            snapshot=None, snapshot_interval=60, metrics_interval=0, metrics_file=None,
+            profile_every=0, profile_file=None, link_window=0.1, link_hold_down=30,
+            spanning_tree=True, flood_hold_down=10, flood_entries=True,
+            path_ttl=3600, path_max=100000, path_sweep=60,
+            port_stats=0, link_capacity=1000, congestion_weight=0,
+            triggers=False, trigger_settle=30, provision=None, provision_batch=10000):
     """
     GOX launcher
     """
 
     core.registerNew(Gox)
-    core.registerNew(DatabaseInstance, uri, username, password)
-    core.registerNew(NetworkEventHandler, core.DatabaseInstance)
+    core.registerNew(Instrumentation, metrics_interval, metrics_file, profile_every, profile_file)
+    if warm_start:
+        core.register("DatabaseInstance", WarmDatabaseInstance(uri, username, password))
+    else:
+        core.registerNew(DatabaseInstance, uri, username, password)
+    # The statements of the DatabaseInstance and of the other components are counted by the same registry
+    core.register("QueryRegistry", core.DatabaseInstance.queries)
+    core.registerNew(DatabaseExecutor, core.DatabaseInstance.driver, core.QueryRegistry, db_workers, db_queue)
+    if triggers:
+        # Paused while discovery finds the topology
+        core.registerNew(TriggerRegistry, core.QueryRegistry, core.DatabaseExecutor, trigger_settle)
+    writer = None
+    if write_behind:
+        writer = core.registerNew(TopologyWriter, core.DatabaseInstance.driver, core.QueryRegistry,
+                                  write_batch, write_delay)
+    core.registerNew(NetworkEventHandler, core.DatabaseInstance, consistency_check, writer, core.DatabaseExecutor,
+                     link_window, link_hold_down)
+    core.registerNew(RoutingEngine, core.NetworkEventHandler.topology)
+    if provision:
+        core.registerNew(TopologyLoader, provision, core.DatabaseInstance.driver, core.QueryRegistry,
+                         core.NetworkEventHandler, core.RoutingEngine, provision_batch)
+    core.registerNew(PathSweeper, core.DatabaseExecutor, path_ttl, path_max, path_sweep, write_batch)
+    if port_stats:
+        core.registerNew(PortStatsCollector, core.NetworkEventHandler.topology, core.RoutingEngine, core.DatabaseExecutor,
+                         port_stats, link_capacity, congestion_weight)
+    record = None
+    if snapshot and os.path.exists(snapshot):
+        try:
+            with Snapshot(snapshot) as preload:
+                record = preload.record()
+        except SnapshotError as e:
+            log.warn("{}, starting without it".format(e))
+    if record is not None:
+        # Without warm start, the database was reset and the snapshot is stored in it again
+        core.registerNew(WarmStart, core.NetworkEventHandler, core.QueryRegistry, core.DatabaseExecutor, warm_grace,
+                         record, not warm_start)
+    elif warm_start:
+        core.registerNew(WarmStart, core.NetworkEventHandler, core.QueryRegistry, core.DatabaseExecutor, warm_grace)
+    if snapshot:
+        core.registerNew(TopologySnapshot, snapshot, core.NetworkEventHandler.topology, snapshot_interval)
+    core.registerNew(FlowShadow, flow_reconcile)
+    if spanning_tree:
+        core.registerNew(SpanningTree, core.NetworkEventHandler.topology, flood_hold_down, flood_entries)
     core.registerNew(Discovery)
     core.registerNew(host_tracker, eat_packets=False) # TODO We can change the default ping source MAC. Should we pu the controller's ?
     
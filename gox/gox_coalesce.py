@@ -0,0 +1,142 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Coalescing and dampening of the link events of openflow.discovery
+
+Discovery raises a LinkEvent for each direction of a link, and a flapping link raises bursts of
+added/removed events. The `LinkEventCoalescer` class collects the events of every link during a short window,
+then only applies its net change: both directions are folded into a single event, and an addition
+followed by a removal cancels out.
+
+Links that keep flapping are dampened: every removal adds 1 to the penalty of the link, which halves every
+hold_down seconds. While the penalty of a link is above FLAP_SUPPRESS, it is held down: its additions are only
+applied once the penalty decays below FLAP_REUSE, so that it cannot trigger path recomputations
+on every flap. Removals are always applied.
+"""
+
+from pox.core import core
+
+import math
+import time
+
+log = core.getLogger()
+
+FLAP_SUPPRESS = 2.5     # Penalty above which a link is held down: 3 flaps in a short time
+FLAP_REUSE = 1.0        # Penalty below which a held down link can be added again
+
+def linkKey(dpid1, port1, dpid2, port2):
+    """
+    Returns the key of a link, the same for both of its directions
+    """
+    return min((dpid1, int(port1), dpid2, int(port2)), (dpid2, int(port2), dpid1, int(port1)))
+
+
+class LinkEventCoalescer(object):
+
+    def __init__(self, current, apply, window=0.1, hold_down=30):
+        """
+        current(dpid1, port1, dpid2, port2) tells if a link is applied,
+        apply(dpid1, port1, dpid2, port2, added) applies its net change
+        """
+        self.current = current
+        self.apply = apply
+        self.window = window
+        self.hold_down = hold_down
+        self.pending = {}           # link key -> (state before the window, last reported state)
+        self.timer = None
+        self.penalties = {}         # link key -> (penalty, time it was computed)
+        self.held = {}              # link key -> reuse timer of the held down links
+        self.received = 0
+        self.applied = 0
+        self.suppressed = 0
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+
+    def push(self, dpid1, port1, dpid2, port2, added):
+        """
+        Reports a LinkEvent, applied at the end of the current window
+        """
+        self.received += 1
+        key = linkKey(dpid1, port1, dpid2, port2)
+        if key in self.pending:
+            self.pending[key] = (self.pending[key][0], added)
+        else:
+            self.pending[key] = (self.current(*key), added)
+        if not self.window:
+            self.flush()
+        elif self.timer is None:
+            self.timer = core.callDelayed(self.window, self.flush)
+
+    def flush(self):
+        """
+        Applies the net change of every link reported during the window
+        """
+        self.timer = None
+        pending, self.pending = self.pending, {}
+        for key, (before, added) in pending.items():
+            if key in self.held:
+                if not added:
+                    self.held.pop(key).cancel()   # Not added back, nothing to reuse
+                continue
+            if added == before:
+                continue    # Duplicate direction, or changes cancelling out
+            if added and self._penalty(key) >= FLAP_SUPPRESS:
+                self._holdDown(key)
+                continue
+            if not added:
+                self._penalize(key)
+            self.applied += 1
+            self.apply(key[0], key[1], key[2], key[3], added)
+
+    def _penalty(self, key, now=None):
+        if not self.hold_down or key not in self.penalties:
+            return 0.0
+        penalty, since = self.penalties[key]
+        now = now or time.time()
+        penalty *= 0.5 ** ((now - since) / float(self.hold_down))
+        if penalty < 0.01 and key not in self.held:
+            del self.penalties[key]     # Forgotten flaps
+            return 0.0
+        return penalty
+
+    def _penalize(self, key):
+        if not self.hold_down:
+            return
+        now = time.time()
+        self.penalties[key] = (self._penalty(key, now) + 1, now)
+
+    def _holdDown(self, key):
+        penalty = self._penalty(key)
+        delay = self.hold_down * math.log(penalty / FLAP_REUSE, 2)
+        self.suppressed += 1
+        log.warn("Link {0}.{1} <-> {2}.{3} is flapping, held down for {4:.1f}s".format(key[0], key[1], key[2], key[3], delay))
+        self.held[key] = core.callDelayed(delay, self._reuse, key)
+
+    def _reuse(self, key):
+        """
+        The penalty of a held down link has decayed: it is added, unless it was removed meanwhile
+        """
+        if self.held.pop(key, None) is None:
+            return
+        self.penalties.pop(key, None)
+        if not self.current(*key):
+            self.applied += 1
+            self.apply(key[0], key[1], key[2], key[3], True)
+
+    def _handle_GoingDownEvent(self, event):
+        log.info("Link events: {0} received, {1} applied, {2} links held down".format(self.received, self.applied, self.suppressed))
+
+
+def launch():
+    print("gox_coalesce is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
@@ -0,0 +1,159 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Worker pool running the neo4j queries of GOX outside of POX's event loop
+
+POX runs its components in a single cooperative thread: a query waiting for neo4j there also delays
+LLDP processing, echo replies and the PacketIns of every other switch.
+The `DatabaseExecutor` class runs the queries in a bounded pool of worker threads instead. Every worker
+opens its own session, drawn from the connection pool of the neo4j driver.
+
+Work is submitted as a function taking the session of the worker. Its result is given back to
+the callback on POX's thread with `core.callLater`, so that callbacks can safely use POX and GOX components.
+
+Work submitted with the same key is run by the same worker, in submission order: mutations of the topology,
+for instance, are never reordered. Work without key goes to the least loaded worker.
+"""
+
+from pox.core import core
+
+import queue
+import threading
+import time
+
+log = core.getLogger()
+
+# Calls to the DatabaseInstance share its session: they are all run in order by the same worker
+DB_KEY = "DatabaseInstance"
+
+class DatabaseExecutor(object):
+
+    def __init__(self, driver, queries, workers=4, max_queue=1024):
+        self.driver = driver
+        self.queries = queries
+        self.queues = [queue.Queue(max_queue) for _ in range(workers)]   # Bounded, submit() waits when full
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0      # Seconds spent in the queues
+        self.max_wait = 0.0
+        self.total_run = 0.0       # Seconds spent running
+        self.max_run = 0.0
+
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, args=(self.queues[i],), name="GoxDatabaseWorker{}".format(i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("DatabaseExecutor launched with {} workers".format(workers))
+
+    def submit(self, work, callback=None, key=None, errback=None):
+        """
+        Runs work(session) in a worker. callback(result), or errback(exception) if it raised,
+        is then called on POX's thread. Work submitted with the same key is run in order
+        """
+        if key is not None:
+            worker = self.queues[hash(key) % len(self.queues)]
+        else:
+            worker = min(self.queues, key=lambda q: q.qsize())
+        with self.lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.depth() + 1)
+        worker.put((work, callback, errback, time.time()))
+
+    def run(self, name, params=None, callback=None, key=None, errback=None):
+        """
+        Runs the statement registered under name in gox_queries. callback is given the list of its records
+        """
+        self.submit(lambda session: list(self.queries.run(name, params, session)), callback, key, errback)
+
+    def depth(self):
+        """
+        Returns the number of queued works, not yet taken by a worker
+        """
+        return sum(q.qsize() for q in self.queues)
+
+    def getStats(self):
+        with self.lock:
+            started = self.completed + self.failed
+            return {"workers": len(self.threads),
+                    "submitted": self.submitted,
+                    "completed": self.completed,
+                    "failed": self.failed,
+                    "depth": self.depth(),
+                    "max_depth": self.max_depth,
+                    "avg_wait": self.total_wait / started if started else 0.0,
+                    "max_wait": self.max_wait,
+                    "avg_run": self.total_run / started if started else 0.0,
+                    "max_run": self.max_run}
+
+    def _run(self, works):
+        session = self.driver.session()
+        try:
+            while True:
+                item = works.get()
+                if item is None:
+                    return
+                work, callback, errback, submitted = item
+                start = time.time()
+                try:
+                    result = work(session)
+                    error = None
+                except Exception as e:
+                    log.exception("Database work failed")
+                    error = e
+                end = time.time()
+
+                with self.lock:
+                    if error is None:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.total_wait += start - submitted
+                    self.max_wait = max(self.max_wait, start - submitted)
+                    self.total_run += end - start
+                    self.max_run = max(self.max_run, end - start)
+
+                if error is None and callback is not None:
+                    core.callLater(callback, result)
+                elif error is not None and errback is not None:
+                    core.callLater(errback, error)
+        finally:
+            session.close()
+
+    def stop(self):
+        """
+        Runs the queued works and stops the workers
+        """
+        for works in self.queues:
+            works.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _handle_GoingDownEvent(self, event):
+        self.stop()
+        log.info("DatabaseExecutor stopped: {submitted} works, {failed} failed, max queue depth {max_depth}, "
+                 "wait {avg_wait:.4f}s avg / {max_wait:.4f}s max, run {avg_run:.4f}s avg / {max_run:.4f}s max".format(**self.getStats()))
+
+
+def launch():
+    print("gox_executor is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
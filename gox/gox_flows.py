@@ -0,0 +1,189 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Controller-side shadow of the flow entries installed by GOX applications
+
+The `FlowShadow` class keeps, for every switch, the output ports of the entries matching MAC addresses
+(dl_src and/or dl_dst) that were sent to it. Flow-mods are given to `install` and `delete`, which skip
+the ones that would not change the flow table of the switch, and queue the other ones.
+`flush` then sends the queued flow-mods of every switch in a single write, followed by a barrier,
+and calls back once every switch has answered its barrier, i.e. once the entries are installed.
+
+The shadow is reconciled with the switches: removed entries are reported by FlowRemoved messages,
+and entries missing from the periodic flow statistics replies are forgotten.
+"""
+
+from pox.core import core
+from pox.lib.util import dpid_to_str, str_to_dpid
+from pox.lib.recoco import Timer
+import pox.openflow.libopenflow_01 as of
+
+import gox_metrics
+import time
+
+log = core.getLogger()
+
+def matchKey(match):
+    """
+    Returns the (dl_src, dl_dst) pair identifying the entries handled by the shadow,
+    or None for an entry matching other fields
+    """
+    if match.dl_src is None and match.dl_dst is None:
+        return None
+    if match.in_port is not None or match.dl_type is not None or match.dl_vlan is not None:
+        return None
+    return (None if match.dl_src is None else str(match.dl_src),
+            None if match.dl_dst is None else str(match.dl_dst))
+
+def outputPorts(actions):
+    return tuple(action.port for action in actions if isinstance(action, of.ofp_action_output))
+
+
+class FlowShadow(object):
+
+    def __init__(self, reconcile_interval=30):
+        self.tables = {}            # dpid -> {(dl_src, dl_dst): output ports}
+        self.queued = {}            # dpid -> flow-mods waiting for flush()
+        self.waiting = []           # [set of pending (dpid, barrier xid), callback]
+        self.barriers = {}          # (dpid, barrier xid) -> sending time
+        self.sent = 0
+        self.skipped = 0
+        self.batches = 0
+
+        core.listen_to_dependencies(self)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        if reconcile_interval:
+            self.timer = Timer(reconcile_interval, self._requestStats, recurring=True)
+        log.info("FlowShadow launched")
+
+    def install(self, dpid, msg, force=False):
+        """
+        Queues the ADD or MODIFY flow-mod msg for the switch dpid, unless it already has this entry.
+        force queues it anyway, when the entry is known to be missing from the switch
+        """
+        key = matchKey(msg.match)
+        ports = outputPorts(msg.actions)
+        table = self.tables.setdefault(dpid, {})
+        if key is not None and not force and table.get(key) == ports:
+            self.skipped += 1
+            return False
+        if key is not None:
+            table[key] = ports
+            msg.flags |= of.OFPFF_SEND_FLOW_REM
+        self.queued.setdefault(dpid, []).append(msg)
+        return True
+
+    def delete(self, dpid, msg):
+        """
+        Queues the DELETE or DELETE_STRICT flow-mod msg for the switch dpid, unless it has no matching entry
+        """
+        key = matchKey(msg.match)
+        table = self.tables.get(dpid, {})
+        if key is None:
+            removed = []
+        elif msg.command == of.OFPFC_DELETE_STRICT:
+            removed = [key] if key in table else []
+        else:
+            removed = [entry for entry in table if all(field is None or field == value for field, value in zip(key, entry))]
+        if key is not None and not removed:
+            self.skipped += 1
+            return False
+        for entry in removed:
+            del table[entry]
+        self.queued.setdefault(dpid, []).append(msg)
+        return True
+
+    def get(self, dpid, dl_src, dl_dst):
+        """
+        Returns the output ports of the entry of the switch matching dl_src and dl_dst, or None
+        """
+        return self.tables.get(dpid, {}).get((dl_src, dl_dst))
+
+    def flush(self, callback=None):
+        """
+        Sends the queued flow-mods, each switch receiving its own ones in a single write followed
+        by a barrier. callback is called once every switch answered its barrier
+        """
+        pending = set()
+        for dpid, msgs in self.queued.items():
+            connection = core.openflow.getConnection(str_to_dpid(dpid))
+            if connection is None:
+                continue
+            barrier = of.ofp_barrier_request()
+            start = time.time()
+            connection.send(b"".join(msg.pack() for msg in msgs) + barrier.pack())
+            gox_metrics.observe("flow_mod", "send", time.time() - start)
+            self.barriers[(dpid, barrier.xid)] = start
+            pending.add((dpid, barrier.xid))
+            self.sent += len(msgs)
+            self.batches += 1
+        self.queued = {}
+
+        if callback is not None:
+            if pending:
+                self.waiting.append([pending, callback])
+            else:
+                callback()
+
+    def _barrierDone(self, done):
+        for waiting in list(self.waiting):
+            waiting[0] -= done
+            if not waiting[0]:
+                self.waiting.remove(waiting)
+                waiting[1]()
+
+    def _requestStats(self):
+        for connection in core.openflow.connections:
+            connection.send(of.ofp_stats_request(body=of.ofp_flow_stats_request()))
+
+    def _handle_openflow_BarrierIn(self, event):
+        key = (dpid_to_str(event.dpid), event.xid)
+        sent = self.barriers.pop(key, None)
+        if sent is not None:
+            gox_metrics.observe("flow_mod", "barrier", time.time() - sent)
+        self._barrierDone(set([key]))
+
+    def _handle_openflow_FlowRemoved(self, event):
+        key = matchKey(event.ofp.match)
+        if key is not None:
+            self.tables.get(dpid_to_str(event.dpid), {}).pop(key, None)
+
+    def _handle_openflow_FlowStatsReceived(self, event):
+        dpid = dpid_to_str(event.dpid)
+        if dpid in self.queued or any(entry[0] == dpid for waiting in self.waiting for entry in waiting[0]):
+            return  # The reply may not show the flow-mods in flight
+        installed = set(matchKey(stats.match) for stats in event.stats)
+        table = self.tables.get(dpid, {})
+        # Only missing entries are forgotten: at worst, an entry is sent again
+        for key in [key for key in table if key not in installed]:
+            del table[key]
+
+    def _handle_openflow_ConnectionUp(self, event):
+        self.tables[dpid_to_str(event.dpid)] = {}
+
+    def _handle_openflow_ConnectionDown(self, event):
+        dpid = dpid_to_str(event.dpid)
+        self.tables.pop(dpid, None)
+        self.queued.pop(dpid, None)
+        for key in [key for key in self.barriers if key[0] == dpid]:
+            del self.barriers[key]
+        self._barrierDone(set(entry for waiting in self.waiting for entry in waiting[0] if entry[0] == dpid))
+
+    def _handle_GoingDownEvent(self, event):
+        log.info("FlowShadow: {0} flow-mods sent in {1} batches, {2} redundant ones skipped".format(self.sent, self.batches, self.skipped))
+
+
+def launch():
+    print("gox_flows is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
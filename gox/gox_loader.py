@@ -0,0 +1,229 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bulk provisioning of the topology from a declarative file
+
+The `TopologyLoader` reads a topology file row by row, without loading it all, adds its switches,
+hosts and links to the topology mirror, and writes them to the database in transactions of batch rows,
+each kind of row with a single UNWIND statement. Uniqueness constraints on Switch.dpid and Host.mac,
+which also index them, are created first, with the FOR ... REQUIRE syntax of Neo4j 4.4 and later.
+
+The file is either CSV, with a header, or JSON Lines (one JSON object per line). Both have the same fields:
+
+    type        "switch", "host" or "link"
+    name        dpid of a switch, MAC address of a host, first end of a link
+    ip          IP address of a host (optional)
+    port        port of the first end of a link (ignored for a host)
+    peer        dpid of the second end of a link
+    peer_port   port of the second end of a link
+    weight      routing weight of a link between switches, in both directions (optional)
+
+The load is a bulk operation: the APOC triggers of the `TriggerRegistry`, if gox manages them, are paused
+during the load and resumed afterwards, catching up with the loaded topology.
+
+Switches and hosts must be declared before their links. Once loaded, the ConnectionUp, LinkEvent and
+HostEvent events of the provisioned entities only confirm them, instead of writing them again.
+"""
+
+from pox.core import core
+
+import gox_queries
+import csv
+import json
+import time
+
+log = core.getLogger()
+
+gox_queries.register("provision.switchConstraint", '''
+        CREATE CONSTRAINT switch_dpid IF NOT EXISTS FOR (s:Switch) REQUIRE s.dpid IS UNIQUE
+        ''')
+
+gox_queries.register("provision.hostConstraint", '''
+        CREATE CONSTRAINT host_mac IF NOT EXISTS FOR (h:Host) REQUIRE h.mac IS UNIQUE
+        ''')
+
+gox_queries.register("provision.addHost", '''
+        UNWIND $rows AS row
+        MERGE (h:Host {mac: row.mac})
+        SET h.ip = row.ip,
+            h.ipAddrs = row.ips
+        ''')
+
+gox_queries.register("provision.setWeight", '''
+        UNWIND $rows AS row
+        MATCH (:Switch {dpid: row.dpid})-[r:Connected_to {orig_port: row.port}]->(:Switch)
+        SET r.weight = row.weight
+        ''')
+
+# Statements of the rows of every kind, in the order they are written
+STATEMENTS = (("addSwitch", "topology.addSwitch"), ("addHost", "provision.addHost"),
+              ("addLink", "topology.addLink"), ("addHostLink", "topology.addHostLink"),
+              ("setWeight", "provision.setWeight"))
+NODES = ("addSwitch", "addHost")
+
+class LoaderError(Exception):
+    pass
+
+
+def readRows(filename):
+    """
+    Yields the rows of a topology file as dicts, CSV if its name ends with .csv, JSON Lines otherwise
+    """
+    with open(filename, newline="") as f:
+        if filename.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield row
+            return
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise LoaderError("{0}, line {1}: {2}".format(filename, number, e))
+
+
+class TopologyLoader(object):
+
+    def __init__(self, filename, driver, queries, handler, routing_engine=None, batch=10000):
+        self.filename = filename
+        self.driver = driver
+        self.queries = queries
+        self.handler = handler
+        self.topology = handler.topology
+        self.routing_engine = routing_engine
+        self.batch = batch
+        self.pending = dict((name, []) for name, _ in STATEMENTS)
+        self.unconfirmed = set()        # Provisioned switch dpids and host MACs not seen on the network yet
+        self.written = 0
+        self.skipped = 0
+
+        self.load()
+        handler.provision = self
+
+    def load(self):
+        triggers = core.TriggerRegistry if core.hasComponent("TriggerRegistry") else None
+        if triggers is not None:
+            # The load writes in its own session, once the triggers are paused
+            triggers.pauseAll(wait=True)
+        try:
+            self._load()
+        finally:
+            if triggers is not None:
+                triggers.resumeAll()
+
+    def _load(self):
+        start = time.time()
+        with self.driver.session() as session:
+            self.session = session
+            for name in ("provision.switchConstraint", "provision.hostConstraint"):
+                self.queries.run(name, None, session).consume()
+            for row in readRows(self.filename):
+                self._add(row)
+                if len(self.pending["addSwitch"]) + len(self.pending["addHost"]) >= self.batch:
+                    self._flush(NODES)
+                elif len(self.pending["addLink"]) + len(self.pending["addHostLink"]) >= self.batch:
+                    self._flush()
+            self._flush()
+        self.session = None
+        log.info("Provisioning : {0} switches, {1} hosts and {2} links loaded from {3} in {4:.2f} s ({5} rows written, {6} skipped)".format(
+                 len(self.topology.switches), len(self.topology.hosts), len(self.topology.links) // 2,
+                 self.filename, time.time() - start, self.written, self.skipped))
+
+    def _add(self, row):
+        kind = row.get("type")
+        name = row.get("name")
+        if kind == "switch":
+            self.topology.addSwitch(name)
+            self.unconfirmed.add(name)
+            self.pending["addSwitch"].append({"dpid": name})
+        elif kind == "host":
+            ip = row.get("ip") or " "
+            self.topology.addHost(name, ip)
+            self.unconfirmed.add(name)
+            self.pending["addHost"].append({"mac": name, "ip": ip, "ips": [ip] if ip.strip() else []})
+        elif kind == "link":
+            self._addLink(name, row.get("port"), row.get("peer"), row.get("peer_port"), row.get("weight"))
+        else:
+            raise LoaderError("Unknown row type {0} in {1}".format(kind, self.filename))
+
+    def _addLink(self, name1, port1, name2, port2, weight):
+        if name2 in self.topology.hosts:
+            name1, port1, name2, port2 = name2, port2, name1, port1
+        if not self.topology.entityExists(name1) or not self.topology.switchExists(name2):
+            log.warn("Provisioning : link {0}.{1} <-> {2}.{3} skipped, its ends must be declared first".format(name1, port1, name2, port2))
+            self.skipped += 1
+            return
+        if name1 in self.topology.hosts:
+            self.topology.addLink(name1, "0", name2, port2)
+            self.pending["addHostLink"].append({"mac": name1, "dpid": name2, "port": str(port2)})
+            return
+        self.topology.addLink(name1, port1, name2, port2)
+        self.pending["addLink"].append({"dpid1": name1, "port1": str(port1), "dpid2": name2, "port2": str(port2)})
+        if weight not in (None, ""):
+            weight = float(weight)
+            for dpid, port in ((name1, port1), (name2, port2)):
+                if self.routing_engine is not None:
+                    self.routing_engine.setWeight(dpid, int(port), weight)
+                self.pending["setWeight"].append({"dpid": dpid, "port": str(port), "weight": weight})
+
+    def _flush(self, kinds=None):
+        """
+        Writes the pending rows of the given kinds, by default all of them, in a single transaction
+        """
+        batch = [(name, statement, self.pending[name]) for name, statement in STATEMENTS
+                 if (kinds is None or name in kinds) and self.pending[name]]
+        if not batch:
+            return
+        self.session.write_transaction(self._write, batch)
+        for name, _, rows in batch:
+            self.written += len(rows)
+            self.pending[name] = []
+
+    def _write(self, tx, batch):
+        for _, statement, rows in batch:
+            self.queries.run(statement, {"rows": rows}, tx)
+
+    def confirmSwitch(self, dpid):
+        """
+        Returns True if the switch was provisioned and not seen on the network yet
+        """
+        if dpid not in self.unconfirmed:
+            return False
+        self.unconfirmed.discard(dpid)
+        return True
+
+    def confirmLink(self, dpid1, port1, dpid2, port2):
+        # Provisioned links are in the mirror: the coalescer ignores their LinkEvents
+        return False
+
+    def confirmHost(self, mac, dpid, port):
+        """
+        Returns True if the host was provisioned at this location and not seen on the network yet.
+        A host provisioned at another location is removed, so that it can be added again
+        """
+        if mac not in self.unconfirmed:
+            return False
+        self.unconfirmed.discard(mac)
+        if self.topology.hostLocation(mac) == (dpid, int(port)):
+            return True
+        self.handler._write("delHost", mac)
+        self.topology.delHost(mac)
+        return False
+
+
+def launch():
+    print("gox_loader is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
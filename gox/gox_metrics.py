@@ -0,0 +1,238 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Latency instrumentation of GOX
+
+The `Instrumentation` component keeps a latency histogram for every series of a kind:
+
+* "query": every neo4j statement, by its name in gox_queries, and every call to the DatabaseInstance,
+* "handler": every event handler decorated with `instrumented`,
+* "flow_mod": the sending of the flow-mods of every switch, and the round trip of their barrier,
+* "query_triggered": the statements run while APOC triggers are active,
+* "trigger": the installation, suspension and resumption of the APOC triggers.
+
+GOX components report their measures with `observe`, which does nothing until the component is launched.
+Histograms are logged every interval seconds and when POX goes down, and can be dumped at any time
+with `dump`, as JSON or in Prometheus' text format.
+
+Handlers decorated with `instrumented(hot=True)` can also be profiled: one call out of profile_every
+is run under cProfile, and the statistics are logged, and saved to profile_file, when POX goes down.
+"""
+
+from pox.core import core
+
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+
+log = core.getLogger()
+
+# Upper bounds of the buckets of the histograms, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_instance = None    # Launched Instrumentation
+
+def observe(kind, name, seconds):
+    """
+    Records a latency of the series name of kind ("query", "handler", "flow_mod", "query_triggered", "trigger")
+    """
+    if _instance is not None:
+        _instance.observe(kind, name, seconds)
+
+def enabled():
+    return _instance is not None
+
+def instrumented(function=None, hot=False):
+    """
+    Decorator recording the latency of an event handler, as the "handler" series Class._handle_Event.
+    The calls of hot handlers can be sampled by the profiler
+    """
+    if function is None:
+        return lambda function: instrumented(function, hot)
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if _instance is None:
+            return function(self, *args, **kwargs)
+        name = type(self).__name__ + "." + function.__name__
+        if hot and _instance.sample():
+            return _instance.profile(name, function, self, *args, **kwargs)
+        start = time.time()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            _instance.observe("handler", name, time.time() - start)
+    return wrapper
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        Returns the upper bound of the bucket of the p percentile (between 0 and 1)
+        """
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def toDict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "buckets": dict(("+Inf" if bound == float("inf") else repr(bound), count) for bound, count in zip(BUCKETS, self.counts))}
+
+
+class Instrumentation(object):
+
+    def __init__(self, interval=0, filename=None, profile_every=0, profile_file=None):
+        global _instance
+        self.filename = filename
+        self.profile_every = profile_every
+        self.profile_file = profile_file
+        self.series = {}                # kind -> {name: Histogram}
+        self.lock = threading.Lock()    # Queries are observed from the threads of the executor
+        self.calls = 0                  # Calls of the hot handlers
+        self.profiler = cProfile.Profile() if profile_every else None
+        self.profiled = 0
+
+        if interval:
+            from pox.lib.recoco import Timer
+            self.timer = Timer(interval, self._report, recurring=True)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        _instance = self
+        log.info("Instrumentation launched")
+
+    def observe(self, kind, name, seconds):
+        with self.lock:
+            histograms = self.series.setdefault(kind, {})
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def sample(self):
+        """
+        Returns True if the current call of a hot handler should be profiled
+        """
+        if not self.profile_every:
+            return False
+        self.calls += 1
+        return self.calls % self.profile_every == 0
+
+    def profile(self, name, function, *args, **kwargs):
+        start = time.time()
+        self.profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+            self.profiled += 1
+            self.observe("handler", name, time.time() - start)
+
+    def getStats(self):
+        with self.lock:
+            return dict((kind, dict((name, histogram.toDict()) for name, histogram in histograms.items()))
+                        for kind, histograms in self.series.items())
+
+    def prometheus(self):
+        """
+        Returns the histograms in Prometheus' text exposition format
+        """
+        lines = []
+        with self.lock:
+            for kind in sorted(self.series):
+                metric = "gox_{}_seconds".format(kind)
+                lines.append("# TYPE {} histogram".format(metric))
+                for name in sorted(self.series[kind]):
+                    histogram = self.series[kind][name]
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append('{0}_bucket{{name="{1}",le="{2}"}} {3}'.format(metric, name, le, cumulative))
+                    lines.append('{0}_sum{{name="{1}"}} {2}'.format(metric, name, histogram.sum))
+                    lines.append('{0}_count{{name="{1}"}} {2}'.format(metric, name, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename=None):
+        """
+        Writes the histograms to filename, by default the metrics_file of gox, in Prometheus' text format
+        if it ends with .prom, as JSON otherwise
+        """
+        filename = filename or self.filename
+        if not filename:
+            raise ValueError("No file to dump the metrics to, give a filename or launch gox with metrics_file")
+        if filename.endswith(".prom"):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.getStats(), indent=2, sort_keys=True)
+        with open(filename, "w") as f:
+            f.write(text)
+
+    def logSummary(self):
+        with self.lock:
+            rows = [(kind, name, histogram.count, histogram.sum / histogram.count,
+                     histogram.percentile(0.5), histogram.percentile(0.99), histogram.max)
+                    for kind, histograms in self.series.items() for name, histogram in histograms.items()]
+        for kind, name, count, mean, p50, p99, longest in sorted(rows, key=lambda row: -row[2] * row[3]):
+            log.info("{0} {1}: {2} calls, avg {3:.2f} ms, p50 {4:.2f} ms, p99 {5:.2f} ms, max {6:.2f} ms".format(
+                     kind, name, count, mean * 1000, p50 * 1000, p99 * 1000, longest * 1000))
+
+    def logProfile(self, limit=20):
+        if self.profiler is None or not self.profiled:
+            return
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats("cumulative").print_stats(limit)
+        log.info("Profile of {0} sampled handler calls:\n{1}".format(self.profiled, output.getvalue()))
+        if self.profile_file:
+            stats.dump_stats(self.profile_file)
+
+    def _report(self):
+        self.logSummary()
+        if self.filename:
+            try:
+                self.dump()
+            except (IOError, OSError):
+                log.exception("Impossible to write the metrics to {}".format(self.filename))
+
+    def _handle_GoingDownEvent(self, event):
+        self._report()
+        self.logProfile()
+
+
+def launch():
+    print("gox_metrics is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
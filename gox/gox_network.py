@@ -22,22 +22,131 @@ the network topology
 from pox.core import core
 from pox.lib.revent import *
 from pox.lib.util import dpid_to_str
+from pox.lib.addresses import EthAddr
+from pox.lib.recoco import Timer
 
 
 import gox_db
+from gox_executor import DB_KEY
+from gox_topology import TopologyMirror
+from gox_coalesce import LinkEventCoalescer
+from gox_metrics import instrumented
+import gox_metrics
 import time
 
 log = core.getLogger()
 
+# Seconds between two removals of the IP addresses that host_tracker expired
+IP_EXPIRY_INTERVAL = 10
+
 # network -> POX -> neo4j -> POX -> network
 
 class NetworkEventHandler():
 
-    def __init__(self, db_instance):
+    def __init__(self, db_instance, consistency_check=False, writer=None, executor=None, link_window=0.1, link_hold_down=30):
         core.listen_to_dependencies(self)   # Creates listeners for events coming from a dependent component
         self.db_instance = db_instance
+        self.writer = writer                # Write-behind queue of the topology mutations, if any
+        self.executor = executor            # Runs the calls to db_instance outside of POX's thread, if any
+        self.consistency_check = consistency_check
+        self.warm_start = None              # WarmStart confirming the topology loaded from the database, if any
+        self.provision = None               # TopologyLoader confirming the provisioned topology, if any
+        self.topology = TopologyMirror()    # Written through with the database, answers the existence checks
+        # Applies the net change of the LinkEvents of every link, once per window
+        self.link_events = LinkEventCoalescer(self.topology.linkExists, self._applyLinkEvent, link_window, link_hold_down)
+        self.ip_timer = Timer(IP_EXPIRY_INTERVAL, self._expireIps, recurring=True)
         log.info("NetworkEventHandler launched")
 
+    def _exists(self, check, *args):
+        """
+        Answers an existence check ("switchExists", "linkExists"...) from the topology mirror.
+        If consistency_check is enabled, the answer is compared with the one of the database.
+        With a write-behind writer, the database can lag behind the mirror for a few milliseconds
+        """
+        local = getattr(self.topology, check)(*args)
+        if self.consistency_check:
+            def compare(remote):
+                if remote != local:
+                    log.warn("Topology mirror out of sync : {0}{1} is {2} locally but {3} in the database".format(check, args, local, remote))
+            self._callDatabase(check, args, compare)
+        return local
+
+    def _write(self, mutation, *args):
+        """
+        Sends a topology mutation ("addSwitch", "delLink"...) to the write-behind queue,
+        or to the database through the executor
+        """
+        if self.writer is not None:
+            getattr(self.writer, mutation)(*args)
+        else:
+            self._callDatabase(mutation, args)
+
+    def _callDatabase(self, method, args, callback=None):
+        """
+        Calls a method of the DatabaseInstance in a worker of the executor. Without executor,
+        the method is called synchronously
+        """
+        if self.executor is None:
+            result = self._timedCall(method, args)
+            if callback is not None:
+                callback(result)
+            return
+        self.executor.submit(lambda session: self._timedCall(method, args), callback, DB_KEY)
+
+    def _timedCall(self, method, args):
+        start = time.time()
+        try:
+            return getattr(self.db_instance, method)(*args)
+        finally:
+            gox_metrics.observe("query", "DatabaseInstance." + method, time.time() - start)
+
+    def setHostIps(self, mac, ips):
+        """
+        Binds the given IP addresses to the host, in the topology mirror and on its node
+        """
+        moved = set(self.topology.macOf(ip) for ip in ips) - set([None, mac])
+        self.topology.setHostIps(mac, ips)
+        # The hosts which lost an IP address
+        for host in [mac] + list(moved):
+            ips = sorted(self.topology.host_ips[host])
+            if self.writer is not None:
+                self.writer.setHostIps(host, ips)
+            elif self.executor is not None:
+                self.executor.run("topology.setHostIps", {"rows": [{"mac": host, "ips": ips}]}, key=DB_KEY)
+            else:
+                core.QueryRegistry.run("topology.setHostIps", {"rows": [{"mac": host, "ips": ips}]})
+
+    def learnIp(self, mac, ip):
+        """
+        Binds an IP address seen in a packet of a known host, like the sender of an ARP packet
+        """
+        if self.topology.hostExists(mac) and self.topology.macOf(ip) != mac:
+            self.setHostIps(mac, self.topology.host_ips[mac] | set([ip]))
+
+    def _expireIps(self):
+        """
+        Unbinds the IP addresses that host_tracker stopped tracking
+        """
+        if not core.hasComponent("host_tracker"):
+            return
+        for mac, ips in list(self.topology.host_ips.items()):
+            entry = core.host_tracker.entryByMAC.get(EthAddr(mac))
+            if entry is None or not ips:
+                continue
+            tracked = set(str(ip) for ip in entry.ipAddrs)
+            if ips - tracked:
+                self.setHostIps(mac, ips & tracked)
+
+    def _confirm(self, method, *args):
+        """
+        Returns True if the entity was loaded by a warm start or provisioned, and is seen on the network for the first time
+        """
+        for source in (self.warm_start, self.provision):
+            if source is not None and getattr(source, method)(*args):
+                return True
+        return False
+
+    @instrumented(hot=True)
     def _handle_openflow_discovery_LinkEvent(self, event):
         """
         Handles the event "LinkEvent" from the component "discovery"
@@ -53,27 +162,43 @@ class NetworkEventHandler():
         port2=event.port_for_dpid(event.link.dpid2)
         
         # Switchs/Hosts exist ?
-        if(not self.db_instance.entityExists(dpid1) or not self.db_instance.entityExists(dpid2)):
+        if(not self._exists("entityExists", dpid1) or not self._exists("entityExists", dpid2)):
             log.warn("Impossible to add link. Nodes {0} or {1} do not exist !".format(dpid1, dpid2))
             return
-        
+
+        if event.added and self.topology.linkExists(dpid1, port1, dpid2, port2):
+            if self._confirm("confirmLink", dpid1, port1, dpid2, port2):
+                return
+
+        self.link_events.push(dpid1, port1, dpid2, port2, event.added)
+
+    def _applyLinkEvent(self, dpid1, port1, dpid2, port2, added):
+        """
+        Adds or removes a link, once its LinkEvents have been coalesced
+        """
+        if(not self._exists("entityExists", dpid1) or not self._exists("entityExists", dpid2)):
+            return  # Removed during the window, with its links
+
         # Has the link been added or removed ?
-        if(event.added):
-            if self.db_instance.linkExists(dpid1, port1, dpid2, port2):
+        if(added):
+            if self._exists("linkExists", dpid1, port1, dpid2, port2):
                 log.warn("Link {0}.{1} -> {2}.{3} already in the database".format(dpid1, port1, dpid2, port2))
                 return  
             else:
-                self.db_instance.addLink(dpid1, port1, dpid2, port2)
+                self._write("addLink", dpid1, port1, dpid2, port2)
+                self.topology.addLink(dpid1, port1, dpid2, port2)
                 log.info("Link {0}.{1} <-> {2}.{3} added".format(dpid1, port1, dpid2, port2))
-        elif(event.removed):
-            if not self.db_instance.linkExists(dpid1, port1, dpid2, port2):
+        else:
+            if not self._exists("linkExists", dpid1, port1, dpid2, port2):
                 log.warn("Link {0}.{1} -> {2}.{3} not in database".format(dpid1, port1, dpid2, port2))
                 return  
             else:
-                self.db_instance.delLink(dpid1, port1, dpid2, port2)
+                self._write("delLink", dpid1, port1, dpid2, port2)
+                self.topology.delLink(dpid1, port1, dpid2, port2)
                 log.info("Link {0}.{1} <-/-> {2}.{3} removed".format(dpid1, port1, dpid2, port2))
 
     # _handle_<ComponentName>_<EventName>
+    @instrumented(hot=True)
     def _handle_host_tracker_HostEvent(self, event):
         """
         Handles the event "HostEvent" from the component "host_tracker"
@@ -85,46 +210,62 @@ class NetworkEventHandler():
         # log.info("Handling host_tracker HostEvent event")
 
         mac = str(event.entry.macaddr)
-        ip = " " # event.entry.ipAddrs.keys()[0]
+        ips = sorted(str(ip) for ip in event.entry.ipAddrs)
+        ip = ips[0] if ips else " "
         switchPort = event.entry.port
         switchDpid = dpid_to_str(event.entry.dpid)
 
         if (event.join):
             # Was the host disconnected ?
-            if(self.db_instance.hostExists(mac)):
-                log.warn("HostEvent : (Join) Impossible to handle event, Host {} already exists.".format(mac))
-                return
+            if(self._exists("hostExists", mac)):
+                if self._confirm("confirmHost", mac, switchDpid, switchPort):
+                    return
+                # A host loaded at another location is removed by confirmHost()
+                if(self._exists("hostExists", mac)):
+                    log.warn("HostEvent : (Join) Impossible to handle event, Host {} already exists.".format(mac))
+                    return
             # Does the switch the host is connected to exist ?
-            if(not self.db_instance.switchExists(switchDpid)):
+            if(not self._exists("switchExists", switchDpid)):
                 log.warn("HostEvent : (Join) Impossible to handle event, Switch {} does not exist.".format(switchDpid))
                 return
             
             # print(event.entry.ipAddrs)
-            self.db_instance.addHost(mac, ip)
-            self.db_instance.addLink(mac, "0", switchDpid, switchPort)            
+            self._write("addHost", mac, ip)
+            self._write("addLink", mac, "0", switchDpid, switchPort)
+            self.topology.addHost(mac, ip)
+            self.topology.addLink(mac, "0", switchDpid, switchPort)            
+            if ips:
+                self.setHostIps(mac, ips)
             
         elif (event.leave):
             # Was the host connected ?
-            if(not self.db_instance.hostExists(mac)):
+            if(not self._exists("hostExists", mac)):
                 log.warn("HostEvent : (Leave) Impossible to handle event, Host {} does not exist.".format(mac))
                 return
             
-            self.db_instance.delHost(mac) # All links are also deleted
+            self._write("delHost", mac) # All links are also deleted
+            self.topology.delHost(mac)
 
         elif (event.move):
             # If the host is disconnected
-            if(not self.db_instance.hostExists(mac)):
+            if(not self._exists("hostExists", mac)):
                 log.warn("HostEvent : (Move) Impossible to handle event, Host {} does not exist.".format(mac))
                 return
             else:
-                self.db_instance.delHost(mac)
-                if(not self.db_instance.switchExists(switchDpid)):
+                self._write("delHost", mac)
+                self.topology.delHost(mac)
+                if(not self._exists("switchExists", switchDpid)):
                     log.warn("HostEvent : (Move) Impossible to handle event, Switch {} does not exist.".format(switchDpid))
                     return
-                self.db_instance.addHost(mac, ip)
-                self.db_instance.addLink(mac, "0", switchDpid, switchPort)   
+                self._write("addHost", mac, ip)
+                self._write("addLink", mac, "0", switchDpid, switchPort)
+                self.topology.addHost(mac, ip)
+                self.topology.addLink(mac, "0", switchDpid, switchPort)   
+                if ips:
+                    self.setHostIps(mac, ips)
         
 
+    @instrumented
     def _handle_openflow_ConnectionUp(self, event):
         """
         Handles the event "ConnectionUp" from "of_01.py" and its Connection class
@@ -134,12 +275,16 @@ class NetworkEventHandler():
 
         dpid = dpid_to_str(event.dpid)
 
-        if(self.db_instance.entityExists(dpid)):
+        if(self._exists("entityExists", dpid)):
+            if self._confirm("confirmSwitch", dpid):
+                return
             log.warn("ConnectionUp : Impossible to handle event, Switch {} already exists".format(dpid))
             return
         
-        self.db_instance.addSwitch(dpid)
+        self._write("addSwitch", dpid)
+        self.topology.addSwitch(dpid)
 
+    @instrumented
     def _handle_openflow_ConnectionDown(self, event):
         """
         Handles the event "ConnectionUp" from "of_01.py" and its Connection class
@@ -149,11 +294,12 @@ class NetworkEventHandler():
 
         dpid = dpid_to_str(event.dpid)
 
-        if(not self.db_instance.entityExists(dpid)):
+        if(not self._exists("entityExists", dpid)):
             log.warn("ConnectionDown : Impossible to handle event, Switch {} does not exist".format(dpid))
             return
         
-        self.db_instance.delSwitch(dpid)
+        self._write("delSwitch", dpid)
+        self.topology.delSwitch(dpid)
 
 
 
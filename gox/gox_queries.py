@@ -0,0 +1,256 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry of the named and parameterized Cypher statements used by GOX
+
+Values (MAC addresses, dpids, ports...) must never be formatted into the text of a query:
+they are given as parameters, so that every execution of a statement sends the same text to neo4j,
+which can then reuse the plan it cached for it instead of planning the query again.
+
+Statements are registered once with `register(name, text)`, and executed by name with `QueryRegistry.run`.
+GOX applications can register their own statements when they are imported.
+
+The `QueryRegistry` class counts the executions of every statement. Their latency is measured by gox_metrics.
+
+While APOC triggers are active (see `setTriggered`), statements are observed as the "query_triggered"
+series of gox_metrics instead of "query", so that the overhead of the triggers on the writes can be measured.
+"""
+
+from pox.core import core
+
+import gox_metrics
+import threading
+import time
+
+log = core.getLogger()
+
+_triggered = False      # True while APOC triggers are installed and not paused
+
+STATEMENTS = {}     # name -> Cypher text
+
+def setTriggered(active):
+    """
+    Tells if APOC triggers run with the statements from now on
+    """
+    global _triggered
+    _triggered = active
+
+def register(name, text):
+    """
+    Registers the Cypher statement text under name. Parameters are written $param in the text
+    """
+    if name in STATEMENTS and STATEMENTS[name] != text:
+        raise ValueError("Statement {} is already registered with another text".format(name))
+    STATEMENTS[name] = text
+
+
+# Topology mutations, each one applied to the list of rows given in $rows
+
+register("topology.addSwitch", '''
+        UNWIND $rows AS row
+        MERGE (s:Switch {dpid: row.dpid})
+        ''')
+
+register("topology.delSwitch", '''
+        UNWIND $rows AS row
+        MATCH (s:Switch {dpid: row.dpid})
+        DETACH DELETE s
+        ''')
+
+register("topology.addHost", '''
+        UNWIND $rows AS row
+        MERGE (h:Host {mac: row.mac})
+        SET h.ip = row.ip
+        ''')
+
+register("topology.delHost", '''
+        UNWIND $rows AS row
+        MATCH (h:Host {mac: row.mac})
+        DETACH DELETE h
+        ''')
+
+register("topology.setHostIps", '''
+        UNWIND $rows AS row
+        MATCH (h:Host {mac: row.mac})
+        SET h.ipAddrs = row.ips,
+            h.ip = coalesce(head(row.ips), " ")
+        ''')
+
+register("topology.addLink", '''
+        UNWIND $rows AS row
+        MATCH (a:Switch {dpid: row.dpid1})
+        MATCH (b:Switch {dpid: row.dpid2})
+        MERGE (a)-[:Connected_to {orig_port: row.port1, dst_port: row.port2}]->(b)
+        MERGE (b)-[:Connected_to {orig_port: row.port2, dst_port: row.port1}]->(a)
+        ''')
+
+register("topology.addHostLink", '''
+        UNWIND $rows AS row
+        MATCH (h:Host {mac: row.mac})
+        MATCH (s:Switch {dpid: row.dpid})
+        MERGE (h)-[:Connected_to {orig_port: "0", dst_port: row.port}]->(s)
+        MERGE (s)-[:Connected_to {orig_port: row.port, dst_port: "0"}]->(h)
+        ''')
+
+register("topology.delLink", '''
+        UNWIND $rows AS row
+        MATCH (a:Switch {dpid: row.dpid1})-[r:Connected_to]-(b:Switch {dpid: row.dpid2})
+        WHERE (startNode(r) = a AND r.orig_port = row.port1 AND r.dst_port = row.port2)
+           OR (startNode(r) = b AND r.orig_port = row.port2 AND r.dst_port = row.port1)
+        DELETE r
+        ''')
+
+register("topology.savePath", '''
+        UNWIND $rows AS row
+        MATCH (h1:Host {mac: row.mac1})
+        MATCH (h2:Host {mac: row.mac2})
+        MERGE (h1)-[p1:Path_to]->(h2)
+        SET p1.switches = row.switches,
+            p1.in_ports = row.in_ports,
+            p1.out_ports = row.out_ports,
+            p1.last_used = coalesce(p1.last_used, row.last_used),
+            p1.hits = coalesce(p1.hits, 0)
+        MERGE (h1)<-[p2:Path_to]-(h2)
+        SET p2.switches = row.r_switches,
+            p2.in_ports = row.r_in_ports,
+            p2.out_ports = row.r_out_ports,
+            p2.last_used = coalesce(p2.last_used, row.last_used),
+            p2.hits = coalesce(p2.hits, 0)
+        ''')
+
+register("topology.delPath", '''
+        UNWIND $rows AS row
+        MATCH (h1:Host {mac: row.mac1})-[r:Path_to]-(h2:Host {mac: row.mac2})
+        DELETE r
+        ''')
+
+# Deletes, in a single statement, the links, hosts and switches of each row, with the paths going through its switches
+register("topology.delStale", '''
+        UNWIND $rows AS row
+        CALL {
+            WITH row
+            WITH row WHERE size(row.switches) > 0
+            MATCH (:Host)-[p:Path_to]->(:Host)
+            WHERE any(dpid IN p.switches WHERE dpid IN row.switches)
+            DELETE p
+        }
+        CALL {
+            WITH row
+            UNWIND row.links AS link
+            MATCH (a:Switch {dpid: link.dpid1})-[r:Connected_to]-(b:Switch {dpid: link.dpid2})
+            WHERE (startNode(r) = a AND r.orig_port = link.port1 AND r.dst_port = link.port2)
+               OR (startNode(r) = b AND r.orig_port = link.port2 AND r.dst_port = link.port1)
+            DELETE r
+        }
+        CALL {
+            WITH row
+            UNWIND row.hosts AS mac
+            MATCH (h:Host {mac: mac})
+            DETACH DELETE h
+        }
+        CALL {
+            WITH row
+            UNWIND row.switches AS dpid
+            MATCH (s:Switch {dpid: dpid})
+            DETACH DELETE s
+        }
+        ''')
+
+# APOC triggers
+
+register("trigger.add", '''
+        CALL apoc.trigger.add($name, $statement, $selector, {params: $params})
+        ''')
+
+register("trigger.remove", '''
+        CALL apoc.trigger.remove($name)
+        ''')
+
+register("trigger.removeAll", '''
+        CALL apoc.trigger.removeAll()
+        ''')
+
+register("trigger.pause", '''
+        CALL apoc.trigger.pause($name)
+        ''')
+
+register("trigger.resume", '''
+        CALL apoc.trigger.resume($name)
+        ''')
+
+register("trigger.list", '''
+        CALL apoc.trigger.list() YIELD name, query, selector, params, paused
+        RETURN name, query, selector, params, paused
+        ''')
+
+register("trigger.pauseAll", '''
+        UNWIND $names AS trigger
+        CALL apoc.trigger.pause(trigger) YIELD paused
+        RETURN count(paused) AS paused
+        ''')
+
+register("trigger.resumeAll", '''
+        UNWIND $names AS trigger
+        CALL apoc.trigger.resume(trigger) YIELD paused
+        RETURN count(paused) AS resumed
+        ''')
+
+
+class QueryRegistry(object):
+
+    def __init__(self, session=None):
+        self.session = session          # Used when no session or transaction is given to run()
+        self.lock = threading.Lock()    # Statements can be run from several threads
+        self.counts = {}                # name -> number of executions
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("QueryRegistry launched with {} statements".format(len(STATEMENTS)))
+
+    def run(self, name, params=None, runner=None):
+        """
+        Runs the statement registered under name with the given parameters, and returns its result.
+        runner is the session or the transaction to run it in, by default the session of the registry
+        """
+        text = STATEMENTS[name]
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+        if runner is None:
+            runner = self.session
+        start = time.time()
+        try:
+            return runner.run(text, params or {})
+        finally:
+            gox_metrics.observe("query_triggered" if _triggered else "query", name, time.time() - start)
+
+    def getStats(self):
+        """
+        Returns the number of executions of every statement run so far
+        """
+        with self.lock:
+            return dict((name, {"count": count}) for name, count in self.counts.items())
+
+    def logStats(self):
+        stats = self.getStats()
+        total = sum(s["count"] for s in stats.values())
+        if total:
+            log.info("{0} queries run, {1} distinct statements".format(total, len(stats)))
+        for name in sorted(stats, key=lambda n: -stats[n]["count"]):
+            log.info("  {0}: {1} executions".format(name, stats[name]["count"]))
+
+    def _handle_GoingDownEvent(self, event):
+        self.logStats()
+
+
+def launch():
+    print("gox_queries is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
@@ -0,0 +1,256 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Invalidation and rerouting of the installed paths when links or switches fail
+
+The `PathIndex` class keeps the paths installed on the switches, indexed by the links and switches they go through.
+The `Rerouter` class listens to the LinkDown and SwitchLeave events of the topology mirror. For every failure, it:
+
+1. finds the installed paths going through the failed link or switch,
+2. deletes their Path_to relationships from the database,
+3. computes their replacement with the path selection of the application (`select`, by default the shortest
+   path of the `RoutingEngine`) and stores it,
+4. sends flow-mods, through the `FlowShadow`, only to the switches whose entry changes:
+   modified output port, new switch on the path, or switch that is not on the path anymore.
+
+The new entries get the idle and hard timeouts of the entries installed by the application, so that
+they expire like the ones they replace.
+
+The time taken by every failure to converge is logged and reported with a PathsRerouted event.
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+from pox.lib.addresses import EthAddr
+import pox.openflow.libopenflow_01 as of
+
+import gox_writer
+from gox_metrics import instrumented
+from gox_executor import DB_KEY
+import time
+
+log = core.getLogger()
+
+class PathsRerouted(Event):
+    """
+    Raised after a failure has been handled. pairs is the set of (source MAC, destination MAC)
+    whose path went through the failed element, unreachable the ones without a replacement path
+    """
+    def __init__(self, cause, pairs, unreachable, flow_mods, duration):
+        Event.__init__(self)
+        self.cause = cause
+        self.pairs = pairs
+        self.unreachable = unreachable
+        self.flow_mods = flow_mods
+        self.duration = duration
+
+
+class PathIndex(object):
+
+    def __init__(self):
+        self.routes = {}            # (src mac, dst mac) -> Route
+        self.by_link = {}           # (dpid, out port) -> set of (src mac, dst mac)
+        self.by_switch = {}         # dpid -> set of (src mac, dst mac)
+        self.by_host = {}           # mac -> set of (src mac, dst mac)
+
+    def add(self, src, dst, route):
+        self.remove(src, dst)
+        pair = (src, dst)
+        self.routes[pair] = route
+        for dpid, port in zip(route.switches, route.out_ports):
+            self.by_link.setdefault((dpid, int(port)), set()).add(pair)
+            self.by_switch.setdefault(dpid, set()).add(pair)
+        self.by_host.setdefault(src, set()).add(pair)
+        self.by_host.setdefault(dst, set()).add(pair)
+
+    def remove(self, src, dst):
+        pair = (src, dst)
+        route = self.routes.pop(pair, None)
+        if route is None:
+            return None
+        for dpid, port in zip(route.switches, route.out_ports):
+            self._discard(self.by_link, (dpid, int(port)), pair)
+            self._discard(self.by_switch, dpid, pair)
+        self._discard(self.by_host, src, pair)
+        self._discard(self.by_host, dst, pair)
+        return route
+
+    def get(self, src, dst):
+        return self.routes.get((src, dst))
+
+    def pairsThroughLink(self, dpid, port):
+        return set(self.by_link.get((dpid, int(port)), ()))
+
+    def pairsThroughSwitch(self, dpid):
+        return set(self.by_switch.get(dpid, ()))
+
+    def pairsOfHost(self, mac):
+        return set(self.by_host.get(mac, ()))
+
+    def __len__(self):
+        return len(self.routes)
+
+    @staticmethod
+    def _discard(index, key, pair):
+        pairs = index.get(key)
+        if pairs is not None:
+            pairs.discard(pair)
+            if not pairs:
+                del index[key]
+
+
+class Rerouter(EventMixin):
+
+    _eventMixin_events = set([
+        PathsRerouted,
+    ])
+
+    def __init__(self, topology, routing_engine, idle_timeout=0, hard_timeout=0):
+        self.topology = topology
+        self.routing_engine = routing_engine
+        self.timeouts = (idle_timeout, hard_timeout)
+        self.select = routing_engine.shortestPath   # (mac1, mac2) -> Route or None, replaced by the application
+        self.index = PathIndex()
+        # After the RoutingEngine, so that its trees are already repaired
+        topology.addListeners(self, priority=-1)
+        log.info("Rerouter launched")
+
+    @instrumented
+    def _handle_LinkDown(self, event):
+        pairs = self.index.pairsThroughLink(event.dpid1, event.port1)
+        pairs |= self.index.pairsThroughLink(event.dpid2, event.port2)
+        self.reroute(pairs, "Link {0}.{1} <-/-> {2}.{3}".format(event.dpid1, event.port1, event.dpid2, event.port2))
+
+    @instrumented
+    def _handle_SwitchLeave(self, event):
+        self.reroute(self.index.pairsThroughSwitch(event.dpid), "Switch {}".format(event.dpid))
+
+    def _handle_HostLeave(self, event):
+        # Its Path_to relationships are deleted with its node
+        for src, dst in self.index.pairsOfHost(event.mac):
+            self.index.remove(src, dst)
+
+    def removePaths(self, pairs):
+        """
+        Forgets the installed paths of the given (mac1, mac2) pairs, in both directions, and deletes
+        their entries from the switches. Returns the number of flow-mods sent
+        """
+        flow_mods = 0
+        for mac1, mac2 in pairs:
+            for src, dst in ((mac1, mac2), (mac2, mac1)):
+                flow_mods += self._update(src, dst, self.index.remove(src, dst), None)
+        if flow_mods:
+            core.FlowShadow.flush()
+        return flow_mods
+
+    def reroute(self, pairs, cause):
+        """
+        Replaces the installed paths of the given (source MAC, destination MAC) pairs
+        """
+        if not pairs:
+            return
+        start = time.time()
+
+        # Both directions of a pair are installed together, they are rerouted together
+        unordered = set()
+        for src, dst in pairs:
+            if (dst, src) not in unordered:
+                unordered.add((src, dst))
+
+        unreachable = set()
+        flow_mods = 0
+        deleted = []
+        saved = []
+        for mac1, mac2 in unordered:
+            route = self.select(mac1, mac2)
+            old = self.index.remove(mac1, mac2)
+            old_reverse = self.index.remove(mac2, mac1)
+            deleted.append({"mac1": mac1, "mac2": mac2})
+            if route is None:
+                unreachable.add((mac1, mac2))
+                flow_mods += self._update(mac1, mac2, old, None)
+                flow_mods += self._update(mac2, mac1, old_reverse, None)
+                continue
+            reverse = route.reverse()
+            flow_mods += self._update(mac1, mac2, old, route)
+            flow_mods += self._update(mac2, mac1, old_reverse, reverse)
+            self.index.add(mac1, mac2, route)
+            self.index.add(mac2, mac1, reverse)
+            saved.append((mac1, mac2, route))
+
+        core.FlowShadow.flush()
+        self._store(deleted, saved)
+
+        duration = time.time() - start
+        log.info("{0} failed : {1} paths rerouted, {2} unreachable, {3} flow-mods sent, converged in {4:.2f} ms".format(
+                 cause, len(unordered) - len(unreachable), len(unreachable), flow_mods, duration * 1000))
+        self.raiseEvent(PathsRerouted, cause, unordered, unreachable, flow_mods, duration)
+
+    def _update(self, src, dst, old, new):
+        """
+        Queues in the FlowShadow the flow-mods turning the entries of the old route into the ones
+        of the new one, only for the switches whose entry changes. Returns the number of flow-mods queued
+        """
+        old_ports = dict(zip(old.switches, [int(port) for port in old.out_ports])) if old is not None else {}
+        new_ports = dict(zip(new.switches, [int(port) for port in new.out_ports])) if new is not None else {}
+        sent = 0
+        for dpid in set(old_ports) | set(new_ports):
+            if old_ports.get(dpid) == new_ports.get(dpid):
+                continue
+            if dpid not in new_ports:
+                queued = core.FlowShadow.delete(dpid, self._flowMod(of.OFPFC_DELETE_STRICT, src, dst))
+            elif dpid not in old_ports:
+                queued = core.FlowShadow.install(dpid, self._flowMod(of.OFPFC_ADD, src, dst, new_ports[dpid], self.timeouts))
+            else:
+                # A matching entry keeps its timeouts, they are only used if it expired in the meantime
+                queued = core.FlowShadow.install(dpid, self._flowMod(of.OFPFC_MODIFY_STRICT, src, dst, new_ports[dpid], self.timeouts))
+            if queued:
+                sent += 1
+        return sent
+
+    @staticmethod
+    def _flowMod(command, src, dst, port=None, timeouts=(0, 0)):
+        """
+        Flow-mod matching the entries installed by GoxForwarding for the src -> dst traffic,
+        with the given (idle, hard) timeouts
+        """
+        msg = of.ofp_flow_mod(command=command)
+        msg.idle_timeout = timeouts[0]
+        msg.hard_timeout = timeouts[1]
+        msg.match = of.ofp_match()
+        msg.match.dl_src = EthAddr(src)
+        msg.match.dl_dst = EthAddr(dst)
+        if port is not None:
+            msg.actions.append(of.ofp_action_output(port=port))
+        return msg
+
+    def _store(self, deleted, saved):
+        """
+        Deletes the Path_to relationships of the rerouted pairs and stores their replacements
+        """
+        if core.hasComponent("TopologyWriter"):
+            for row in deleted:
+                core.TopologyWriter.delPath(row["mac1"], row["mac2"])
+            for mac1, mac2, route in saved:
+                core.TopologyWriter.savePath(mac1, mac2, route)
+        else:
+            # After the mutations of the DatabaseInstance, which creates the hosts
+            core.DatabaseExecutor.run("topology.delPath", {"rows": deleted}, key=DB_KEY)
+            if saved:
+                core.DatabaseExecutor.run("topology.savePath", {"rows": [gox_writer.pathRow(*path) for path in saved]}, key=DB_KEY)
+
+
+def launch():
+    print("gox_reroute is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
@@ -0,0 +1,503 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process shortest path computation for GOX applications
+
+The `RoutingEngine` class computes the shortest path between two hosts on the adjacency
+of the `TopologyMirror` kept by `NetworkEventHandler`, without querying neo4j.
+Links have a weight of 1 (hop count) unless another one is given with `setWeight`.
+
+For every destination switch, the engine keeps a `ShortestPathTree` giving the next hop
+of every other switch towards it. Trees are built with Dijkstra's algorithm the first time a path
+towards their root is asked, then updated incrementally when the topology mirror reports
+a link change: only the trees using a removed link are repaired, and only in the subtree
+below that link. The switches and host pairs whose path changed are reported with a RoutesChanged event.
+
+Between switches connected by several shortest paths of the same cost, such as the pods of a fat-tree,
+`multiPath` enumerates up to k of them and picks one by hashing the host pair, or the least loaded one
+according to a load function, such as the one of the `PortStatsCollector`.
+
+A path is returned as a `Route`, with the same switches/in_ports/out_ports lists as the
+Path_to relationships stored in the database. The `RouteCache` class keeps the most recently
+used routes between host pairs.
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+
+from collections import OrderedDict
+import heapq
+import zlib
+
+log = core.getLogger()
+
+INFINITY = float("inf")
+EPSILON = 1e-9      # Tolerance of the comparison of path costs, weights can be floats
+
+class Route(object):
+    """
+    Path between two hosts. For every switch of the path, in_ports and out_ports
+    give the port the packets come from and the port they are sent to
+    """
+
+    def __init__(self, switches, in_ports, out_ports):
+        self.switches = switches
+        self.in_ports = in_ports
+        self.out_ports = out_ports
+
+    def reverse(self):
+        """
+        Returns the route followed by the packets going the other way
+        """
+        return Route(self.switches[::-1], self.out_ports[::-1], self.in_ports[::-1])
+
+    def __len__(self):
+        return len(self.switches)
+
+    def __eq__(self, other):
+        return (isinstance(other, Route) and self.switches == other.switches
+                and self.in_ports == other.in_ports and self.out_ports == other.out_ports)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Route({0}, in_ports={1}, out_ports={2})".format(self.switches, self.in_ports, self.out_ports)
+
+
+class RouteCache(object):
+    """
+    Bounded cache of routes keyed by (source MAC, destination MAC), evicting the least recently used one
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.routes = OrderedDict()     # (src mac, dst mac) -> Route, least recently used first
+        self.by_host = {}               # mac -> set of (src mac, dst mac)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, src, dst):
+        route = self.routes.get((src, dst))
+        if route is None:
+            self.misses += 1
+            return None
+        self.routes.move_to_end((src, dst))
+        self.hits += 1
+        return route
+
+    def put(self, src, dst, route):
+        pair = (src, dst)
+        self.routes[pair] = route
+        self.routes.move_to_end(pair)
+        self.by_host.setdefault(src, set()).add(pair)
+        self.by_host.setdefault(dst, set()).add(pair)
+        while len(self.routes) > self.size:
+            self._remove(next(iter(self.routes)))
+            self.evictions += 1
+
+    def invalidate(self, src, dst):
+        if (src, dst) in self.routes:
+            self._remove((src, dst))
+
+    def invalidateHost(self, mac):
+        for pair in list(self.by_host.get(mac, ())):
+            self._remove(pair)
+
+    def clear(self):
+        self.routes.clear()
+        self.by_host.clear()
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.routes), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0}
+
+    def _remove(self, pair):
+        del self.routes[pair]
+        for mac in pair:
+            pairs = self.by_host.get(mac)
+            if pairs is not None:
+                pairs.discard(pair)
+                if not pairs:
+                    del self.by_host[mac]
+
+    def __len__(self):
+        return len(self.routes)
+
+
+class RoutesChanged(Event):
+    """
+    Raised when shortest paths changed, after a link or weight change.
+    trees maps the root of every changed tree to the switches whose path towards it changed,
+    pairs is the set of (source MAC, destination MAC) whose path changed
+    """
+    def __init__(self, trees, pairs):
+        Event.__init__(self)
+        self.trees = trees
+        self.pairs = pairs
+
+
+class ShortestPathTree(object):
+    """
+    Shortest paths from every reachable switch to the root switch
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.distances = {root: 0}
+        self.next_port = {}         # dpid -> port towards the root
+        self.parent = {}            # dpid -> switch reached through next_port
+        self.children = {root: set()}
+
+    def attach(self, dpid, port, parent, distance):
+        self.detach(dpid)
+        self.distances[dpid] = distance
+        self.next_port[dpid] = port
+        self.parent[dpid] = parent
+        self.children.setdefault(parent, set()).add(dpid)
+        self.children.setdefault(dpid, set())
+
+    def detach(self, dpid):
+        """
+        Removes the switch from the tree, its children are left in place
+        """
+        parent = self.parent.pop(dpid, None)
+        if parent is not None:
+            self.children[parent].discard(dpid)
+        self.next_port.pop(dpid, None)
+        self.distances.pop(dpid, None)
+
+    def subtree(self, dpid):
+        """
+        Returns the switches whose path to the root goes through dpid, dpid included
+        """
+        nodes = set([dpid])
+        stack = [dpid]
+        while stack:
+            for child in self.children.get(stack.pop(), ()):
+                if child not in nodes:
+                    nodes.add(child)
+                    stack.append(child)
+        return nodes
+
+
+class RoutingEngine(EventMixin):
+
+    _eventMixin_events = set([
+        RoutesChanged,
+    ])
+
+    def __init__(self, topology):
+        self.topology = topology
+        self.weights = {}           # (dpid, port) -> weight of the link leaving dpid by port, 1 if missing
+        self.trees = {}             # root dpid -> ShortestPathTree
+        topology.addListeners(self)
+        log.info("RoutingEngine launched")
+
+    def weight(self, dpid, port):
+        return self.weights.get((dpid, port), 1)
+
+    def setWeight(self, dpid, port, weight):
+        """
+        Changes the weight of the link leaving dpid by port, and updates the trees using it
+        """
+        old = self.weight(dpid, port)
+        if weight == 1:
+            self.weights.pop((dpid, port), None)
+        else:
+            self.weights[(dpid, port)] = weight
+        if weight == old:
+            return
+
+        trees = {}
+        for tree in list(self.trees.values()):
+            if weight > old and tree.next_port.get(dpid) == port:
+                trees[tree.root] = self._repair(tree, dpid)
+            else:
+                trees[tree.root] = self._relax(tree, dpid, port)
+        self._routesChanged(trees)
+
+    def shortestPath(self, mac1, mac2):
+        """
+        Returns the Route from host mac1 to host mac2, or None if they are not connected
+        """
+        src = self.topology.hostLocation(mac1)
+        dst = self.topology.hostLocation(mac2)
+        if src is None or dst is None:
+            return None
+        hops = self.hops(src[0], dst[0])
+        if hops is None:
+            return None
+        return self._route(src, dst, hops)
+
+    def multiPath(self, mac1, mac2, k=4, select="hash", load=None):
+        """
+        Returns a Route from host mac1 to host mac2 among up to k equal-cost shortest paths, or None if they
+        are not connected. select is "hash", which always gives the same path to a host pair and its reverse,
+        or "least-loaded", which picks the path whose busiest link has the lowest load(dpid, port)
+        """
+        src = self.topology.hostLocation(mac1)
+        dst = self.topology.hostLocation(mac2)
+        if src is None or dst is None:
+            return None
+        candidates = self.equalCostHops(src[0], dst[0], k)
+        if not candidates:
+            return None
+        # Rotated by the hash of the pair, so that ties are spread too
+        pair = "{0}-{1}".format(*sorted((mac1, mac2)))
+        first = zlib.crc32(pair.encode("utf-8")) % len(candidates)
+        candidates = candidates[first:] + candidates[:first]
+        if select == "least-loaded" and load is not None and len(candidates) > 1:
+            def cost(hops):
+                loads = [load(dpid, port) for dpid, port in hops]
+                return (max(loads), sum(loads))
+            return self._route(src, dst, min(candidates, key=cost))
+        return self._route(src, dst, candidates[0])
+
+    def _route(self, src, dst, hops):
+        """
+        Returns the Route from the (dpid, port) location src to dst through hops,
+        the list of (dpid, out_port) taken from the switch of src to the switch of dst
+        """
+        switches = [src[0]]
+        in_ports = [src[1]]
+        out_ports = []
+        for dpid, port in hops:
+            peer, peer_port = self.topology.adjacency[dpid][port]
+            out_ports.append(port)
+            switches.append(peer)
+            in_ports.append(peer_port)
+        out_ports.append(dst[1])
+        return Route(switches, in_ports, out_ports)
+
+    def hops(self, src, dst):
+        """
+        Returns the list of (dpid, out_port) taken from switch src to switch dst, or None
+        """
+        tree = self.tree(dst)
+        if src not in tree.distances:
+            return None
+        hops = []
+        dpid = src
+        while dpid != dst:
+            hops.append((dpid, tree.next_port[dpid]))
+            dpid = tree.parent[dpid]
+        return hops
+
+    def nextHops(self, tree, dpid):
+        """
+        Returns the (port, switch) pairs starting a shortest path from dpid to the root of the tree,
+        the next hop of the tree first
+        """
+        distance = tree.distances[dpid]
+        hops = [(port, peer) for port, peer in self._outgoing(dpid)
+                if abs(tree.distances.get(peer, INFINITY) + self.weight(dpid, port) - distance) < EPSILON]
+        return sorted(hops, key=lambda hop: (hop[0] != tree.next_port.get(dpid), hop[0]))
+
+    def equalCostHops(self, src, dst, k=4):
+        """
+        Returns up to k lists of (dpid, out_port) taken from switch src to switch dst along shortest paths
+        """
+        tree = self.tree(dst)
+        if src not in tree.distances:
+            return []
+        paths = []
+        hops = []
+        def walk(dpid):
+            if dpid == dst:
+                paths.append(list(hops))
+                return
+            for port, peer in self.nextHops(tree, dpid):
+                if len(paths) >= k:
+                    return
+                hops.append((dpid, port))
+                walk(peer)
+                hops.pop()
+        walk(src)
+        return paths
+
+    def tree(self, root):
+        """
+        Returns the shortest path tree towards the switch root, built on first use
+        """
+        tree = self.trees.get(root)
+        if tree is None:
+            tree = ShortestPathTree(root)
+            self._grow(tree, [(0, root)])
+            self.trees[root] = tree
+        return tree
+
+    def hostsAt(self, dpid):
+        """
+        Returns the MAC addresses of the hosts attached to the switch
+        """
+        hosts = self.topology.hosts
+        return [peer for peer, _ in self.topology.adjacency.get(dpid, {}).values() if peer in hosts]
+
+    def _incoming(self, dpid):
+        """
+        Yields the (switch, port) pairs that send packets to dpid
+        """
+        switches = self.topology.switches
+        for peer, peer_port in self.topology.adjacency.get(dpid, {}).values():
+            if peer in switches:
+                yield peer, peer_port
+
+    def _outgoing(self, dpid):
+        """
+        Yields the (port, switch) pairs dpid can send packets to
+        """
+        switches = self.topology.switches
+        for port, (peer, _) in self.topology.adjacency.get(dpid, {}).items():
+            if peer in switches:
+                yield port, peer
+
+    def _grow(self, tree, heap, allowed=None):
+        """
+        Dijkstra's algorithm towards the root, from the switches already in the heap.
+        Only the switches in allowed are updated, if given. Returns the updated switches
+        """
+        updated = set()
+        heapq.heapify(heap)
+        while heap:
+            distance, dpid = heapq.heappop(heap)
+            if distance > tree.distances.get(dpid, INFINITY):
+                continue
+            for peer, peer_port in self._incoming(dpid):
+                if allowed is not None and peer not in allowed:
+                    continue
+                new_distance = distance + self.weight(peer, peer_port)
+                if new_distance < tree.distances.get(peer, INFINITY):
+                    tree.attach(peer, peer_port, dpid, new_distance)
+                    updated.add(peer)
+                    heapq.heappush(heap, (new_distance, peer))
+        return updated
+
+    def _repair(self, tree, dpid):
+        """
+        Recomputes the paths of the subtree below dpid, whose link towards the root was removed
+        or got more expensive. Returns the switches of the subtree
+        """
+        subtree = tree.subtree(dpid)
+        for node in subtree:
+            tree.detach(node)
+
+        # Reattach every switch of the subtree to its best neighbour outside of it, then
+        # propagate these distances inside the subtree
+        heap = []
+        for node in subtree:
+            best = None
+            for port, peer in self._outgoing(node):
+                if peer in subtree or peer not in tree.distances:
+                    continue
+                distance = tree.distances[peer] + self.weight(node, port)
+                if best is None or distance < best[0]:
+                    best = (distance, port, peer)
+            if best is not None:
+                tree.attach(node, best[1], best[2], best[0])
+                heap.append((best[0], node))
+        self._grow(tree, heap, subtree)
+        return subtree
+
+    def _relax(self, tree, dpid, port):
+        """
+        Uses the link leaving dpid by port if it gives a shorter path towards the root.
+        Returns the switches whose path changed
+        """
+        peer = self.topology.adjacency.get(dpid, {}).get(port, (None, None))[0]
+        if peer not in tree.distances or dpid == tree.root:
+            return set()
+        distance = tree.distances[peer] + self.weight(dpid, port)
+        if distance >= tree.distances.get(dpid, INFINITY):
+            return set()
+        tree.attach(dpid, port, peer, distance)
+        updated = self._grow(tree, [(distance, dpid)])
+        updated.add(dpid)
+        # The switches below the updated ones kept their next hop, but their path changed too
+        changed = set()
+        for node in updated:
+            if node not in changed:
+                changed |= tree.subtree(node)
+        return changed
+
+    def _pairs(self, tree, changed):
+        """
+        Returns the host pairs whose path towards the root of the tree goes through the changed switches
+        """
+        if not changed:
+            return set()
+        destinations = self.hostsAt(tree.root)
+        if not destinations:
+            return set()
+        pairs = set()
+        for dpid in changed:
+            for src in self.hostsAt(dpid):
+                for dst in destinations:
+                    pairs.add((src, dst))
+        return pairs
+
+    def _routesChanged(self, trees):
+        trees = dict((root, changed) for root, changed in trees.items() if changed)
+        if not trees:
+            return
+        pairs = set()
+        for root, changed in trees.items():
+            pairs |= self._pairs(self.trees[root], changed)
+        log.debug("Shortest paths of {0} trees and {1} host pairs changed".format(len(trees), len(pairs)))
+        self.raiseEvent(RoutesChanged, trees, pairs)
+
+    def _isSwitchLink(self, event):
+        switches = self.topology.switches
+        return event.dpid1 in switches and event.dpid2 in switches
+
+    def _handle_LinkUp(self, event):
+        if not self._isSwitchLink(event):
+            return
+        trees = {}
+        for tree in list(self.trees.values()):
+            changed = self._relax(tree, event.dpid1, event.port1)
+            changed |= self._relax(tree, event.dpid2, event.port2)
+            trees[tree.root] = changed
+        self._routesChanged(trees)
+
+    def _handle_LinkDown(self, event):
+        if not self._isSwitchLink(event):
+            return
+        trees = {}
+        for tree in list(self.trees.values()):
+            changed = set()
+            # Only the trees using the link are repaired
+            if tree.next_port.get(event.dpid1) == event.port1:
+                changed |= self._repair(tree, event.dpid1)
+            if tree.next_port.get(event.dpid2) == event.port2:
+                changed |= self._repair(tree, event.dpid2)
+            trees[tree.root] = changed
+        self._routesChanged(trees)
+
+    def _handle_SwitchLeave(self, event):
+        # Its links are already down, so it is not part of any other tree
+        self.trees.pop(event.dpid, None)
+        for tree in self.trees.values():
+            tree.detach(event.dpid)
+            tree.children.pop(event.dpid, None)
+        for key in [key for key in self.weights if key[0] == event.dpid]:
+            del self.weights[key]
+
+
+def launch():
+    print("gox_routing is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
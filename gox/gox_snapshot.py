@@ -0,0 +1,243 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact snapshot file of the topology built by GOX
+
+A snapshot stores the switches, hosts, links with their ports and the installed paths in flat arrays of
+little-endian 32-bit integers, so that it can be memory-mapped and read without parsing:
+
+    header      magic "GOXS", version, then the size of every section
+    names       dpids, MAC and IP addresses, UTF-8, separated by NUL bytes. Other sections refer to their index
+    switches    name
+    hosts       mac name, ip name
+    links       name1, port1, name2, port2 (once per link, hosts use the port 0)
+    paths       mac1 name, mac2 name, first hop, number of hops
+    hops        switch name, in port, out port
+
+`write` saves a snapshot atomically and `Snapshot` reads one. When run by POX, the `TopologySnapshot` component
+writes the topology of GOX periodically and when POX goes down. This module can also be imported without POX,
+by offline tools, or executed to print the content of a snapshot:
+
+    python gox_snapshot.py topology.snap
+"""
+
+try:
+    from pox.core import core
+    log = core.getLogger()
+except ImportError:     # Offline use, without POX
+    import logging
+    core = None
+    log = logging.getLogger("gox_snapshot")
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"GOXS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIIIII")    # magic, version, reserved, names size, then the number of names,
+                                          # switches, hosts, links, paths and hops
+INT = 4
+
+class SnapshotError(Exception):
+    pass
+
+
+def write(filename, switches, hosts, links, paths):
+    """
+    Writes a snapshot. hosts maps MAC addresses to IP addresses, links are (name1, port1, name2, port2)
+    tuples given once per link, paths map (mac1, mac2) pairs to routes with switches, in_ports and out_ports
+    """
+    names = {}
+    def name(value):
+        index = names.get(value)
+        if index is None:
+            index = names[value] = len(names)
+        return index
+
+    switch_ids = [name(dpid) for dpid in switches]
+    host_ids = []
+    for mac, ip in hosts.items():
+        host_ids += (name(mac), name(ip))
+    link_ids = []
+    for name1, port1, name2, port2 in links:
+        link_ids += (name(name1), int(port1), name(name2), int(port2))
+    path_ids = []
+    hop_ids = []
+    for (mac1, mac2), route in paths.items():
+        path_ids += (name(mac1), name(mac2), len(hop_ids) // 3, len(route.switches))
+        for dpid, in_port, out_port in zip(route.switches, route.in_ports, route.out_ports):
+            hop_ids += (name(dpid), int(in_port), int(out_port))
+
+    blob = "\0".join(names).encode("utf-8")
+    blob += b"\0" * (-len(blob) % INT)      # Keeps the arrays aligned
+
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(blob), len(names), len(switch_ids),
+                            len(host_ids) // 2, len(link_ids) // 4, len(path_ids) // 4, len(hop_ids) // 3))
+        f.write(blob)
+        for ids in (switch_ids, host_ids, link_ids, path_ids, hop_ids):
+            f.write(struct.pack("<{}I".format(len(ids)), *ids))
+        # On disk before the rename, so that a crash never leaves a partial snapshot under filename
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, filename)
+
+
+class Snapshot(object):
+    """
+    Memory-mapped snapshot. The arrays of the sections are available as memoryviews of integers
+    (switch_ids, host_ids, link_ids, path_ids, hop_ids), names as a list of strings
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:     # An empty file cannot be mapped
+                raise SnapshotError("{} is not a GOX snapshot".format(filename))
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, _, names_size, self.n_names, self.n_switches,
+         self.n_hosts, self.n_links, self.n_paths, self.n_hops) = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotError("{} is not a GOX snapshot".format(filename))
+        if self.version != VERSION:
+            self.close()
+            raise SnapshotError("Snapshot version {0} of {1} is not supported".format(self.version, filename))
+        expected = HEADER.size + names_size + INT * (self.n_switches + 2 * self.n_hosts + 4 * self.n_links
+                                                     + 4 * self.n_paths + 3 * self.n_hops)
+        if size < expected:
+            self.close()
+            raise SnapshotError("Snapshot {0} is truncated ({1} bytes instead of {2})".format(filename, size, expected))
+
+        self.view = memoryview(self.mmap)
+        offset = HEADER.size
+        names = bytes(self.view[offset:offset + names_size]).rstrip(b"\0")
+        self.names = names.decode("utf-8").split("\0") if self.n_names else []
+        offset += names_size
+        self.arrays = []
+        for width, count in ((1, self.n_switches), (2, self.n_hosts), (4, self.n_links), (4, self.n_paths), (3, self.n_hops)):
+            self.arrays.append(self._array(offset, width * count))
+            offset += width * count * INT
+        self.switch_ids, self.host_ids, self.link_ids, self.path_ids, self.hop_ids = self.arrays
+
+    def _array(self, offset, count):
+        data = self.view[offset:offset + count * INT]
+        if sys.byteorder == "little":
+            return data.cast("I")
+        import array
+        values = array.array("I", data.tobytes())
+        values.byteswap()
+        return memoryview(values)
+
+    def switches(self):
+        names = self.names
+        return list(map(names.__getitem__, self.switch_ids.tolist()))
+
+    def hosts(self):
+        names = self.names
+        ids = self.host_ids.tolist()
+        return dict((names[mac], names[ip]) for mac, ip in zip(ids[0::2], ids[1::2]))
+
+    def links(self):
+        names = self.names
+        ids = self.link_ids.tolist()
+        return list(zip(map(names.__getitem__, ids[0::4]), ids[1::4], map(names.__getitem__, ids[2::4]), ids[3::4]))
+
+    def paths(self):
+        """
+        Returns the (mac1, mac2, switches, in_ports, out_ports) tuples of the stored paths
+        """
+        names = self.names
+        ids = self.path_ids.tolist()
+        hops = self.hop_ids.tolist()
+        paths = []
+        for mac1, mac2, first, count in zip(ids[0::4], ids[1::4], ids[2::4], ids[3::4]):
+            hop = hops[first * 3:(first + count) * 3]
+            paths.append((names[mac1], names[mac2], [names[i] for i in hop[0::3]], hop[1::3], hop[2::3]))
+        return paths
+
+    def record(self):
+        """
+        Returns the content of the snapshot in the format of the "warmstart.load" query of gox_warmstart
+        """
+        return {"switches": self.switches(),
+                "hosts": [{"mac": mac, "ip": ip} for mac, ip in self.hosts().items()],
+                "links": [{"name1": n1, "port1": p1, "name2": n2, "port2": p2} for n1, p1, n2, p2 in self.links()],
+                "paths": [{"mac1": mac1, "mac2": mac2, "switches": switches, "in_ports": in_ports, "out_ports": out_ports}
+                          for mac1, mac2, switches, in_ports, out_ports in self.paths()]}
+
+    def close(self):
+        for array in getattr(self, "arrays", []):
+            array.release()
+        self.arrays = []
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TopologySnapshot(object):
+    """
+    Writes the topology mirror of NetworkEventHandler and the paths installed by the applications
+    to a snapshot file, every interval seconds (0 disables it) and when POX goes down
+    """
+
+    def __init__(self, filename, topology, interval=60):
+        from pox.lib.recoco import Timer
+        self.filename = filename
+        self.topology = topology
+        if interval:
+            self.timer = Timer(interval, self.save, recurring=True)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("TopologySnapshot launched, writing to {}".format(filename))
+
+    def save(self):
+        start = time.time()
+        topology = self.topology
+        links = [end1 + end2 for end1, end2 in topology.links.items() if end1 < end2]
+        paths = core.Rerouter.index.routes if core.hasComponent("Rerouter") else {}
+        try:
+            write(self.filename, topology.switches, topology.hosts, links, paths)
+        except (IOError, OSError):
+            log.exception("Impossible to write the snapshot {}".format(self.filename))
+            return
+        log.debug("Snapshot of {0} switches, {1} hosts, {2} links and {3} paths written in {4:.2f} ms".format(
+                  len(topology.switches), len(topology.hosts), len(links), len(paths), (time.time() - start) * 1000))
+
+    def _handle_GoingDownEvent(self, event):
+        self.save()
+
+
+def launch():
+    print("gox_snapshot is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
+
+
+if __name__ == "__main__":
+    start = time.time()
+    with Snapshot(sys.argv[1]) as snapshot:
+        links = snapshot.links()
+        print("{0}: version {1}, {2} switches, {3} hosts, {4} links, {5} paths, loaded in {6:.2f} ms".format(
+              sys.argv[1], snapshot.version, snapshot.n_switches, snapshot.n_hosts, len(links),
+              snapshot.n_paths, (time.time() - start) * 1000))
@@ -0,0 +1,214 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Loop-free flooding over a spanning tree of the switches
+
+The `SpanningTree` class keeps a spanning tree of every connected group of switches of the topology mirror,
+updated incrementally with its LinkUp and LinkDown events:
+
+* a new link joining two groups becomes a tree link, any other new link is left out of the tree,
+* when a tree link goes down, a link reconnecting both sides, if any, replaces it.
+
+The ports of the links left out of the tree are configured with OFPPC_NO_FLOOD, so that OFPP_FLOOD only
+sends packets along the tree and to the hosts. As discovery needs some time to find the links of a new switch,
+all its ports are kept out of flooding during hold_down seconds: by default two LLDP cycles, so that a link
+whose first LLDP packet is lost is still found before its ports flood.
+
+With flood_entries, every switch also gets an entry flooding broadcast frames itself,
+so that they do not go through the controller. The ARP proxy of the L2 application keeps receiving
+the ARP requests with an entry of higher priority.
+"""
+
+from pox.core import core
+from pox.lib.util import dpid_to_str, str_to_dpid
+from pox.lib.addresses import EthAddr
+import pox.openflow.libopenflow_01 as of
+
+log = core.getLogger()
+
+BROADCAST = EthAddr("ff:ff:ff:ff:ff:ff")
+LLDP_CYCLE = 5          # Seconds in which openflow.discovery sends an LLDP packet on every port, by default
+
+class SpanningTree(object):
+
+    def __init__(self, topology, hold_down=2 * LLDP_CYCLE, flood_entries=True):
+        self.topology = topology
+        self.hold_down = hold_down
+        self.flood_entries = flood_entries
+        self.tree = {}              # dpid -> {port: peer dpid} of the tree links
+        self.blocked = set()        # (dpid, port) configured with OFPPC_NO_FLOOD
+        self.held = {}              # dpid -> ports kept out of flooding until discovery found their links
+        self.port_mods = 0
+
+        self._build()
+        topology.addListeners(self)
+        core.listen_to_dependencies(self)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("SpanningTree launched")
+
+    def _build(self):
+        """
+        Builds the tree of the links already in the mirror, loaded by a warm start or provisioned
+        """
+        groups = {}
+        def find(dpid):
+            while groups.get(dpid, dpid) != dpid:
+                groups[dpid] = groups.get(groups[dpid], groups[dpid])
+                dpid = groups[dpid]
+            return dpid
+        switches = self.topology.switches
+        for (dpid1, port1), (dpid2, port2) in sorted(self.topology.links.items()):
+            if dpid1 not in switches or dpid2 not in switches:
+                continue
+            root1, root2 = find(dpid1), find(dpid2)
+            if root1 != root2:
+                groups[root1] = root2
+                self._addTreeLink(dpid1, port1, dpid2, port2)
+
+    def _isSwitchLink(self, event):
+        return event.dpid1 in self.topology.switches and event.dpid2 in self.topology.switches
+
+    def group(self, dpid):
+        """
+        Returns the switches connected to dpid through tree links
+        """
+        seen = set([dpid])
+        stack = [dpid]
+        while stack:
+            for peer in self.tree.get(stack.pop(), {}).values():
+                if peer not in seen:
+                    seen.add(peer)
+                    stack.append(peer)
+        return seen
+
+    def inTree(self, dpid, port):
+        return int(port) in self.tree.get(dpid, {})
+
+    def shouldFlood(self, dpid, port):
+        """
+        Returns True if OFPP_FLOOD should send packets to the port: tree links, and ports without a link to a switch
+        """
+        peer = self.topology.adjacency.get(dpid, {}).get(int(port))
+        if peer is None or peer[0] not in self.topology.switches:
+            return True
+        return self.inTree(dpid, port)
+
+    def _addTreeLink(self, dpid1, port1, dpid2, port2):
+        self.tree.setdefault(dpid1, {})[int(port1)] = dpid2
+        self.tree.setdefault(dpid2, {})[int(port2)] = dpid1
+
+    def _handle_LinkUp(self, event):
+        if not self._isSwitchLink(event):
+            return
+        if event.dpid2 not in self.group(event.dpid1):
+            self._addTreeLink(event.dpid1, event.port1, event.dpid2, event.port2)
+        self._update(event.dpid1, event.port1)
+        self._update(event.dpid2, event.port2)
+
+    def _handle_LinkDown(self, event):
+        dpid1, port1, dpid2, port2 = event.dpid1, int(event.port1), event.dpid2, int(event.port2)
+        if self.inTree(dpid1, port1):
+            del self.tree[dpid1][port1]
+            del self.tree[dpid2][port2]
+            replacement = self._reconnect(self.group(dpid1))
+            if replacement is not None:
+                self._addTreeLink(*replacement)
+                log.info("Tree link {0}.{1} <-> {2}.{3} replaced by {4}.{5} <-> {6}.{7}".format(
+                         dpid1, port1, dpid2, port2, *replacement))
+                self._update(replacement[0], replacement[1])
+                self._update(replacement[2], replacement[3])
+        # Without a link, the ports are edge ports
+        for dpid, port in ((dpid1, port1), (dpid2, port2)):
+            if dpid in self.topology.switches:
+                self._update(dpid, port)
+
+    def _reconnect(self, side):
+        """
+        Returns a link between a switch of side and a switch out of it, or None
+        """
+        for dpid in sorted(side):
+            for port, (peer, peer_port) in sorted(self.topology.adjacency.get(dpid, {}).items()):
+                if peer in self.topology.switches and peer not in side:
+                    return (dpid, port, peer, peer_port)
+        return None
+
+    def _handle_SwitchLeave(self, event):
+        # Its links went down before
+        self.tree.pop(event.dpid, None)
+
+    def _update(self, dpid, port):
+        """
+        Configures the flooding of the port according to the tree
+        """
+        if int(port) in self.held.get(dpid, ()):
+            return  # Configured once discovery had time to find its link
+        self._setFlood(dpid, int(port), self.shouldFlood(dpid, port))
+
+    def _setFlood(self, dpid, port, flood, force=False):
+        if not force and flood == ((dpid, port) not in self.blocked):
+            return
+        connection = core.openflow.getConnection(str_to_dpid(dpid))
+        if connection is None:
+            return
+        try:
+            hw_addr = connection.ports[port].hw_addr
+        except KeyError:
+            return
+        if flood:
+            self.blocked.discard((dpid, port))
+        else:
+            self.blocked.add((dpid, port))
+        msg = of.ofp_port_mod(port_no = port, hw_addr = hw_addr,
+                              config = 0 if flood else of.OFPPC_NO_FLOOD, mask = of.OFPPC_NO_FLOOD)
+        connection.send(msg)
+        self.port_mods += 1
+
+    def _handle_openflow_ConnectionUp(self, event):
+        dpid = dpid_to_str(event.dpid)
+        ports = [port.port_no for port in event.ofp.ports if port.port_no < of.OFPP_MAX]
+        if self.hold_down:
+            for port in ports:
+                self._setFlood(dpid, port, False, force=True)
+            self.held[dpid] = set(ports)
+            core.callDelayed(self.hold_down, self._release, dpid, event.connection)
+        else:
+            for port in ports:
+                self._setFlood(dpid, port, self.shouldFlood(dpid, port), force=True)
+
+        if self.flood_entries:
+            msg = of.ofp_flow_mod()
+            msg.match = of.ofp_match(dl_dst = BROADCAST)
+            msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
+            core.FlowShadow.install(dpid, msg, True)
+            core.FlowShadow.flush()
+
+    def _release(self, dpid, connection):
+        if core.openflow.getConnection(str_to_dpid(dpid)) is not connection:
+            return  # Reconnected meanwhile
+        for port in self.held.pop(dpid, ()):
+            self._setFlood(dpid, port, self.shouldFlood(dpid, port))
+
+    def _handle_openflow_ConnectionDown(self, event):
+        dpid = dpid_to_str(event.dpid)
+        self.held.pop(dpid, None)
+        self.blocked = set(entry for entry in self.blocked if entry[0] != dpid)
+
+    def _handle_GoingDownEvent(self, event):
+        links = sum(len(ports) for ports in self.tree.values()) // 2
+        log.info("SpanningTree: {0} tree links, {1} ports out of flooding, {2} port-mods sent".format(links, len(self.blocked), self.port_mods))
+
+
+def launch():
+    print("gox_spanning is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
@@ -0,0 +1,160 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Link load from the port statistics of the switches
+
+Every interval seconds, the `PortStatsCollector` requests the statistics of all the ports of every switch,
+one request per switch. From the transmitted bytes of two consecutive replies, it computes the load of every
+link leaving a switch, in bits per second, and its utilization, relative to the current speed of the port
+(or to link_capacity Mbps if the switch does not report it).
+
+The load of the links is available in memory with `load`, and written to the load and utilization
+properties of their Connected_to relationships, in a single statement per poll.
+
+With congestion_weight, the weight of every link in the `RoutingEngine` becomes its base weight multiplied by
+1 + congestion_weight * utilization, rounded to a tenth, so that shortest paths avoid busy links. The base weight
+is the one the link had when it was first measured, 1 or the weight given by gox_loader's provisioning.
+"""
+
+from pox.core import core
+from pox.lib.util import dpid_to_str
+from pox.lib.recoco import Timer
+import pox.openflow.libopenflow_01 as of
+
+import gox_queries
+from gox_executor import DB_KEY
+import time
+
+log = core.getLogger()
+
+gox_queries.register("stats.setLinkLoads", '''
+        UNWIND $rows AS row
+        MATCH (:Switch {dpid: row.dpid})-[r:Connected_to {orig_port: row.port}]->(:Switch)
+        SET r.load = row.load,
+            r.utilization = row.utilization,
+            r.weight = row.weight
+        ''')
+
+# Speed in Mbps of the OFPPF_* flags of the current features of a port
+SPEEDS = ((of.OFPPF_10GB_FD, 10000), (of.OFPPF_1GB_FD, 1000), (of.OFPPF_1GB_HD, 1000),
+          (of.OFPPF_100MB_FD, 100), (of.OFPPF_100MB_HD, 100), (of.OFPPF_10MB_FD, 10), (of.OFPPF_10MB_HD, 10))
+
+def portSpeed(port, default):
+    """
+    Returns the speed in bits per second of an ofp_phy_port, or default Mbps if it does not report one
+    """
+    for flag, mbps in SPEEDS:
+        if port.curr & flag:
+            return mbps * 1000000
+    return default * 1000000
+
+
+class PortStatsCollector(object):
+
+    def __init__(self, topology, routing_engine, executor, interval=10, link_capacity=1000, congestion_weight=0):
+        self.topology = topology
+        self.routing_engine = routing_engine
+        self.executor = executor
+        self.link_capacity = link_capacity
+        self.congestion_weight = congestion_weight
+        self.speeds = {}            # (dpid, port) -> speed in bits per second
+        self.counters = {}          # (dpid, port) -> (tx_bytes, time of the reply)
+        self.loads = {}             # (dpid, port) -> (load in bits per second, utilization)
+        self.bases = {}             # (dpid, port) -> weight of the link before congestion
+        self.rows = {}              # (dpid, port) -> parameters of "stats.setLinkLoads" not written yet
+        self.polls = 0
+        self.replies = 0
+
+        core.listen_to_dependencies(self)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        self.timer = Timer(interval, self.poll, recurring=True)
+        log.info("PortStatsCollector launched, polling every {}s".format(interval))
+
+    def load(self, dpid, port):
+        """
+        Returns the load in bits per second of the link leaving dpid by port, 0 if unknown
+        """
+        return self.loads.get((dpid, int(port)), (0, 0.0))[0]
+
+    def utilization(self, dpid, port):
+        return self.loads.get((dpid, int(port)), (0, 0.0))[1]
+
+    def poll(self):
+        """
+        Writes the loads computed from the previous replies, and requests the statistics of every switch
+        """
+        self.flush()
+        self.polls += 1
+        for connection in core.openflow.connections:
+            connection.send(of.ofp_stats_request(body=of.ofp_port_stats_request()))
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = list(self.rows.values()), {}
+        self.executor.run("stats.setLinkLoads", {"rows": rows}, key=DB_KEY)
+
+    def _handle_openflow_PortStatsReceived(self, event):
+        self.replies += 1
+        dpid = dpid_to_str(event.dpid)
+        now = time.time()
+        adjacency = self.topology.adjacency.get(dpid, {})
+        switches = self.topology.switches
+        for stats in event.stats:
+            key = (dpid, stats.port_no)
+            previous = self.counters.get(key)
+            self.counters[key] = (stats.tx_bytes, now)
+            if previous is None or now <= previous[1] or stats.tx_bytes < previous[0]:
+                continue    # First reply, or reset counter
+            peer = adjacency.get(stats.port_no)
+            if peer is None or peer[0] not in switches:
+                continue    # Only the links between switches are weighted
+            load = (stats.tx_bytes - previous[0]) * 8 / (now - previous[1])
+            utilization = min(load / self.speeds.get(key, self.link_capacity * 1000000), 1.0)
+            self.loads[key] = (load, utilization)
+            base = self.bases.get(key)
+            if base is None:
+                base = self.bases[key] = self.routing_engine.weight(dpid, stats.port_no)
+            weight = base
+            if self.congestion_weight:
+                weight = base * (1 + round(self.congestion_weight * utilization, 1))
+                self.routing_engine.setWeight(dpid, stats.port_no, weight)
+            self.rows[key] = {"dpid": dpid, "port": str(stats.port_no), "load": load,
+                              "utilization": utilization, "weight": weight}
+
+    def _handle_openflow_ConnectionUp(self, event):
+        dpid = dpid_to_str(event.dpid)
+        for port in event.ofp.ports:
+            self.speeds[(dpid, port.port_no)] = portSpeed(port, self.link_capacity)
+
+    def _handle_openflow_PortStatus(self, event):
+        key = (dpid_to_str(event.dpid), event.port)
+        if event.deleted:
+            self.speeds.pop(key, None)
+        else:
+            self.speeds[key] = portSpeed(event.ofp.desc, self.link_capacity)
+
+    def _handle_openflow_ConnectionDown(self, event):
+        dpid = dpid_to_str(event.dpid)
+        for index in (self.speeds, self.counters, self.loads, self.bases, self.rows):
+            for key in [key for key in index if key[0] == dpid]:
+                del index[key]
+
+    def _handle_GoingDownEvent(self, event):
+        log.info("PortStatsCollector: {0} polls, {1} replies".format(self.polls, self.replies))
+
+
+def launch():
+    print("gox_stats is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
@@ -0,0 +1,197 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bounded lifetime of the Path_to relationships
+
+Every Path_to relationship carries the time it was last used, in milliseconds since the epoch (last_used),
+and the number of times it was installed on the switches (hits). Applications report the use of a path
+with `PathSweeper.touch`, which is only counted in memory: the usage of all the paths is written in a
+single statement at the beginning of every sweep.
+
+Every interval seconds, the `PathSweeper` deletes, by batches of batch host pairs:
+
+1. the paths that were not used during the last ttl seconds,
+2. then the least recently used paths, as long as there are more than max_paths host pairs with a path.
+
+Both directions of a path are always deleted together. A PathsEvicted event reports the evicted pairs,
+so that the applications forget them.
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+from pox.lib.recoco import Timer
+
+import gox_queries
+from gox_executor import DB_KEY
+import time
+
+log = core.getLogger()
+
+gox_queries.register("paths.touch", '''
+        UNWIND $rows AS row
+        MATCH (h1:Host {mac: row.mac1})-[r:Path_to]-(h2:Host {mac: row.mac2})
+        SET r.last_used = CASE WHEN coalesce(r.last_used, 0) > row.last_used THEN r.last_used ELSE row.last_used END,
+            r.hits = coalesce(r.hits, 0) + row.hits
+        ''')
+
+gox_queries.register("paths.expire", '''
+        MATCH (h1:Host)-[r1:Path_to]->(h2:Host)
+        WHERE h1.mac < h2.mac AND coalesce(r1.last_used, 0) < $before
+        WITH h1, h2, r1 LIMIT $limit
+        OPTIONAL MATCH (h2)-[r2:Path_to]->(h1)
+        DELETE r1, r2
+        RETURN h1.mac AS mac1, h2.mac AS mac2
+        ''')
+
+gox_queries.register("paths.count", '''
+        MATCH (h1:Host)-[:Path_to]->(h2:Host)
+        WHERE h1.mac < h2.mac
+        RETURN count(*) AS pairs
+        ''')
+
+gox_queries.register("paths.evictOldest", '''
+        MATCH (h1:Host)-[r1:Path_to]->(h2:Host)
+        WHERE h1.mac < h2.mac
+        WITH h1, h2, r1 ORDER BY coalesce(r1.last_used, 0) LIMIT $limit
+        OPTIONAL MATCH (h2)-[r2:Path_to]->(h1)
+        DELETE r1, r2
+        RETURN h1.mac AS mac1, h2.mac AS mac2
+        ''')
+
+def now():
+    """
+    Returns the current time in milliseconds, as stored in last_used
+    """
+    return int(time.time() * 1000)
+
+
+class PathsEvicted(Event):
+    """
+    Raised after a sweep. pairs is the set of (mac1, mac2) host pairs whose paths were deleted, with mac1 < mac2
+    """
+    def __init__(self, pairs, expired, evicted):
+        Event.__init__(self)
+        self.pairs = pairs
+        self.expired = expired
+        self.evicted = evicted
+
+
+class PathSweeper(EventMixin):
+
+    _eventMixin_events = set([
+        PathsEvicted,
+    ])
+
+    def __init__(self, executor, ttl=3600, max_paths=100000, interval=60, batch=1000):
+        self.executor = executor
+        self.ttl = ttl
+        self.max_paths = max_paths
+        self.batch = batch
+        self.touches = {}           # (mac1, mac2) with mac1 < mac2 -> [last use in ms, hits]
+        self.sweeping = False
+        self.expired = 0
+        self.evicted = 0
+
+        if interval:
+            self.timer = Timer(interval, self.sweep, recurring=True)
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("PathSweeper launched (ttl {0}s, at most {1} paths)".format(ttl, max_paths))
+
+    def touch(self, mac1, mac2):
+        """
+        Records a use of the path between mac1 and mac2
+        """
+        key = (mac1, mac2) if mac1 < mac2 else (mac2, mac1)
+        usage = self.touches.get(key)
+        if usage is None:
+            self.touches[key] = [now(), 1]
+        else:
+            usage[0] = now()
+            usage[1] += 1
+
+    def flushTouches(self):
+        """
+        Writes the usage recorded since the last flush
+        """
+        if not self.touches:
+            return
+        rows = [{"mac1": mac1, "mac2": mac2, "last_used": last_used, "hits": hits}
+                for (mac1, mac2), (last_used, hits) in self.touches.items()]
+        self.touches = {}
+        # Same key as the mutations, so that the paths stored before are updated
+        self.executor.run("paths.touch", {"rows": rows}, key=DB_KEY)
+
+    def sweep(self):
+        """
+        Writes the usage of the paths, then deletes the expired ones and the least recently used ones
+        """
+        self.flushTouches()
+        if self.sweeping:
+            return  # The previous sweep is still running
+        self.sweeping = True
+        self._sweep = {"start": time.time(), "pairs": set(), "expired": 0, "evicted": 0}
+        if self.ttl:
+            self._expire(now() - int(self.ttl * 1000))
+        else:
+            self._count()
+
+    def _expire(self, before):
+        def done(records):
+            self._sweep["pairs"].update((record["mac1"], record["mac2"]) for record in records)
+            self._sweep["expired"] += len(records)
+            if len(records) == self.batch:
+                self._expire(before)
+            else:
+                self._count()
+        self.executor.run("paths.expire", {"before": before, "limit": self.batch}, done, key=DB_KEY, errback=self._failed)
+
+    def _count(self):
+        if not self.max_paths:
+            self._done()
+            return
+        def done(records):
+            self._evict(records[0]["pairs"] - self.max_paths if records else 0)
+        self.executor.run("paths.count", {}, done, key=DB_KEY, errback=self._failed)
+
+    def _evict(self, excess):
+        if excess <= 0:
+            self._done()
+            return
+        def done(records):
+            self._sweep["pairs"].update((record["mac1"], record["mac2"]) for record in records)
+            self._sweep["evicted"] += len(records)
+            self._evict(excess - len(records) if records else 0)
+        self.executor.run("paths.evictOldest", {"limit": min(self.batch, excess)}, done, key=DB_KEY, errback=self._failed)
+
+    def _failed(self, error):
+        log.error("Path sweep failed: {}".format(error))
+        self._done()
+
+    def _done(self):
+        self.sweeping = False
+        sweep = self._sweep
+        self.expired += sweep["expired"]
+        self.evicted += sweep["evicted"]
+        if sweep["pairs"]:
+            log.info("Path sweep: {0} expired and {1} evicted paths deleted in {2:.2f} ms".format(
+                     sweep["expired"], sweep["evicted"], (time.time() - sweep["start"]) * 1000))
+            self.raiseEvent(PathsEvicted, sweep["pairs"], sweep["expired"], sweep["evicted"])
+
+    def _handle_GoingDownEvent(self, event):
+        log.info("PathSweeper: {0} expired and {1} evicted paths".format(self.expired, self.evicted))
+
+
+def launch():
+    print("gox_sweeper is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
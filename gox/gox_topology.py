@@ -0,0 +1,210 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-memory mirror of the topology stored in the neo4j database
+
+The `TopologyMirror` class keeps the switches, hosts and links that GOX wrote to the database,
+so that existence checks can be answered without a round trip to neo4j.
+Its methods use the same names as the ones of `DatabaseInstance` so that both can be used interchangeably.
+
+Switches are identified by their dpid string, hosts by their MAC address string.
+A link is stored in both directions, keyed by (entity, port) pairs. Hosts use the port 0.
+The IP addresses of the hosts are indexed, so that the MAC address bound to an IP address can be found.
+
+Every change of the mirror raises an event (LinkUp, LinkDown, HostJoin...) that GOX components,
+like the `RoutingEngine`, listen to in order to keep their own state up to date.
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+
+log = core.getLogger()
+
+class SwitchJoin(Event):
+    def __init__(self, dpid):
+        Event.__init__(self)
+        self.dpid = dpid
+
+class SwitchLeave(Event):
+    def __init__(self, dpid):
+        Event.__init__(self)
+        self.dpid = dpid
+
+class HostJoin(Event):
+    def __init__(self, mac, ip):
+        Event.__init__(self)
+        self.mac = mac
+        self.ip = ip
+
+class HostLeave(Event):
+    def __init__(self, mac):
+        Event.__init__(self)
+        self.mac = mac
+
+class LinkUp(Event):
+    """
+    Raised once per link, with the ports of both ends. dpid1 is a MAC address for the link of a host
+    """
+    def __init__(self, dpid1, port1, dpid2, port2):
+        Event.__init__(self)
+        self.dpid1 = dpid1
+        self.port1 = port1
+        self.dpid2 = dpid2
+        self.port2 = port2
+
+class LinkDown(Event):
+    def __init__(self, dpid1, port1, dpid2, port2):
+        Event.__init__(self)
+        self.dpid1 = dpid1
+        self.port1 = port1
+        self.dpid2 = dpid2
+        self.port2 = port2
+
+class TopologyMirror(EventMixin):
+
+    _eventMixin_events = set([
+        SwitchJoin,
+        SwitchLeave,
+        HostJoin,
+        HostLeave,
+        LinkUp,
+        LinkDown,
+    ])
+
+    def __init__(self):
+        self.switches = set()       # dpid
+        self.hosts = {}             # mac -> ip
+        self.host_ips = {}          # mac -> set of ips
+        self.ips = {}               # ip -> mac
+        self.links = {}             # (dpid1, port1) -> (dpid2, port2), both directions
+        self.adjacency = {}         # dpid -> {port: (dpid2, port2)}
+
+    def entityExists(self, name):
+        """
+        Returns True if a switch or a host is identified by name
+        """
+        return name in self.switches or name in self.hosts
+
+    def switchExists(self, dpid):
+        return dpid in self.switches
+
+    def hostExists(self, mac):
+        return mac in self.hosts
+
+    def linkExists(self, dpid1, port1, dpid2, port2):
+        return self.links.get((dpid1, int(port1))) == (dpid2, int(port2))
+
+    def addSwitch(self, dpid):
+        self.switches.add(dpid)
+        self.adjacency.setdefault(dpid, {})
+        self.raiseEvent(SwitchJoin, dpid)
+
+    def delSwitch(self, dpid):
+        """
+        Removes the switch and every link it was part of
+        """
+        self._delLinksOf(dpid)
+        if dpid in self.switches:
+            self.switches.discard(dpid)
+            self.raiseEvent(SwitchLeave, dpid)
+
+    def addHost(self, mac, ip):
+        self.hosts[mac] = ip
+        self.adjacency.setdefault(mac, {})
+        self.setHostIps(mac, [ip] if ip.strip() else [])
+        self.raiseEvent(HostJoin, mac, ip)
+
+    def delHost(self, mac):
+        """
+        Removes the host and the link to its switch
+        """
+        self._delLinksOf(mac)
+        if mac in self.hosts:
+            self.setHostIps(mac, [])
+            del self.hosts[mac]
+            del self.host_ips[mac]
+            self.raiseEvent(HostLeave, mac)
+
+    def setHostIps(self, mac, ips):
+        """
+        Binds the given IP addresses to the host, and only them. An IP address bound to another host is moved
+        """
+        ips = set(ips)
+        for ip in self.host_ips.get(mac, set()) - ips:
+            if self.ips.get(ip) == mac:
+                del self.ips[ip]
+        for ip in ips:
+            other = self.ips.get(ip)
+            if other is not None and other != mac:
+                self.host_ips[other].discard(ip)
+                self.hosts[other] = min(self.host_ips[other]) if self.host_ips[other] else " "
+            self.ips[ip] = mac
+        self.host_ips[mac] = ips
+        self.hosts[mac] = min(ips) if ips else " "
+
+    def macOf(self, ip):
+        """
+        Returns the MAC address of the host bound to the IP address, or None
+        """
+        return self.ips.get(ip)
+
+    def addLink(self, dpid1, port1, dpid2, port2):
+        end1 = (dpid1, int(port1))
+        end2 = (dpid2, int(port2))
+        if self.links.get(end1) == end2:
+            return
+        # A port is part of a single link
+        for end in (end1, end2):
+            if end in self.links:
+                self.delLink(end[0], end[1], *self.links[end])
+        self.links[end1] = end2
+        self.links[end2] = end1
+        self.adjacency.setdefault(dpid1, {})[end1[1]] = end2
+        self.adjacency.setdefault(dpid2, {})[end2[1]] = end1
+        self.raiseEvent(LinkUp, dpid1, end1[1], dpid2, end2[1])
+
+    def delLink(self, dpid1, port1, dpid2, port2):
+        end1 = (dpid1, int(port1))
+        end2 = (dpid2, int(port2))
+        if self.links.get(end1) != end2:
+            return
+        del self.links[end1]
+        del self.links[end2]
+        del self.adjacency[dpid1][end1[1]]
+        del self.adjacency[dpid2][end2[1]]
+        self.raiseEvent(LinkDown, dpid1, end1[1], dpid2, end2[1])
+
+    def hostLocation(self, mac):
+        """
+        Returns the (dpid, port) pair the host is attached to, or None
+        """
+        return self.links.get((mac, 0))
+
+    def _delLinksOf(self, name):
+        for port, (peer, peer_port) in list(self.adjacency.get(name, {}).items()):
+            self.delLink(name, port, peer, peer_port)
+        self.adjacency.pop(name, None)
+
+    def reset(self):
+        self.switches.clear()
+        self.hosts.clear()
+        self.host_ips.clear()
+        self.ips.clear()
+        self.links.clear()
+        self.adjacency.clear()
+
+
+def launch():
+    print("gox_topology is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
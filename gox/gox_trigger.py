@@ -19,13 +19,260 @@ The `DatabaseInstance` class contains all information related to the database an
 It also has methods to add or remove some basic components of the basic topology that we provide (hosts, switches, links).
 
 The language used to query neo4j graph databases is Cypher.
+
+Its APOC triggers are installed through GOX's `TriggerRegistry` component, which knows the installed triggers:
+
+* installing a trigger which is already installed with the same statement, phase and parameters does nothing,
+* `pauseAll` suspends every active trigger in a single statement, around bulk operations such as the initial
+  discovery or the reconciliation of a warm start, and `resumeAll` resumes them in a single transaction which
+  also runs their catch-up statement, applying to the whole graph what they missed while they were paused,
+* installations, suspensions and resumptions are timed as the "trigger" series of gox_metrics, and the
+  statements run while triggers are active as the "query_triggered" series.
+
+The trigger procedures are run by the `DatabaseExecutor`, in the worker of `DB_KEY`: in order with the
+topology writes, without sharing a session between threads, and without blocking POX's thread.
 """
 
 from neo4j import GraphDatabase
 from pox.core import core
+from gox_queries import QueryRegistry
+from gox_executor import DB_KEY
+
+import gox_metrics
+import gox_queries
+import threading
+import time
 
 log = core.getLogger()
 
+# Statements run by the triggers. Their values are given in the "params" of the trigger
+SET_CONNECTED_NODES = '''
+                UNWIND apoc.trigger.propertiesByKey($assignedNodeProperties, $surname) AS prop
+                WITH prop.node AS n
+                MATCH (n)-[]-(a)
+                SET a.surname = n.surname
+                '''
+
+# Labels cannot be parameters: the nodes of the old label are matched by a label scan run through APOC,
+# and only in the transactions removing it
+UPDATE_LABELS = '''
+                UNWIND apoc.trigger.nodesByLabel($removedLabels, $oldlabel) AS node
+                CALL apoc.create.addLabels(node, [$newlabel]) YIELD node AS relabeled
+                WITH count(relabeled) AS relabeled WHERE relabeled > 0
+                CALL apoc.cypher.run('MATCH (n:`' + replace($oldlabel, '`', '``') + '`) RETURN n', {}) YIELD value
+                CALL apoc.create.removeLabels(value.n, [$oldlabel]) YIELD node AS renamed
+                CALL apoc.create.addLabels(renamed, [$newlabel]) YIELD node
+                RETURN relabeled + count(node)
+                '''
+
+CONNECT_NEW_HOSTS = '''
+                UNWIND $createdNodes AS n
+                MATCH (h:Host {mac: $mac})
+                WITH n, h WHERE n:Host AND n.mac IN $macs
+                CREATE (n)-[:Connected_to]->(h)
+                '''
+
+CONNECT_NEW_SWITCHES = '''
+                UNWIND $createdNodes AS n
+                MATCH (s:Switch {name: $name})
+                WITH n, s WHERE n:Switch AND n.name IN $names
+                CREATE (n)-[:Connected_to]->(s)
+                '''
+
+# Catch-up statements, applying the triggers to the whole graph once they are resumed.
+# They are run with the params of their trigger
+gox_queries.register("trigger.catchup.setAllConnectedNodes", '''
+        MATCH (n)-[]-(a) WHERE n[$surname] IS NOT NULL
+        SET a.surname = n.surname
+        ''')
+
+gox_queries.register("trigger.catchup.updateLabels", '''
+        CALL apoc.cypher.run('MATCH (n:`' + replace($oldlabel, '`', '``') + '`) RETURN n', {}) YIELD value
+        CALL apoc.create.removeLabels(value.n, [$oldlabel]) YIELD node AS renamed
+        CALL apoc.create.addLabels(renamed, [$newlabel]) YIELD node AS relabeled
+        RETURN count(relabeled)
+        ''')
+
+gox_queries.register("trigger.catchup.connectNewHosts", '''
+        MATCH (h:Host {mac: $mac})
+        MATCH (n:Host) WHERE n.mac IN $macs AND NOT (n)-[:Connected_to]->(h)
+        CREATE (n)-[:Connected_to]->(h)
+        ''')
+
+gox_queries.register("trigger.catchup.connectNewSwitches", '''
+        MATCH (s:Switch {name: $name})
+        MATCH (n:Switch) WHERE n.name IN $names AND NOT (n)-[:Connected_to]->(s)
+        CREATE (n)-[:Connected_to]->(s)
+        ''')
+
+# Trigger name -> catch-up statement, for the triggers installed by a previous run
+CATCHUPS = {
+    "setAllConnectedNodes": "trigger.catchup.setAllConnectedNodes",
+    "updateLabels": "trigger.catchup.updateLabels",
+    "create-rel-new-host": "trigger.catchup.connectNewHosts",
+    "create-rel-new-switch": "trigger.catchup.connectNewSwitches",
+}
+
+
+class TriggerRegistry(object):
+
+    def __init__(self, queries, executor, settle=0):
+        """
+        queries is the QueryRegistry running the trigger procedures, in the DB_KEY worker of the executor:
+        after the topology writes queued before, and never on POX's thread. settle pauses the triggers
+        during the first settle seconds, while discovery finds the topology
+        """
+        self.queries = queries
+        self.executor = executor
+        self.installed = {}         # name -> (statement, selector, params)
+        self.catchups = dict(CATCHUPS)
+        self.paused = set()         # Triggers paused with pause(), left paused by resumeAll()
+        self.suspended = 0          # Nested pauseAll() calls
+        self.load()
+        if settle:
+            self.pauseAll()
+            core.callDelayed(settle, self.resumeAll)
+
+    def load(self):
+        """
+        Reads the triggers installed in the database, waiting for the answer so that they can be paused right away
+        """
+        try:
+            records = self._run("list", "trigger.list", wait=True)
+        except Exception:
+            log.error("Impossible to list the APOC triggers, is APOC installed?")
+            return
+        for record in records:
+            self.installed[record["name"]] = (record["query"], record["selector"], record["params"])
+            if record["paused"]:
+                self.paused.add(record["name"])
+        self._updateTriggered()
+        log.info("TriggerRegistry: {0} triggers installed, {1} paused".format(len(self.installed), len(self.paused)))
+
+    def active(self):
+        """
+        Returns the names of the triggers which run with the statements
+        """
+        if self.suspended:
+            return []
+        return [name for name in self.installed if name not in self.paused]
+
+    def install(self, name, statement, phase, params, catchup=None):
+        """
+        Installs the trigger, unless it is already installed with the same definition. catchup is the
+        name of the registered statement applying it to the whole graph after a suspension.
+        Returns True if the trigger was installed
+        """
+        if catchup is not None:
+            self.catchups[name] = catchup
+        definition = (statement, {"phase": phase}, params)
+        if self.installed.get(name) == definition:
+            return False
+        self.installed[name] = definition
+        self.paused.discard(name)
+        self._run("add", "trigger.add", {"name": name, "statement": statement, "selector": {"phase": phase}, "params": params},
+                  errback=lambda error: self._failed(name, definition))
+        if self.suspended:
+            self._run("pause", "trigger.pause", {"name": name})
+        self._updateTriggered()
+        return True
+
+    def remove(self, name):
+        self._run("remove", "trigger.remove", {"name": name})
+        self.installed.pop(name, None)
+        self.paused.discard(name)
+        self._updateTriggered()
+
+    def removeAll(self):
+        self._run("removeAll", "trigger.removeAll")
+        self.installed.clear()
+        self.paused.clear()
+        self._updateTriggered()
+
+    def pause(self, name):
+        self._run("pause", "trigger.pause", {"name": name})
+        self.paused.add(name)
+        self._updateTriggered()
+
+    def resume(self, name):
+        self.paused.discard(name)
+        if not self.suspended:
+            self._run("resume", "trigger.resume", {"name": name})
+        self._updateTriggered()
+
+    def pauseAll(self, wait=False):
+        """
+        Suspends every active trigger, until as many resumeAll() calls. wait returns once they are paused,
+        for the bulk operations which do not go through the executor. It must not be used from its workers
+        """
+        names = self.active()
+        self.suspended += 1
+        self._updateTriggered()
+        if not names:
+            return
+        self._run("pauseAll", "trigger.pauseAll", {"names": names}, wait=wait)
+        log.info("{} triggers paused".format(len(names)))
+
+    def resumeAll(self):
+        """
+        Resumes the triggers suspended by pauseAll(), and runs their catch-up statements in the same transaction
+        """
+        if not self.suspended:
+            return
+        self.suspended -= 1
+        names = self.active()
+        if not names:
+            return
+        self.executor.submit(lambda session: session.write_transaction(self._resume, names), key=DB_KEY,
+                             callback=lambda _: self._updateTriggered())
+
+    def _resume(self, tx, names):
+        start = time.time()
+        self.queries.run("trigger.resumeAll", {"names": names}, tx)
+        for name in names:
+            if name in self.catchups:
+                self.queries.run(self.catchups[name], self.installed[name][2], tx)
+        gox_metrics.observe("trigger", "resumeAll", time.time() - start)
+        log.info("{} triggers resumed".format(len(names)))
+
+    def _run(self, series, name, params=None, callback=None, errback=None, wait=False):
+        """
+        Runs the trigger procedure registered under name in the DB_KEY worker, timed as the given series.
+        callback is given its records, errback its exception. wait returns its records, or raises its exception,
+        once it ran: only at startup or around bulk operations, and never from the workers of the executor
+        """
+        result = {}
+        done = threading.Event()
+
+        def work(session):
+            start = time.time()
+            try:
+                result["records"] = list(self.queries.run(name, params, session))
+                return result["records"]
+            except Exception as e:
+                result["error"] = e
+                raise
+            finally:
+                gox_metrics.observe("trigger", series, time.time() - start)
+                done.set()
+
+        self.executor.submit(work, callback, DB_KEY, errback)
+        if wait:
+            done.wait()
+            if "error" in result:
+                raise result["error"]
+            return result["records"]
+
+    def _failed(self, name, definition):
+        # The installation failed, the trigger can be installed again
+        if self.installed.get(name) == definition:
+            del self.installed[name]
+            self._updateTriggered()
+
+    def _updateTriggered(self):
+        gox_queries.setTriggered(len(self.active()) > 0)
+
+
 class DatabaseInstance(object):
 
     def __init__(self, uri, username, password):
@@ -34,6 +281,7 @@ class DatabaseInstance(object):
         self.password = password
         self.driver = None
         self.session = None
+        self.queries = None
 
         self.connect()
         self.reset()
@@ -47,67 +295,64 @@ class DatabaseInstance(object):
         """
         self.driver = GraphDatabase.driver(self.uri, auth=(self.username, self.password))
         self.session = self.driver.session()
+        self.queries = QueryRegistry(self.session)
+
+    def triggerRegistry(self):
+        """
+        Returns the TriggerRegistry of GOX, registered on first use if gox was launched without triggers,
+        so that every component sees the same installed and paused triggers
+        """
+        if not core.hasComponent("TriggerRegistry"):
+            core.registerNew(TriggerRegistry, self.queries, core.DatabaseExecutor)
+        return core.TriggerRegistry
 
     def remove(self, name):
         """
-        docstring
+        Removes the trigger called name
         """
-        query = '''CALL apoc.trigger.remove(name)'''
-        self.session.run(query)
+        self.triggerRegistry().remove(name)
         
     def removeAll(self):
         """
-        docstring
+        Removes every trigger
         """
-        query = '''CALL apoc.trigger.removeAll()'''
-        self.session.run(query)
+        self.triggerRegistry().removeAll()
+
+    def addTrigger(self, name, statement, phase, params):
+        """
+        Installs the trigger, unless it is already installed with the same definition
+        """
+        return self.triggerRegistry().install(name, statement, phase, params)
 
     def addProperty(self, nameprop):
-        query = '''
-                CALL apoc.trigger.add('setAllConnectedNodes','UNWIND apoc.trigger.propertiesByKey({assignedNodeProperties},"{surname}") as prop
-                WITH prop.node as n
-                MATCH(n)-[]-(a)
-                SET a.surname = n.surname', {phase:'after'})
-                '''.format(surname=nameprop)
-        self.session.run(query)
+        self.addTrigger('setAllConnectedNodes', SET_CONNECTED_NODES, 'after', {"surname": nameprop})
         
     def addLabel(self, oldlabel, newlabel):
-        query = ''' 
-                CALL apoc.trigger.add('updateLabels',"UNWIND apoc.trigger.nodesByLabel({removedLabels},'{oldlabelname}') AS node
-                MATCH (n:"{oldlabelname}")
-                REMOVE n:"{oldlabelname}" SET n:"{newlabelname}" SET node:"{newlabelname}", {phase:'before'})
-                '''.format(oldlabelname=oldlabel, newlabelname=newlabel)
-        self.session.run(query)
+        self.addTrigger('updateLabels', UPDATE_LABELS, 'before', {"oldlabel": oldlabel, "newlabel": newlabel})
 
     def connectNodeHost(self, mac, list):
-        query = '''
-                CALL apoc.trigger.add('create-rel-new-node',"UNWIND {createdNodes} AS h
-                MATCH (h:Host {{mac: "{host_mac}"}})
-                WHERE h:Host AND h.mac IN "{list_mac}"
-                CREATE (n)-[link:Connected_to]->(m)", {phase:'before'})
-                '''.format(host_mac=mac, list_mac=list)
-        self.session.run(query)
+        self.addTrigger('create-rel-new-host', CONNECT_NEW_HOSTS, 'before', {"mac": mac, "macs": list})
         
     def connectNodeSwitch(self, name, list):
-        query = '''
-                CALL apoc.trigger.add('create-rel-new-node',"UNWIND {createdNodes} AS s
-                MATCH (s:Switch {{name: "{switch_name}"}})
-                WHERE s:Switch AND s.name IN "{list_name}"
-                CREATE (n)-[link:Connected_to]->(m)", {phase:'before'})
-                '''.format(switch_name=name, list_name=list)
-        self.session.run(query)
+        self.addTrigger('create-rel-new-switch', CONNECT_NEW_SWITCHES, 'before', {"name": name, "names": list})
         
     def pauseTrigger(self, name):
-        query ='''
-                CALL apoc.trigger.pause("{trigger_name}")
-                '''.format(trigger_name=name)
-        self.session.run(query)
+        self.triggerRegistry().pause(name)
         
     def resumePauseTrigger(self, name):
-        query ='''
-                CALL apoc.trigger.resume("{trigger_name}")
-                '''.format(trigger_name=name)
-        self.session.run(query)
+        self.triggerRegistry().resume(name)
+
+    def pauseAll(self):
+        """
+        Pauses every trigger, around a bulk operation
+        """
+        self.triggerRegistry().pauseAll()
+
+    def resumeAll(self):
+        """
+        Resumes the triggers paused by pauseAll, catching up with the changes made meanwhile
+        """
+        self.triggerRegistry().resumeAll()
     
     
 
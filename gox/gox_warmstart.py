@@ -0,0 +1,213 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Warm restart of GOX from the topology stored in the neo4j database
+
+By default, `DatabaseInstance` resets the database when GOX starts, and the whole topology, with the
+Path_to relationships computed before, is discovered again. With a warm start, `WarmDatabaseInstance`
+keeps the stored graph, and the `WarmStart` class:
+
+1. loads the stored switches, hosts, links and paths into the topology mirror, in a single query,
+2. marks all of them as unconfirmed,
+3. confirms them as `NetworkEventHandler` receives their ConnectionUp, LinkEvent and HostEvent,
+4. deletes the ones still unconfirmed after a grace window in a single statement, through the same queue as
+   the other topology mutations, so that an entity seen again right after the window is never deleted after
+   being added back.
+
+The topology can also be loaded from a snapshot file written by `gox_snapshot`. When the database
+was reset, the loaded topology is then stored in it again.
+"""
+
+from pox.core import core
+
+from gox_db import DatabaseInstance
+from gox_executor import DB_KEY
+from gox_routing import Route
+from gox_coalesce import linkKey
+import gox_queries
+import gox_writer
+import time
+
+log = core.getLogger()
+
+gox_queries.register("warmstart.load", '''
+        CALL { MATCH (s:Switch) RETURN collect(s.dpid) AS switches }
+        CALL { MATCH (h:Host) RETURN collect({mac: h.mac, ip: h.ip}) AS hosts }
+        CALL {
+            MATCH (a)-[r:Connected_to]->(b)
+            RETURN collect({name1: coalesce(a.dpid, a.mac), port1: r.orig_port,
+                            name2: coalesce(b.dpid, b.mac), port2: r.dst_port}) AS links
+        }
+        CALL {
+            MATCH (h1:Host)-[p:Path_to]->(h2:Host)
+            RETURN collect({mac1: h1.mac, mac2: h2.mac, switches: p.switches,
+                            in_ports: p.in_ports, out_ports: p.out_ports}) AS paths
+        }
+        RETURN switches, hosts, links, paths
+        ''')
+
+class WarmDatabaseInstance(DatabaseInstance):
+    """
+    DatabaseInstance keeping the stored graph when GOX starts
+    """
+
+    def reset(self):
+        log.info("Warm start : the stored topology is kept")
+
+
+class WarmStart(object):
+
+    def __init__(self, handler, queries, executor, grace=30, record=None, store=False):
+        """
+        record is the topology to load, in the format of the "warmstart.load" query, by default read
+        from the database. store writes it to the database
+        """
+        self.handler = handler
+        self.topology = handler.topology
+        self.executor = executor
+        self.paths = {}                 # (mac1, mac2) -> stored Route
+        self.unconfirmed = set()        # Switch dpids, host MACs and (dpid1, port1, dpid2, port2) switch links
+        self.collected = False
+
+        # Triggers are paused until the reconciliation is over
+        self.triggers = core.TriggerRegistry if core.hasComponent("TriggerRegistry") else None
+        if self.triggers is not None:
+            self.triggers.pauseAll(wait=True)
+
+        start = time.time()
+        if record is None:
+            record = queries.run("warmstart.load").single()
+        self._load(record)
+        if store:
+            self._store()
+        log.info("Warm start : {0} switches, {1} hosts, {2} links and {3} paths loaded in {4:.2f} ms".format(
+                 len(self.topology.switches), len(self.topology.hosts), len(self.topology.links) // 2,
+                 len(self.paths), (time.time() - start) * 1000))
+
+        handler.warm_start = self
+        core.callDelayed(grace, self.collect)
+
+    def _load(self, record):
+        for dpid in record["switches"]:
+            self.topology.addSwitch(dpid)
+            self.unconfirmed.add(dpid)
+        for host in record["hosts"]:
+            self.topology.addHost(host["mac"], host["ip"] or " ")     # Hosts stored without IP address
+            self.unconfirmed.add(host["mac"])
+        for link in record["links"]:
+            name1, port1, name2, port2 = link["name1"], link["port1"], link["name2"], link["port2"]
+            if not self.topology.entityExists(name1) or not self.topology.entityExists(name2):
+                continue
+            self.topology.addLink(name1, port1, name2, port2)
+            if name1 in self.topology.switches and name2 in self.topology.switches:
+                self.unconfirmed.add(linkKey(name1, port1, name2, port2))
+        for path in record["paths"]:
+            route = Route(path["switches"], path["in_ports"], path["out_ports"])
+            self.paths[(path["mac1"], path["mac2"])] = route
+
+    def _store(self):
+        """
+        Writes the loaded topology to the database
+        """
+        write = self.handler._write
+        for dpid in self.topology.switches:
+            write("addSwitch", dpid)
+        for mac, ip in self.topology.hosts.items():
+            write("addHost", mac, ip)
+        for (name1, port1), (name2, port2) in self.topology.links.items():
+            if name1 in self.topology.hosts:
+                write("addLink", name1, str(port1), name2, str(port2))
+            elif name2 not in self.topology.hosts and (name1, port1) < (name2, port2):
+                write("addLink", name1, str(port1), name2, str(port2))
+        for (mac1, mac2), route in self.paths.items():
+            if mac1 > mac2:
+                continue    # Stored with its reverse
+            if core.hasComponent("TopologyWriter"):
+                core.TopologyWriter.savePath(mac1, mac2, route)
+            else:
+                self.executor.run("topology.savePath", {"rows": [gox_writer.pathRow(mac1, mac2, route)]}, key=DB_KEY)
+
+    def confirmSwitch(self, dpid):
+        """
+        Returns True if the switch was loaded and not confirmed yet
+        """
+        return self._confirm(dpid)
+
+    def confirmLink(self, dpid1, port1, dpid2, port2):
+        """
+        Returns True if the link was loaded and not confirmed yet
+        """
+        return self._confirm(linkKey(dpid1, port1, dpid2, port2))
+
+    def confirmHost(self, mac, dpid, port):
+        """
+        Returns True if the host was loaded at this location and not confirmed yet.
+        A host loaded at another location is removed, so that it can be added again
+        """
+        if not self._confirm(mac):
+            return False
+        if self.topology.hostLocation(mac) == (dpid, int(port)):
+            return True
+        self.handler._write("delHost", mac)
+        self.topology.delHost(mac)
+        return False
+
+    def _confirm(self, key):
+        if self.collected or key not in self.unconfirmed:
+            return False
+        self.unconfirmed.discard(key)
+        return True
+
+    def collect(self):
+        """
+        Deletes the loaded switches, hosts and links that were not confirmed during the grace window
+        """
+        self.collected = True
+        links = [key for key in self.unconfirmed if isinstance(key, tuple) and self.topology.linkExists(*key)]
+        hosts = [key for key in self.unconfirmed if not isinstance(key, tuple) and self.topology.hostExists(key)]
+        switches = [key for key in self.unconfirmed if not isinstance(key, tuple) and self.topology.switchExists(key)]
+        self.unconfirmed.clear()
+        self.paths = {}
+        if not links and not hosts and not switches:
+            log.info("Warm start : the whole stored topology was confirmed")
+            if self.triggers is not None:
+                self.triggers.resumeAll()
+            return
+
+        # A single mutation, queued after the ones of the entities confirmed before
+        row = {"links": [{"dpid1": dpid1, "port1": str(port1), "dpid2": dpid2, "port2": str(port2)}
+                         for dpid1, port1, dpid2, port2 in links],
+               "hosts": hosts, "switches": switches}
+        if core.hasComponent("TopologyWriter"):
+            core.TopologyWriter.delStale(row)
+        else:
+            # Same key as the calls to the DatabaseInstance
+            self.executor.run("topology.delStale", {"rows": [row]}, key=DB_KEY)
+
+        # Installed paths going through them are rerouted from the events of the mirror
+        for link in links:
+            self.topology.delLink(*link)
+        for mac in hosts:
+            self.topology.delHost(mac)
+        for dpid in switches:
+            self.topology.delSwitch(dpid)
+        log.info("Warm start : {0} switches, {1} hosts and {2} links were not confirmed and are deleted".format(
+                 len(switches), len(hosts), len(links)))
+        if self.triggers is not None:
+            self.triggers.resumeAll()
+
+
+def launch():
+    print("gox_warmstart is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
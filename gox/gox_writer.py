@@ -0,0 +1,221 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Write-behind queue for the topology mutations of GOX
+
+The `TopologyWriter` class collects the mutations made by `NetworkEventHandler` (new switches, hosts, links...)
+and writes them to the neo4j database from a background thread, so that POX's event loop never waits for the database.
+Its methods use the same names as the ones of `DatabaseInstance`.
+
+Mutations are flushed in a single transaction when `max_batch` of them are queued or when the oldest one
+has been waiting for `max_delay` seconds. Consecutive mutations of the same kind are sent as one UNWIND query
+("topology.*" statements of `gox_queries`).
+
+A batch failing because the database is unavailable is retried with an exponential backoff, before any later
+mutation, so that the stored graph does not drift away from the topology mirror. A batch that cannot succeed,
+such as one rejected by a constraint, is dropped and logged.
+"""
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from pox.core import core
+
+import threading
+import time
+
+log = core.getLogger()
+
+# Hosts are linked to their switch through their port 0
+HOST_PORT = "0"
+
+RETRIABLE = (ServiceUnavailable, SessionExpired, TransientError)
+RETRY_DELAY = 0.1       # Seconds before the first retry of a failed batch, doubled on every failure...
+RETRY_MAX_DELAY = 5     # ... up to this delay
+RETRY_ALERT = 5         # Consecutive failures after which the database is reported as unavailable
+
+def pathRow(mac1, mac2, route):
+    """
+    Returns the parameters of the "topology.savePath" statement for the Route from mac1 to mac2
+    """
+    reverse = route.reverse()
+    return {"mac1": mac1, "mac2": mac2,
+            "switches": route.switches,
+            "in_ports": [str(port) for port in route.in_ports],
+            "out_ports": [str(port) for port in route.out_ports],
+            "r_switches": reverse.switches,
+            "r_in_ports": [str(port) for port in reverse.in_ports],
+            "r_out_ports": [str(port) for port in reverse.out_ports],
+            "last_used": int(time.time() * 1000)}
+
+class TopologyWriter(object):
+
+    def __init__(self, driver, queries, max_batch=1000, max_delay=0.05):
+        self.driver = driver
+        self.queries = queries
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.pending = []               # (statement name, row), in arrival order
+        self.oldest = None              # Arrival time of pending[0]
+        self.condition = threading.Condition()
+        self.running = True
+        self.stopping = threading.Event()  # Interrupts the backoff of a failed batch
+        self.flushes = 0
+        self.written = 0
+        self.retries = 0
+        self.dropped = 0
+
+        self.thread = threading.Thread(target=self._run, name="GoxTopologyWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+        core.addListenerByName("GoingDownEvent", self._handle_GoingDownEvent)
+        log.info("TopologyWriter launched")
+
+    def addSwitch(self, dpid):
+        self._push("addSwitch", {"dpid": dpid})
+
+    def delSwitch(self, dpid):
+        self._push("delSwitch", {"dpid": dpid})
+
+    def addHost(self, mac, ip):
+        self._push("addHost", {"mac": mac, "ip": ip})
+
+    def delHost(self, mac):
+        self._push("delHost", {"mac": mac})  # All links are also deleted
+
+    def setHostIps(self, mac, ips):
+        """
+        Stores the IP addresses of the host, as the ipAddrs list of its node
+        """
+        self._push("setHostIps", {"mac": mac, "ips": list(ips)})
+
+    def addLink(self, dpid1, port1, dpid2, port2):
+        if str(port1) == HOST_PORT:
+            self._push("addHostLink", {"mac": dpid1, "dpid": dpid2, "port": str(port2)})
+        else:
+            self._push("addLink", {"dpid1": dpid1, "port1": str(port1), "dpid2": dpid2, "port2": str(port2)})
+
+    def delLink(self, dpid1, port1, dpid2, port2):
+        self._push("delLink", {"dpid1": dpid1, "port1": str(port1), "dpid2": dpid2, "port2": str(port2)})
+
+    def savePath(self, mac1, mac2, route):
+        """
+        Stores the Route from mac1 to mac2, and its reverse, as Path_to relationships
+        """
+        self._push("savePath", pathRow(mac1, mac2, route))
+
+    def delPath(self, mac1, mac2):
+        """
+        Deletes the Path_to relationships between mac1 and mac2, in both directions
+        """
+        self._push("delPath", {"mac1": mac1, "mac2": mac2})
+
+    def delStale(self, row):
+        """
+        Deletes the links, hosts and switches of the row of the "topology.delStale" statement,
+        with the Path_to relationships going through its switches, as a single mutation
+        """
+        self._push("delStale", row)
+
+    def _push(self, name, row):
+        with self.condition:
+            if not self.pending:
+                self.oldest = time.time()
+            self.pending.append((name, row))
+            # Wakes the writer up for a new batch, or for a full one
+            if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+                self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                # Wait until the batch is full or its oldest mutation is too old
+                while self.running and len(self.pending) < self.max_batch:
+                    remaining = self.oldest + self.max_delay - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if not self.pending:
+                    return
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+                self.oldest = time.time() if self.pending else None
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """
+        Writes a batch of mutations in a single transaction, retrying it until the database is available.
+        Once the writer is stopping, a failed batch is dropped
+        """
+        failures = 0
+        delay = RETRY_DELAY
+        while True:
+            try:
+                with self.driver.session() as session:
+                    session.write_transaction(self._writeBatch, batch)
+            except RETRIABLE as e:
+                failures += 1
+                if not self.running:
+                    self.dropped += len(batch)
+                    log.error("Database unavailable while stopping, {0} topology mutations are lost: {1}".format(len(batch), e))
+                    return
+                if failures == RETRY_ALERT:
+                    log.error("Database unavailable after {0} attempts, {1} topology mutations wait for it: {2}".format(
+                              failures, len(batch) + len(self.pending), e))
+                self.retries += 1
+                self.stopping.wait(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+                continue
+            except Exception:
+                self.dropped += len(batch)
+                log.exception("Impossible to write {} topology mutations to the database, they are dropped".format(len(batch)))
+                return
+            if failures >= RETRY_ALERT:
+                log.info("Database available again, topology mutations written after {} attempts".format(failures + 1))
+            self.flushes += 1
+            self.written += len(batch)
+            return
+
+    def _writeBatch(self, tx, batch):
+        # Consecutive mutations of the same kind are grouped, the order of the batch is kept
+        start = 0
+        while start < len(batch):
+            name = batch[start][0]
+            end = start
+            while end < len(batch) and batch[end][0] == name:
+                end += 1
+            self.queries.run("topology." + name, {"rows": [row for _, row in batch[start:end]]}, tx)
+            start = end
+
+    def stop(self):
+        """
+        Flushes the pending mutations and stops the background thread
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.stopping.set()
+        self.thread.join()
+
+    def _handle_GoingDownEvent(self, event):
+        self.stop()
+        log.info("TopologyWriter stopped after {0} mutations in {1} transactions, {2} retries, {3} mutations dropped".format(
+                 self.written, self.flushes, self.retries, self.dropped))
+
+
+def launch():
+    print("gox_writer is not meant to be executed alone. You should execute gox which handles the execution of the required scripts.")
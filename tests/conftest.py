@@ -0,0 +1,37 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests of the in-memory logic of GOX, run with pytest from the root of the repository.
+
+POX is not distributed on PyPI: it is taken from the PYTHONPATH, or from the directory given by the
+POX environment variable. The tests of the modules which need it are skipped without it.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path[:0] = [os.path.join(ROOT, "gox"), os.path.join(ROOT, "app")]
+if os.environ.get("POX"):
+    sys.path.insert(0, os.environ["POX"])
+
+try:
+    import pox.core
+    # GOX modules get POX's core when they are imported, as when POX boots
+    if getattr(pox.core, "core", None) is None and hasattr(pox.core, "initialize"):
+        pox.core.initialize()
+except ImportError:
+    pass
@@ -0,0 +1,151 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pox.core")
+
+import gox_coalesce
+from gox_coalesce import LinkEventCoalescer, linkKey
+
+
+class Timer(object):
+    """ Stands for the recoco Timer returned by core.callDelayed """
+
+    def __init__(self, delay, callback, *args):
+        self.delay = delay
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        assert not self.cancelled
+        self.callback(*self.args)
+
+
+class Links(object):
+    """ The links applied by a coalescer """
+
+    def __init__(self):
+        self.links = set()
+        self.applied = []
+
+    def current(self, *key):
+        return key in self.links
+
+    def apply(self, dpid1, port1, dpid2, port2, added):
+        key = (dpid1, port1, dpid2, port2)
+        self.applied.append((key, added))
+        if added:
+            self.links.add(key)
+        else:
+            self.links.discard(key)
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    timers = []
+    def callDelayed(delay, callback, *args):
+        timers.append(Timer(delay, callback, *args))
+        return timers[-1]
+    monkeypatch.setattr(gox_coalesce.core, "callDelayed", callDelayed, raising=False)
+    monkeypatch.setattr(gox_coalesce.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    monkeypatch.setattr(gox_coalesce.time, "time", lambda: 1000.0)
+    return timers
+
+
+LINK = ("s1", 1, "s2", 2)
+REVERSE = ("s2", 2, "s1", 1)
+
+
+def test_link_key():
+    assert linkKey(*LINK) == linkKey(*REVERSE) == ("s1", 1, "s2", 2)
+    assert linkKey("s2", "2", "s1", "1") == ("s1", 1, "s2", 2)
+
+
+def test_both_directions_are_applied_once(timers):
+    links = Links()
+    coalescer = LinkEventCoalescer(links.current, links.apply, window=0)
+    coalescer.push(*(LINK + (True,)))
+    coalescer.push(*(REVERSE + (True,)))
+    assert links.applied == [(LINK, True)]
+    assert timers == []
+
+
+def test_window_cancels_a_flap(timers):
+    links = Links()
+    coalescer = LinkEventCoalescer(links.current, links.apply, window=0.1)
+    coalescer.push(*(LINK + (True,)))
+    coalescer.push(*(REVERSE + (True,)))
+    assert len(timers) == 1 and timers[0].delay == 0.1
+    timers[0].fire()
+    assert links.applied == [(LINK, True)]
+
+    coalescer.push(*(LINK + (False,)))
+    coalescer.push(*(REVERSE + (True,)))
+    timers[1].fire()
+    assert links.applied == [(LINK, True)]
+    assert coalescer.received == 4 and coalescer.applied == 1
+
+
+def flap(coalescer, times):
+    for _ in range(times):
+        coalescer.push(*(LINK + (True,)))
+        coalescer.push(*(LINK + (False,)))
+
+
+def test_flapping_link_is_held_down(timers):
+    links = Links()
+    coalescer = LinkEventCoalescer(links.current, links.apply, window=0, hold_down=30)
+    flap(coalescer, 3)
+    assert len(links.applied) == 6
+    coalescer.push(*(LINK + (True,)))
+    assert len(links.applied) == 6
+    assert linkKey(*LINK) in coalescer.held
+    assert len(timers) == 1 and timers[0].delay > 0
+    assert coalescer.suppressed == 1
+
+    # Further additions while held down do not apply the link either
+    coalescer.push(*(REVERSE + (True,)))
+    assert len(links.applied) == 6 and len(timers) == 1
+
+    timers[0].fire()
+    assert links.applied[-1] == (LINK, True)
+    assert coalescer.held == {}
+    coalescer.push(*(LINK + (False,)))
+    coalescer.push(*(LINK + (True,)))
+    assert links.applied[-1] == (LINK, True)
+
+
+def test_removal_cancels_the_hold_down(timers):
+    links = Links()
+    coalescer = LinkEventCoalescer(links.current, links.apply, window=0, hold_down=30)
+    flap(coalescer, 3)
+    coalescer.push(*(LINK + (True,)))
+    coalescer.push(*(LINK + (False,)))
+    assert timers[0].cancelled
+    assert coalescer.held == {}
+    assert links.applied[-1] == (LINK, False)
+
+
+def test_no_dampening_without_hold_down(timers):
+    links = Links()
+    coalescer = LinkEventCoalescer(links.current, links.apply, window=0, hold_down=0)
+    flap(coalescer, 5)
+    coalescer.push(*(LINK + (True,)))
+    assert links.applied[-1] == (LINK, True)
+    assert coalescer.held == {} and timers == []
@@ -0,0 +1,112 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+of = pytest.importorskip("pox.openflow.libopenflow_01")
+
+from pox.lib.addresses import EthAddr
+from pox.lib.util import dpid_to_str
+
+import gox_flows
+from gox_flows import FlowShadow, matchKey
+
+H1 = "02:00:00:00:00:01"
+H2 = "02:00:00:00:00:02"
+H3 = "02:00:00:00:00:03"
+DPID = dpid_to_str(1)
+
+
+def flowMod(command, dl_src=None, dl_dst=None, port=None):
+    msg = of.ofp_flow_mod(command=command)
+    msg.match = of.ofp_match(dl_src=None if dl_src is None else EthAddr(dl_src),
+                             dl_dst=None if dl_dst is None else EthAddr(dl_dst))
+    if port is not None:
+        msg.actions.append(of.ofp_action_output(port=port))
+    return msg
+
+
+@pytest.fixture
+def shadow(monkeypatch):
+    monkeypatch.setattr(gox_flows.core, "listen_to_dependencies", lambda *args, **kwargs: None, raising=False)
+    monkeypatch.setattr(gox_flows.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    return FlowShadow(0)
+
+
+def test_match_key():
+    assert matchKey(of.ofp_match(dl_src=EthAddr(H1), dl_dst=EthAddr(H2))) == (H1, H2)
+    assert matchKey(of.ofp_match(dl_dst=EthAddr(H2))) == (None, H2)
+    assert matchKey(of.ofp_match()) is None
+    assert matchKey(of.ofp_match(dl_dst=EthAddr(H2), in_port=1)) is None
+    assert matchKey(of.ofp_match(dl_dst=EthAddr(H2), dl_type=0x800)) is None
+
+
+def test_install_skips_redundant_entries(shadow):
+    assert shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
+    assert shadow.get(DPID, H1, H2) == (1,)
+    assert shadow.queued[DPID][0].flags & of.OFPFF_SEND_FLOW_REM
+    assert not shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
+    assert shadow.skipped == 1
+    assert shadow.install(DPID, flowMod(of.OFPFC_MODIFY_STRICT, H1, H2, 2))
+    assert shadow.get(DPID, H1, H2) == (2,)
+    assert shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 2), force=True)
+    assert len(shadow.queued[DPID]) == 3
+
+
+def test_install_other_matches(shadow):
+    msg = flowMod(of.OFPFC_ADD, port=of.OFPP_FLOOD)
+    assert shadow.install(DPID, msg)
+    assert shadow.install(DPID, flowMod(of.OFPFC_ADD, port=of.OFPP_FLOOD))
+    assert shadow.tables[DPID] == {}
+    assert not msg.flags & of.OFPFF_SEND_FLOW_REM
+
+
+def test_delete_strict(shadow):
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H3, H2, 1))
+    shadow.queued = {}
+    assert not shadow.delete(DPID, flowMod(of.OFPFC_DELETE_STRICT, H2, H1))
+    assert shadow.delete(DPID, flowMod(of.OFPFC_DELETE_STRICT, H1, H2))
+    assert shadow.get(DPID, H1, H2) is None
+    assert shadow.get(DPID, H3, H2) == (1,)
+    assert len(shadow.queued[DPID]) == 1
+
+
+def test_delete_wildcards(shadow):
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H3, H2, 1))
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H2, H1, 2))
+    assert shadow.delete(DPID, flowMod(of.OFPFC_DELETE, dl_dst=H2))
+    assert shadow.tables[DPID] == {(H2, H1): (2,)}
+    # Entries matching other fields are unknown to the shadow: the deletion is always sent
+    assert shadow.delete(DPID, flowMod(of.OFPFC_DELETE))
+    assert shadow.delete(dpid_to_str(2), flowMod(of.OFPFC_DELETE))
+
+
+class Ofp(object):
+    def __init__(self, match):
+        self.match = match
+
+
+class FlowRemoved(object):
+    def __init__(self, dpid, match):
+        self.dpid = dpid
+        self.ofp = Ofp(match)
+
+
+def test_flow_removed_forgets_the_entry(shadow):
+    shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
+    shadow._handle_openflow_FlowRemoved(FlowRemoved(1, of.ofp_match(dl_src=EthAddr(H1), dl_dst=EthAddr(H2))))
+    assert shadow.get(DPID, H1, H2) is None
+    assert shadow.install(DPID, flowMod(of.OFPFC_ADD, H1, H2, 1))
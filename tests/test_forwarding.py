@@ -0,0 +1,304 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pox.openflow.libopenflow_01")
+
+from pox.lib.addresses import EthAddr
+from pox.lib.util import dpid_to_str
+import pox.openflow.libopenflow_01 as of
+
+import gox_l2_forwarding
+from gox_l2_forwarding import GoxForwarding, UNKNOWN_BURST, UNKNOWN_RATE
+from gox_reroute import PathIndex
+from gox_routing import Route, RouteCache
+
+H1 = "02:00:00:00:00:01"
+H2 = "02:00:00:00:00:02"
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gox_l2_forwarding.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def forwarding():
+    # Only the state of the token buckets, without the listeners of __init__
+    forwarding = GoxForwarding.__new__(GoxForwarding)
+    forwarding.buckets = {}
+    return forwarding
+
+
+def test_burst_then_rate(clock, forwarding):
+    assert all(forwarding.allow(H1) for _ in range(UNKNOWN_BURST))
+    assert not forwarding.allow(H1)
+    # Each source has its own bucket
+    assert forwarding.allow(H2)
+    clock.now += 1.0 / UNKNOWN_RATE
+    assert forwarding.allow(H1)
+    assert not forwarding.allow(H1)
+
+
+def test_bucket_refills_up_to_the_burst(clock, forwarding):
+    for _ in range(UNKNOWN_BURST):
+        forwarding.allow(H1)
+    clock.now += 3600
+    assert sum(forwarding.allow(H1) for _ in range(2 * UNKNOWN_BURST)) == UNKNOWN_BURST
+
+
+class Ofp(object):
+    def __init__(self, match):
+        self.match = match
+
+
+class FlowRemoved(object):
+    def __init__(self, dpid, src, dst, deleted=False):
+        self.dpid = dpid
+        self.ofp = Ofp(of.ofp_match(dl_src=EthAddr(src), dl_dst=EthAddr(dst)))
+        self.deleted = deleted
+
+
+@pytest.fixture
+def paths():
+    # Only the installed paths, without the listeners of __init__
+    forwarding = GoxForwarding.__new__(GoxForwarding)
+    forwarding.path_index = PathIndex()
+    forwarding.path_cache = RouteCache()
+    route = Route([dpid_to_str(1), dpid_to_str(2)], [3, 1], [1, 3])
+    forwarding.path_cache.put(H1, H2, route)
+    forwarding.indexPath(H1, H2, route)
+    return forwarding
+
+
+def test_timed_out_path_leaves_the_cache(paths):
+    paths._handle_FlowRemoved(FlowRemoved(1, H1, H2))
+    assert paths.path_index.get(H1, H2) is None
+    # No longer rerouted when one of its links fails, the route cannot be reused
+    assert paths.path_cache.get(H1, H2) is None
+
+
+def test_entry_of_another_switch_keeps_the_path(paths):
+    paths._handle_FlowRemoved(FlowRemoved(2, H1, H2))
+    paths._handle_FlowRemoved(FlowRemoved(1, H1, H2, deleted=True))
+    assert paths.path_index.get(H1, H2) is not None
+    assert paths.path_cache.get(H1, H2) is not None
+
+
+class Rerouter(object):
+    def __init__(self):
+        self.removed = []
+
+    def removePaths(self, pairs):
+        self.removed.append(pairs)
+        return 2 * len(pairs)
+
+
+class PathsEvicted(object):
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def test_evicted_paths_leave_the_cache(paths, monkeypatch):
+    rerouter = Rerouter()
+    monkeypatch.setattr(gox_l2_forwarding.core, "Rerouter", rerouter, raising=False)
+    paths.path_cache.put(H2, H1, paths.path_cache.get(H1, H2).reverse())
+    paths._handle_PathsEvicted(PathsEvicted(set([(H1, H2)])))
+    assert paths.path_cache.get(H1, H2) is None
+    assert paths.path_cache.get(H2, H1) is None
+    # Their entries are deleted from the switches
+    assert rerouter.removed == [set([(H1, H2)])]
+
+
+class Connection(object):
+    def __init__(self):
+        self.eth_addr = EthAddr("00:00:00:00:00:01")
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class Buffer(object):
+    buffer_id = 7
+
+
+class Packet(object):
+    """ Stands for the parsed ethernet frame of a PacketIn """
+
+    ARP_TYPE = 0x0806
+    LLDP_TYPE = 0x88cc
+
+    def __init__(self, src, dst, type):
+        self.src = EthAddr(src)
+        self.dst = EthAddr(dst)
+        self.type = self.effective_ethertype = type
+
+
+class PacketIn(object):
+    def __init__(self, packet, connection):
+        self.parsed = packet
+        self.connection = connection
+        self.ofp = Buffer()
+        self.port = 1
+        self.dpid = 1
+
+
+@pytest.fixture
+def broadcasts(clock, forwarding, monkeypatch):
+    forwarding.arp_proxy = False      # Requests the proxy cannot answer
+    forwarding.mode = "pair"
+    forwarding.broadcast_dropped = 0
+    flooded = []
+    monkeypatch.setattr(forwarding, "floodPacket", flooded.append)
+    return forwarding, flooded
+
+
+def test_arp_scan_is_rate_limited(broadcasts):
+    forwarding, flooded = broadcasts
+    connection = Connection()
+    for _ in range(UNKNOWN_BURST + 5):
+        forwarding._handle_PacketIn(PacketIn(Packet(H1, "ff:ff:ff:ff:ff:ff", Packet.ARP_TYPE), connection))
+    assert len(flooded) == UNKNOWN_BURST
+    assert forwarding.broadcast_dropped == 5
+    # Dropped by the controller: a packet-out releasing the buffer, without any flow entry on the switch
+    assert len(connection.sent) == 5
+    assert all(not isinstance(msg, of.ofp_flow_mod) for msg in connection.sent)
+
+
+def test_arp_resumes_within_the_rate(broadcasts, clock):
+    forwarding, flooded = broadcasts
+    connection = Connection()
+    for _ in range(UNKNOWN_BURST + 1):
+        forwarding._handle_PacketIn(PacketIn(Packet(H1, "ff:ff:ff:ff:ff:ff", Packet.ARP_TYPE), connection))
+    clock.now += 1.0 / UNKNOWN_RATE
+    forwarding._handle_PacketIn(PacketIn(Packet(H1, "ff:ff:ff:ff:ff:ff", Packet.ARP_TYPE), connection))
+    assert len(flooded) == UNKNOWN_BURST + 1
+
+
+class Timer(object):
+    def __init__(self, delay, function, args):
+        self.delay = delay
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.function(*self.args)
+
+
+@pytest.fixture
+def flights(forwarding, monkeypatch):
+    forwarding.unknown = {}
+    forwarding.flights = {}
+    state = {"timers": [], "lookups": [], "installs": [], "forwarded": [], "flooded": []}
+    def callDelayed(delay, function, *args):
+        timer = Timer(delay, function, args)
+        state["timers"].append(timer)
+        return timer
+    monkeypatch.setattr(gox_l2_forwarding.core, "callDelayed", callDelayed, raising=False)
+    monkeypatch.setattr(forwarding, "findPath", lambda mac1, mac2, callback: state["lookups"].append((mac1, mac2, callback)))
+    monkeypatch.setattr(forwarding, "installPath",
+                        lambda mac1, mac2, route, event, callback=None: state["installs"].append((mac1, mac2, callback)))
+    monkeypatch.setattr(forwarding, "forwardPacket", lambda event, route: state["forwarded"].append((event, route)))
+    monkeypatch.setattr(forwarding, "unknownPacket", state["flooded"].append)
+    return forwarding, state
+
+
+def packetIn(src, dst):
+    return PacketIn(Packet(src, dst, 0x0800), Connection())
+
+
+ROUTE_12 = Route([dpid_to_str(1), dpid_to_str(2)], [3, 1], [1, 3])
+
+
+def test_packets_of_a_pair_share_one_flight(flights):
+    forwarding, state = flights
+    first, reply, second = packetIn(H1, H2), packetIn(H2, H1), packetIn(H1, H2)
+    for event in (first, reply, second):
+        forwarding.routePacket(str(event.parsed.src), str(event.parsed.dst), event)
+    # A single lookup and a single installation for both directions
+    assert len(state["lookups"]) == 1
+    state["lookups"][0][2](ROUTE_12)
+    assert len(state["installs"]) == 1
+    assert state["forwarded"] == []
+
+    # Once installed, the waiting packets follow the path in their own direction
+    state["installs"][0][2]()
+    assert state["forwarded"] == [(reply, ROUTE_12.reverse()), (second, ROUTE_12)]
+
+    # Late PacketIns are only forwarded until the flight settles
+    late = packetIn(H2, H1)
+    forwarding.routePacket(H2, H1, late)
+    assert state["forwarded"][-1] == (late, ROUTE_12.reverse())
+    assert len(state["lookups"]) == 1
+    settle = state["timers"][-1]
+    assert state["timers"][0].cancelled and not settle.cancelled
+    settle.fire()
+    assert forwarding.flights == {}
+    forwarding.routePacket(H1, H2, packetIn(H1, H2))
+    assert len(state["lookups"]) == 2
+
+
+def test_flight_buffers_a_bounded_number_of_packets(flights):
+    forwarding, state = flights
+    for _ in range(gox_l2_forwarding.FLIGHT_MAX_PACKETS + 10):
+        forwarding.routePacket(H1, H2, packetIn(H1, H2))
+    flight = forwarding.flights[(H1, H2)]
+    assert len(flight.events) == gox_l2_forwarding.FLIGHT_MAX_PACKETS
+    assert len(state["lookups"]) == 1
+
+
+def test_expired_flight_floods_its_packets(flights):
+    forwarding, state = flights
+    first, waiting = packetIn(H1, H2), packetIn(H2, H1)
+    forwarding.routePacket(H1, H2, first)
+    forwarding.routePacket(H2, H1, waiting)
+    state["lookups"][0][2](ROUTE_12)
+    state["timers"][0].fire()
+    assert forwarding.flights == {}
+    assert state["flooded"] == [waiting]
+    # The switches installing the path too late do not resurrect the flight
+    state["installs"][0][2]()
+    assert state["forwarded"] == []
+    assert forwarding.flights == {}
+
+
+def test_flight_without_path_floods_its_packets(flights):
+    forwarding, state = flights
+    forwarding.topology = type("Topology", (object,), {"hosts": {}})()
+    first, waiting = packetIn(H1, H2), packetIn(H1, H2)
+    forwarding.routePacket(H1, H2, first)
+    forwarding.routePacket(H1, H2, waiting)
+    state["lookups"][0][2](None)
+    assert state["flooded"] == [waiting, first]
+    assert forwarding.flights == {}
+    assert state["timers"][0].cancelled
+    # The unknown hosts are not looked up again for a while
+    forwarding.routePacket(H1, H2, packetIn(H1, H2))
+    assert len(state["lookups"]) == 1
@@ -0,0 +1,60 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pox.core")
+
+from gox_loader import LoaderError, readRows
+
+
+def write(tmp_path, name, text):
+    filename = str(tmp_path / name)
+    with open(filename, "w") as f:
+        f.write(text)
+    return filename
+
+
+def test_csv(tmp_path):
+    filename = write(tmp_path, "topology.csv",
+                     "type,name,ip,port,peer,peer_port,weight\n"
+                     "switch,00-00-00-00-00-01,,,,,\n"
+                     "\n"
+                     "link,00-00-00-00-00-01,,1,00-00-00-00-00-02,1,5\n")
+    rows = list(readRows(filename))
+    assert [row["type"] for row in rows] == ["switch", "link"]
+    assert rows[1]["peer"] == "00-00-00-00-00-02"
+    assert rows[1]["weight"] == "5"
+
+
+def test_json_lines(tmp_path):
+    filename = write(tmp_path, "topology.jsonl",
+                     '# provisioned hosts\n'
+                     '{"type": "host", "name": "02:00:00:00:00:01", "ip": "10.0.0.1"}\n'
+                     '\n'
+                     '   \n'
+                     '{"type": "link", "name": "02:00:00:00:00:01", "peer": "00-00-00-00-00-01", "peer_port": 3}\n')
+    rows = list(readRows(filename))
+    assert rows == [{"type": "host", "name": "02:00:00:00:00:01", "ip": "10.0.0.1"},
+                    {"type": "link", "name": "02:00:00:00:00:01", "peer": "00-00-00-00-00-01", "peer_port": 3}]
+
+
+def test_json_lines_error(tmp_path):
+    filename = write(tmp_path, "topology.jsonl",
+                     '{"type": "switch", "name": "00-00-00-00-00-01"}\n'
+                     '{"type": "switch", \n')
+    rows = readRows(filename)
+    assert next(rows)["name"] == "00-00-00-00-00-01"
+    with pytest.raises(LoaderError, match="line 2"):
+        next(rows)
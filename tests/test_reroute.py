@@ -0,0 +1,166 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+of = pytest.importorskip("pox.openflow.libopenflow_01")
+
+import gox_reroute
+from gox_executor import DB_KEY
+from gox_reroute import PathIndex, PathsRerouted, Rerouter
+from gox_routing import Route, RoutingEngine
+from gox_topology import TopologyMirror
+
+H1 = "02:00:00:00:00:01"
+H3 = "02:00:00:00:00:03"
+
+
+class FlowShadow(object):
+    """ Records the flow-mods queued by the Rerouter """
+
+    def __init__(self):
+        self.msgs = []
+        self.flushes = 0
+
+    def install(self, dpid, msg, force=False):
+        self.msgs.append((dpid, msg))
+        return True
+
+    def delete(self, dpid, msg):
+        self.msgs.append((dpid, msg))
+        return True
+
+    def flush(self, callback=None):
+        self.flushes += 1
+
+    def commands(self, src, dst):
+        return dict((dpid, msg.command) for dpid, msg in self.msgs
+                    if str(msg.match.dl_src) == src and str(msg.match.dl_dst) == dst)
+
+
+class Executor(object):
+    def __init__(self):
+        self.runs = []
+
+    def run(self, name, params=None, callback=None, key=None, errback=None):
+        self.runs.append((name, params, key))
+
+
+@pytest.fixture
+def network(monkeypatch):
+    """ Ring s1..s4, si.2 <-> s(i+1).1, with H1 on s1.5 and H3 on s3.5 """
+    shadow = FlowShadow()
+    executor = Executor()
+    monkeypatch.setattr(gox_reroute.core, "FlowShadow", shadow, raising=False)
+    monkeypatch.setattr(gox_reroute.core, "DatabaseExecutor", executor, raising=False)
+    monkeypatch.setattr(gox_reroute.core, "hasComponent", lambda name: False, raising=False)
+    topology = TopologyMirror()
+    engine = RoutingEngine(topology)
+    rerouter = Rerouter(topology, engine, 30, 300)
+    for i in range(1, 5):
+        topology.addSwitch("s{}".format(i))
+    for i in range(1, 5):
+        topology.addLink("s{}".format(i), 2, "s{}".format(i % 4 + 1), 1)
+    for mac, dpid in ((H1, "s1"), (H3, "s3")):
+        topology.addHost(mac, " ")
+        topology.addLink(mac, 0, dpid, 5)
+    events = []
+    rerouter.addListener(PathsRerouted, events.append)
+    return topology, rerouter, shadow, executor, events
+
+
+def install(rerouter, route):
+    rerouter.index.add(H1, H3, route)
+    rerouter.index.add(H3, H1, route.reverse())
+
+
+VIA_S2 = Route(["s1", "s2", "s3"], [5, 1, 1], [2, 2, 5])
+
+
+def test_path_index():
+    index = PathIndex()
+    index.add(H1, H3, VIA_S2)
+    assert index.pairsThroughLink("s2", 2) == set([(H1, H3)])
+    assert index.pairsThroughLink("s2", 1) == set()
+    assert index.pairsThroughSwitch("s2") == set([(H1, H3)])
+    assert index.pairsOfHost(H3) == set([(H1, H3)])
+    assert index.remove(H1, H3) == VIA_S2
+    assert index.by_link == {} and index.by_switch == {} and index.by_host == {}
+    assert index.remove(H1, H3) is None
+
+
+def test_link_down_reroutes_with_minimal_flow_mods(network):
+    topology, rerouter, shadow, executor, events = network
+    install(rerouter, VIA_S2)
+    topology.delLink("s2", 2, "s3", 1)
+
+    assert rerouter.index.get(H1, H3).switches == ["s1", "s4", "s3"]
+    assert rerouter.index.get(H3, H1).switches == ["s3", "s4", "s1"]
+    # s3 keeps sending to H3 on port 5: only the entries which change are sent
+    assert shadow.commands(H1, H3) == {"s1": of.OFPFC_MODIFY_STRICT, "s4": of.OFPFC_ADD, "s2": of.OFPFC_DELETE_STRICT}
+    assert shadow.commands(H3, H1) == {"s3": of.OFPFC_MODIFY_STRICT, "s4": of.OFPFC_ADD, "s2": of.OFPFC_DELETE_STRICT}
+    # The new entries expire like the ones installed by the application
+    for dpid, msg in shadow.msgs:
+        if msg.command != of.OFPFC_DELETE_STRICT:
+            assert (msg.idle_timeout, msg.hard_timeout) == (30, 300)
+    assert shadow.flushes == 1
+
+    assert len(events) == 1
+    event = events[0]
+    assert len(event.pairs) == 1 and event.pairs <= set([(H1, H3), (H3, H1)])
+    assert event.unreachable == set()
+    assert event.flow_mods == 6
+    assert event.duration >= 0
+    assert [(name, key) for name, _, key in executor.runs] == [("topology.delPath", DB_KEY), ("topology.savePath", DB_KEY)]
+
+
+def test_unrelated_link_down(network):
+    topology, rerouter, shadow, executor, events = network
+    install(rerouter, VIA_S2)
+    topology.delLink("s3", 2, "s4", 1)
+    assert events == [] and shadow.msgs == []
+    assert rerouter.index.get(H1, H3) == VIA_S2
+
+
+def test_unreachable_pair(network):
+    topology, rerouter, shadow, executor, events = network
+    install(rerouter, VIA_S2)
+    topology.delLink("s3", 2, "s4", 1)
+    topology.delLink("s2", 2, "s3", 1)
+    assert events[0].unreachable == set(events[0].pairs)
+    assert rerouter.index.get(H1, H3) is None and rerouter.index.get(H3, H1) is None
+    assert set(shadow.commands(H1, H3).values()) == set([of.OFPFC_DELETE_STRICT])
+    assert sorted(shadow.commands(H1, H3)) == ["s1", "s2", "s3"]
+
+
+def test_switch_leave_uses_the_selection_of_the_application(network):
+    topology, rerouter, shadow, executor, events = network
+    install(rerouter, VIA_S2)
+    selected = []
+    def select(mac1, mac2):
+        selected.append((mac1, mac2))
+        return rerouter.routing_engine.shortestPath(mac1, mac2)
+    rerouter.select = select
+    topology.delSwitch("s2")
+    assert len(selected) == 1
+    assert rerouter.index.get(H1, H3).switches == ["s1", "s4", "s3"]
+
+
+def test_remove_paths(network):
+    topology, rerouter, shadow, executor, events = network
+    install(rerouter, VIA_S2)
+    assert rerouter.removePaths([(H1, H3)]) == 6
+    assert len(rerouter.index) == 0
+    assert set(msg.command for _, msg in shadow.msgs) == set([of.OFPFC_DELETE_STRICT])
+    assert rerouter.removePaths([(H1, H3)]) == 0
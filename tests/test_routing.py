@@ -0,0 +1,203 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+pytest.importorskip("pox.lib.revent")
+
+from gox_topology import TopologyMirror
+from gox_routing import RouteCache, RoutingEngine, RoutesChanged
+
+
+def build(links, hosts=()):
+    """
+    Returns a TopologyMirror and its RoutingEngine. links are (dpid1, port1, dpid2, port2) between
+    the switches, hosts are (mac, dpid, port)
+    """
+    topology = TopologyMirror()
+    engine = RoutingEngine(topology)
+    for dpid in sorted(set([link[0] for link in links] + [link[2] for link in links] + [host[1] for host in hosts])):
+        topology.addSwitch(dpid)
+    for link in links:
+        topology.addLink(*link)
+    for mac, dpid, port in hosts:
+        topology.addHost(mac, " ")
+        topology.addLink(mac, 0, dpid, port)
+    return topology, engine
+
+
+def ring(size):
+    """ Switches s1..s<size> in a ring, si.2 <-> s(i+1).1 """
+    return [("s{}".format(i), 2, "s{}".format(i % size + 1), 1) for i in range(1, size + 1)]
+
+
+def assertConsistent(topology, engine):
+    """
+    Every tree of the engine gives the same distances as a tree built from scratch,
+    and its next hops follow the links of the topology
+    """
+    fresh = RoutingEngine(topology)
+    fresh.weights = dict(engine.weights)
+    for root, tree in engine.trees.items():
+        assert tree.distances == fresh.tree(root).distances
+        for dpid, port in tree.next_port.items():
+            parent = tree.parent[dpid]
+            assert topology.adjacency[dpid][port][0] == parent
+            assert tree.distances[dpid] == pytest.approx(tree.distances[parent] + engine.weight(dpid, port))
+
+
+def test_shortest_path():
+    topology, engine = build([("s1", 1, "s2", 1), ("s2", 2, "s3", 1)], [("h1", "s1", 5), ("h3", "s3", 5)])
+    route = engine.shortestPath("h1", "h3")
+    assert route.switches == ["s1", "s2", "s3"]
+    assert route.in_ports == [5, 1, 1]
+    assert route.out_ports == [1, 2, 5]
+    assert engine.shortestPath("h3", "h1") == route.reverse()
+
+
+def test_unknown_or_disconnected_hosts():
+    topology, engine = build([("s1", 1, "s2", 1)], [("h1", "s1", 5), ("h3", "s3", 5)])
+    assert engine.shortestPath("h1", "h9") is None
+    assert engine.shortestPath("h1", "h3") is None
+
+
+def test_link_down_reroutes_around_the_ring():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h2", "s2", 5)])
+    assert engine.shortestPath("h1", "h2").switches == ["s1", "s2"]
+    topology.delLink("s1", 2, "s2", 1)
+    assert engine.shortestPath("h1", "h2").switches == ["s1", "s4", "s3", "s2"]
+    assertConsistent(topology, engine)
+
+
+def test_link_down_only_repairs_the_trees_using_it():
+    topology, engine = build(ring(6), [("h1", "s1", 5), ("h4", "s4", 5)])
+    engine.tree("s1")
+    engine.tree("s4")
+    tree = engine.trees["s1"]
+    unused = next((dpid, port) for dpid, port in ((d, p) for d in topology.adjacency for p in topology.adjacency[d])
+                  if dpid in topology.switches and topology.adjacency[dpid][port][0] in topology.switches
+                  and tree.next_port.get(dpid) != port
+                  and tree.next_port.get(topology.adjacency[dpid][port][0]) != topology.adjacency[dpid][port][1])
+    events = []
+    engine.addListener(RoutesChanged, events.append)
+    peer, peer_port = topology.adjacency[unused[0]][unused[1]]
+    before = dict(tree.next_port)
+    topology.delLink(unused[0], unused[1], peer, peer_port)
+    assert tree.next_port == before
+    assert all("s1" not in event.trees for event in events)
+    assertConsistent(topology, engine)
+
+
+def test_routes_changed_reports_the_pairs():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h2", "s2", 5)])
+    engine.shortestPath("h1", "h2")
+    events = []
+    engine.addListener(RoutesChanged, events.append)
+    topology.delLink("s1", 2, "s2", 1)
+    assert events
+    assert ("h1", "h2") in set().union(*[event.pairs for event in events])
+
+
+def test_weight_steers_the_path():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h2", "s2", 5)])
+    assert engine.shortestPath("h1", "h2").switches == ["s1", "s2"]
+    engine.setWeight("s1", 2, 10)
+    assert engine.shortestPath("h1", "h2").switches == ["s1", "s4", "s3", "s2"]
+    engine.setWeight("s1", 2, 1)
+    assert engine.shortestPath("h1", "h2").switches == ["s1", "s2"]
+    assertConsistent(topology, engine)
+
+
+def test_switch_leave():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h3", "s3", 5)])
+    engine.shortestPath("h1", "h3")
+    topology.delSwitch("s2")
+    assert engine.shortestPath("h1", "h3").switches == ["s1", "s4", "s3"]
+    assert all("s2" not in tree.distances for tree in engine.trees.values())
+    assertConsistent(topology, engine)
+
+
+def test_random_changes_match_a_full_rebuild():
+    rand = random.Random(1)
+    switches = ["s{}".format(i) for i in range(12)]
+    ports = dict((dpid, 0) for dpid in switches)
+    def link(dpid1, dpid2):
+        ports[dpid1] += 1
+        ports[dpid2] += 1
+        return (dpid1, ports[dpid1], dpid2, ports[dpid2])
+    links = [link(switches[i], switches[i + 1]) for i in range(len(switches) - 1)]
+    links += [link(*rand.sample(switches, 2)) for _ in range(10)]
+    topology, engine = build(links)
+    for dpid in switches:
+        engine.tree(dpid)
+
+    for _ in range(60):
+        action = rand.random()
+        current = [end1 + end2 for end1, end2 in topology.links.items() if end1 < end2]
+        if action < 0.4 and current:
+            topology.delLink(*rand.choice(current))
+        elif action < 0.7:
+            topology.addLink(*link(*rand.sample(switches, 2)))
+        elif current:
+            dpid, port = rand.choice(current)[:2]
+            engine.setWeight(dpid, port, rand.choice([1, 2, 3, 0.5]))
+        assertConsistent(topology, engine)
+
+
+def test_equal_cost_paths():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h3", "s3", 5)])
+    hops = engine.equalCostHops("s1", "s3")
+    assert sorted(hop[0] for hop in hops) == [("s1", 1), ("s1", 2)]
+    routes = set(tuple(engine.multiPath(mac, "h3", select="hash").switches) for mac in ["h1"])
+    assert routes <= set([("s1", "s2", "s3"), ("s1", "s4", "s3")])
+    # The same pair always gets the same path, in both directions
+    assert engine.multiPath("h1", "h3").switches == engine.multiPath("h3", "h1").switches[::-1]
+
+
+def test_least_loaded_path():
+    topology, engine = build(ring(4), [("h1", "s1", 5), ("h3", "s3", 5)])
+    busy = lambda dpid, port: 100 if (dpid, port) == ("s1", 2) else 0
+    assert engine.multiPath("h1", "h3", select="least-loaded", load=busy).switches == ["s1", "s4", "s3"]
+    busy = lambda dpid, port: 100 if (dpid, port) == ("s1", 1) else 0
+    assert engine.multiPath("h1", "h3", select="least-loaded", load=busy).switches == ["s1", "s2", "s3"]
+
+
+def test_route_cache_evicts_the_least_recently_used():
+    cache = RouteCache(size=2)
+    cache.put("h1", "h2", "r12")
+    cache.put("h1", "h3", "r13")
+    assert cache.get("h1", "h2") == "r12"
+    cache.put("h2", "h3", "r23")
+    assert cache.get("h1", "h3") is None
+    assert cache.get("h1", "h2") == "r12"
+    assert cache.get("h2", "h3") == "r23"
+    assert len(cache) == 2
+    assert cache.getStats() == {"size": 2, "hits": 3, "misses": 1, "evictions": 1, "hit_rate": 0.75}
+
+
+def test_route_cache_invalidate_host():
+    cache = RouteCache()
+    cache.put("h1", "h2", "r12")
+    cache.put("h3", "h1", "r31")
+    cache.put("h2", "h3", "r23")
+    cache.invalidateHost("h1")
+    assert len(cache) == 1
+    assert cache.get("h2", "h3") == "r23"
+    assert "h1" not in cache.by_host
+    cache.invalidate("h2", "h3")
+    cache.invalidate("h2", "h3")
+    assert len(cache) == 0
+    assert cache.by_host == {}
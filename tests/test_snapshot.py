@@ -0,0 +1,98 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+import gox_snapshot
+from gox_snapshot import Snapshot, SnapshotError
+
+
+class Route(object):
+    """ Same attributes as gox_routing's Route, which needs POX """
+
+    def __init__(self, switches, in_ports, out_ports):
+        self.switches = switches
+        self.in_ports = in_ports
+        self.out_ports = out_ports
+
+
+SWITCHES = ["00-00-00-00-00-01", "00-00-00-00-00-02", "00-00-00-00-00-03"]
+HOSTS = {"02:00:00:00:00:01": "10.0.0.1", "02:00:00:00:00:02": " "}
+LINKS = [("00-00-00-00-00-01", 1, "00-00-00-00-00-02", 1),
+         ("00-00-00-00-00-02", 2, "00-00-00-00-00-03", 1),
+         ("02:00:00:00:00:01", 0, "00-00-00-00-00-01", 3)]
+PATHS = {("02:00:00:00:00:01", "02:00:00:00:00:02"):
+         Route(["00-00-00-00-00-01", "00-00-00-00-00-02", "00-00-00-00-00-03"], [3, 1, 1], [1, 2, 4])}
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "topology.snap")
+
+
+def test_round_trip(filename):
+    gox_snapshot.write(filename, SWITCHES, HOSTS, LINKS, PATHS)
+    with Snapshot(filename) as snapshot:
+        assert snapshot.switches() == SWITCHES
+        assert snapshot.hosts() == HOSTS
+        assert snapshot.links() == LINKS
+        assert snapshot.paths() == [("02:00:00:00:00:01", "02:00:00:00:00:02",
+                                     ["00-00-00-00-00-01", "00-00-00-00-00-02", "00-00-00-00-00-03"], [3, 1, 1], [1, 2, 4])]
+        record = snapshot.record()
+    assert record["switches"] == SWITCHES
+    assert {"mac": "02:00:00:00:00:01", "ip": "10.0.0.1"} in record["hosts"]
+    assert record["links"][0] == {"name1": "00-00-00-00-00-01", "port1": 1, "name2": "00-00-00-00-00-02", "port2": 1}
+    assert record["paths"][0]["out_ports"] == [1, 2, 4]
+
+
+def test_empty_topology(filename):
+    gox_snapshot.write(filename, [], {}, [], {})
+    with Snapshot(filename) as snapshot:
+        assert snapshot.switches() == []
+        assert snapshot.hosts() == {}
+        assert snapshot.links() == []
+        assert snapshot.paths() == []
+
+
+def test_write_replaces_the_file(filename):
+    gox_snapshot.write(filename, SWITCHES, HOSTS, LINKS, PATHS)
+    gox_snapshot.write(filename, SWITCHES[:1], {}, [], {})
+    with Snapshot(filename) as snapshot:
+        assert snapshot.switches() == SWITCHES[:1]
+    assert os.listdir(os.path.dirname(filename)) == ["topology.snap"]
+
+
+def test_empty_file(filename):
+    open(filename, "wb").close()
+    with pytest.raises(SnapshotError):
+        Snapshot(filename)
+
+
+def test_truncated_file(filename):
+    gox_snapshot.write(filename, SWITCHES, HOSTS, LINKS, PATHS)
+    with open(filename, "rb") as f:
+        data = f.read()
+    with open(filename, "wb") as f:
+        f.write(data[:-8])
+    with pytest.raises(SnapshotError):
+        Snapshot(filename)
+
+
+def test_not_a_snapshot(filename):
+    with open(filename, "wb") as f:
+        f.write(b"\0" * 128)
+    with pytest.raises(SnapshotError):
+        Snapshot(filename)
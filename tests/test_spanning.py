@@ -0,0 +1,146 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+of = pytest.importorskip("pox.openflow.libopenflow_01")
+
+from pox.lib.util import dpid_to_str, str_to_dpid
+
+import gox_spanning
+from gox_spanning import LLDP_CYCLE, SpanningTree
+from gox_topology import TopologyMirror
+
+S1, S2, S3 = dpid_to_str(1), dpid_to_str(2), dpid_to_str(3)
+
+
+class Port(object):
+    def __init__(self, port_no):
+        self.port_no = port_no
+        self.hw_addr = "00:00:00:00:{0:02x}:{1:02x}".format(port_no >> 8, port_no & 0xff)
+
+
+class Connection(object):
+    """ Records the port-mods sent to a switch """
+
+    def __init__(self, ports):
+        self.ports = dict((port, Port(port)) for port in ports)
+        self.port_mods = []
+
+    def send(self, msg):
+        self.port_mods.append((msg.port_no, msg.config & of.OFPPC_NO_FLOOD == 0))
+
+
+class OpenFlow(object):
+    def __init__(self):
+        self.connections = {}
+
+    def getConnection(self, dpid):
+        return self.connections.get(dpid)
+
+
+class Ofp(object):
+    def __init__(self, ports):
+        self.ports = [Port(port) for port in ports]
+
+
+class ConnectionUp(object):
+    def __init__(self, dpid, connection, ports):
+        self.dpid = dpid
+        self.connection = connection
+        self.ofp = Ofp(ports)
+
+
+@pytest.fixture
+def network(monkeypatch):
+    openflow = OpenFlow()
+    timers = []
+    monkeypatch.setattr(gox_spanning.core, "openflow", openflow, raising=False)
+    monkeypatch.setattr(gox_spanning.core, "callDelayed", lambda delay, *args: timers.append((delay, args)), raising=False)
+    monkeypatch.setattr(gox_spanning.core, "listen_to_dependencies", lambda *args, **kwargs: None, raising=False)
+    monkeypatch.setattr(gox_spanning.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    for dpid in (S1, S2, S3):
+        openflow.connections[str_to_dpid(dpid)] = Connection([1, 2, 3])
+    return openflow, timers
+
+
+def ring():
+    """ Mirror of three switches, linked in a ring by connect(). Port 3 of every switch has no link """
+    topology = TopologyMirror()
+    for dpid in (S1, S2, S3):
+        topology.addSwitch(dpid)
+    return topology
+
+
+def connect(topology):
+    """ s1.1 <-> s2.1, s2.2 <-> s3.1, s3.2 <-> s1.2 """
+    topology.addLink(S1, 1, S2, 1)
+    topology.addLink(S2, 2, S3, 1)
+    topology.addLink(S3, 2, S1, 2)
+
+
+def test_default_hold_down_spans_two_lldp_cycles():
+    assert SpanningTree.__init__.__defaults__[0] >= 2 * LLDP_CYCLE
+
+
+def test_redundant_link_stops_flooding(network):
+    openflow, timers = network
+    topology = ring()
+    tree = SpanningTree(topology, 0, False)
+    connect(topology)
+    assert tree.inTree(S1, 1) and tree.inTree(S2, 2)
+    assert not tree.inTree(S3, 2) and not tree.inTree(S1, 2)
+    assert tree.blocked == set([(S3, 2), (S1, 2)])
+    assert openflow.connections[3].port_mods == [(2, False)]
+    assert openflow.connections[1].port_mods == [(2, False)]
+    assert tree.shouldFlood(S1, 3)   # Host port
+
+
+def test_tree_link_down_is_replaced(network):
+    openflow, timers = network
+    topology = ring()
+    tree = SpanningTree(topology, 0, False)
+    connect(topology)
+    topology.delLink(S1, 1, S2, 1)
+    assert tree.inTree(S3, 2) and tree.inTree(S1, 2)
+    assert tree.blocked == set()
+    assert tree.group(S1) == set([S1, S2, S3])
+
+
+def test_new_switch_is_held_down(network):
+    openflow, timers = network
+    topology = ring()
+    tree = SpanningTree(topology, 2 * LLDP_CYCLE, False)
+    connection = openflow.connections[1]
+    tree._handle_openflow_ConnectionUp(ConnectionUp(1, connection, [1, 2, 3, of.OFPP_MAX + 1]))
+    assert sorted(connection.port_mods) == [(1, False), (2, False), (3, False)]
+    assert [timer[0] for timer in timers] == [2 * LLDP_CYCLE]
+
+    # Discovered during the hold down: the ports are configured once it ends
+    connect(topology)
+    assert tree.blocked >= set([(S1, 1), (S1, 2), (S1, 3)])
+    del connection.port_mods[:]
+    tree._release(*timers[0][1][1:])
+    assert sorted(connection.port_mods) == [(1, True), (3, True)]
+    assert (S1, 2) in tree.blocked
+
+
+def test_hold_down_of_a_reconnected_switch(network):
+    openflow, timers = network
+    topology = ring()
+    tree = SpanningTree(topology, 2 * LLDP_CYCLE, False)
+    tree._handle_openflow_ConnectionUp(ConnectionUp(1, openflow.connections[1], [1, 2, 3]))
+    openflow.connections[1] = Connection([1, 2, 3])
+    tree._release(*timers[0][1][1:])
+    assert openflow.connections[1].port_mods == []
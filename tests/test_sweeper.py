@@ -0,0 +1,142 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+pytest.importorskip("pox.lib.revent")
+
+import gox_sweeper
+from gox_executor import DB_KEY
+from gox_sweeper import PathSweeper, PathsEvicted
+
+
+class Store(object):
+    """ Runs the statements of the sweeper against (mac1, mac2) -> last_used, with mac1 < mac2 """
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+        self.runs = []
+        self.fail = None
+
+    def run(self, name, params=None, callback=None, key=None, errback=None):
+        self.runs.append((name, params, key))
+        if name == self.fail:
+            errback(Exception("unavailable"))
+            return
+        if name == "paths.touch":
+            for row in params["rows"]:
+                key = (row["mac1"], row["mac2"])
+                if key in self.paths:
+                    self.paths[key] = max(self.paths[key], row["last_used"])
+            return
+        if name == "paths.expire":
+            pairs = sorted(pair for pair, last_used in self.paths.items() if last_used < params["before"])
+        elif name == "paths.evictOldest":
+            pairs = sorted(self.paths, key=lambda pair: self.paths[pair])
+        else:
+            callback([{"pairs": len(self.paths)}])
+            return
+        pairs = pairs[:params["limit"]]
+        for pair in pairs:
+            del self.paths[pair]
+        callback([{"mac1": mac1, "mac2": mac2} for mac1, mac2 in pairs])
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gox_sweeper.time, "time", clock)
+    return clock
+
+
+def sweeper(store, **kwargs):
+    sweeper = PathSweeper(store, interval=0, **kwargs)
+    events = []
+    sweeper.addListener(PathsEvicted, events.append)
+    return sweeper, events
+
+
+def pair(i):
+    return ("h{:02}".format(i), "h{:02}x".format(i))
+
+
+def test_expired_paths_are_deleted_by_batches(clock):
+    # Ten paths last used 2 hours ago, five recently
+    store = Store([(pair(i), 0 if i < 10 else 1000 * 1000) for i in range(15)])
+    clock.now += 3600
+    sweeper_, events = sweeper(store, ttl=3600, max_paths=0, batch=4)
+    sweeper_.sweep()
+    assert len(store.paths) == 5
+    assert [name for name, params, key in store.runs] == ["paths.expire"] * 3
+    assert all(key == DB_KEY for name, params, key in store.runs)
+    assert len(events) == 1
+    assert events[0].pairs == set(pair(i) for i in range(10))
+    assert (events[0].expired, events[0].evicted) == (10, 0)
+    assert not sweeper_.sweeping
+
+
+def test_least_recently_used_paths_are_evicted(clock):
+    store = Store([(pair(i), i) for i in range(10)])
+    sweeper_, events = sweeper(store, ttl=0, max_paths=6, batch=3)
+    sweeper_.sweep()
+    assert sorted(store.paths) == [pair(i) for i in range(4, 10)]
+    assert events[0].pairs == set(pair(i) for i in range(4))
+    assert (events[0].expired, events[0].evicted) == (0, 4)
+    assert sweeper_.evicted == 4
+
+
+def test_touched_paths_are_kept(clock):
+    store = Store([(pair(i), 0) for i in range(3)])
+    clock.now += 3600
+    sweeper_, events = sweeper(store, ttl=60, max_paths=0)
+    # Both directions of a pair count as one path
+    sweeper_.touch(*pair(1))
+    sweeper_.touch(*reversed(pair(1)))
+    assert sweeper_.touches == {pair(1): [int(clock.now * 1000), 2]}
+    sweeper_.sweep()
+    assert store.runs[0][0] == "paths.touch"
+    assert sorted(store.paths) == [pair(1)]
+    assert events[0].pairs == set([pair(0), pair(2)])
+    assert sweeper_.touches == {}
+
+
+def test_nothing_to_sweep(clock):
+    store = Store([(pair(i), int(clock.now * 1000)) for i in range(3)])
+    sweeper_, events = sweeper(store, ttl=60, max_paths=3)
+    sweeper_.sweep()
+    assert len(store.paths) == 3
+    assert events == []
+    assert not sweeper_.sweeping
+
+
+def test_failed_sweep_can_run_again(clock):
+    store = Store([(pair(i), i) for i in range(5)])
+    store.fail = "paths.count"
+    sweeper_, events = sweeper(store, ttl=0, max_paths=2)
+    sweeper_.sweep()
+    assert not sweeper_.sweeping
+    assert len(store.paths) == 5
+    store.fail = None
+    sweeper_.sweep()
+    assert len(store.paths) == 2
+    assert events[0].evicted == 3
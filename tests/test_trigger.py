@@ -0,0 +1,155 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("neo4j")
+pytest.importorskip("pox.core")
+
+import gox_queries
+import gox_trigger
+from gox_executor import DB_KEY
+from gox_trigger import TriggerRegistry, UPDATE_LABELS
+
+NAMES = dict((text, name) for name, text in gox_queries.STATEMENTS.items())
+
+
+class Session(object):
+    """ Records the statements run by the registry, by name """
+
+    def __init__(self, installed=()):
+        self.installed = list(installed)
+        self.runs = []
+        self.transactions = []
+        self.fail = set()
+
+    def run(self, text, params):
+        name = NAMES[text]
+        self.runs.append((name, params))
+        if name in self.fail:
+            raise RuntimeError("{} failed".format(name))
+        return self.installed if name == "trigger.list" else []
+
+    def write_transaction(self, function, *args):
+        start = len(self.runs)
+        result = function(self, *args)
+        self.transactions.append([name for name, _ in self.runs[start:]])
+        return result
+
+
+class Executor(object):
+    """ Runs the works right away, recording their keys """
+
+    def __init__(self, session):
+        self.session = session
+        self.keys = []
+
+    def submit(self, work, callback=None, key=None, errback=None):
+        self.keys.append(key)
+        try:
+            result = work(self.session)
+        except Exception as e:
+            if errback is not None:
+                errback(e)
+            return
+        if callback is not None:
+            callback(result)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(gox_queries.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    def make(installed=()):
+        session = Session(installed)
+        # Without a session of its own: every statement must be run by the executor
+        return TriggerRegistry(gox_queries.QueryRegistry(None), Executor(session)), session
+    yield make
+    gox_queries.setTriggered(False)
+
+
+def names(session):
+    return [name for name, _ in session.runs]
+
+
+def test_install_is_idempotent(registry):
+    triggers, session = registry()
+    assert triggers.install("updateLabels", UPDATE_LABELS, "before", {"oldlabel": "A", "newlabel": "B"})
+    assert not triggers.install("updateLabels", UPDATE_LABELS, "before", {"oldlabel": "A", "newlabel": "B"})
+    assert names(session) == ["trigger.list", "trigger.add"]
+    assert triggers.active() == ["updateLabels"]
+    assert gox_queries._triggered
+    assert set(triggers.executor.keys) == set([DB_KEY])
+
+
+def test_installed_triggers_are_loaded(registry):
+    installed = {"name": "updateLabels", "query": UPDATE_LABELS, "selector": {"phase": "before"},
+                 "params": {"oldlabel": "A", "newlabel": "B"}, "paused": True}
+    triggers, session = registry([installed])
+    assert triggers.paused == set(["updateLabels"])
+    assert not triggers.install("updateLabels", UPDATE_LABELS, "before", {"oldlabel": "A", "newlabel": "B"})
+    assert triggers.active() == []
+
+
+def test_pause_and_resume_all(registry):
+    triggers, session = registry()
+    triggers.install("updateLabels", UPDATE_LABELS, "before", {"oldlabel": "A", "newlabel": "B"})
+    triggers.install("other", "RETURN 1", "after", {})
+    triggers.pauseAll()
+    assert session.runs[-1] == ("trigger.pauseAll", {"names": ["updateLabels", "other"]})
+    assert triggers.active() == [] and not gox_queries._triggered
+
+    # Nested bulk operation, and a trigger installed while they run: it is paused too
+    triggers.pauseAll()
+    triggers.install("new", "RETURN 2", "after", {})
+    assert names(session)[-2:] == ["trigger.add", "trigger.pause"]
+    triggers.resumeAll()
+    assert session.transactions == []
+
+    # The catch-up statements run in the transaction resuming the triggers
+    triggers.resumeAll()
+    assert session.transactions == [["trigger.resumeAll", "trigger.catchup.updateLabels"]]
+    assert session.runs[-2] == ("trigger.resumeAll", {"names": ["updateLabels", "other", "new"]})
+    assert session.runs[-1] == ("trigger.catchup.updateLabels", {"oldlabel": "A", "newlabel": "B"})
+    assert gox_queries._triggered
+    triggers.resumeAll()
+    assert len(session.transactions) == 1
+
+
+def test_paused_trigger_stays_paused(registry):
+    triggers, session = registry()
+    triggers.install("other", "RETURN 1", "after", {})
+    triggers.pause("other")
+    triggers.pauseAll()
+    triggers.resumeAll()
+    assert "trigger.pauseAll" not in names(session)
+    assert session.transactions == []
+    triggers.resume("other")
+    assert session.runs[-1] == ("trigger.resume", {"name": "other"})
+
+
+def test_failed_install_can_be_retried(registry):
+    triggers, session = registry()
+    session.fail.add("trigger.add")
+    assert triggers.install("other", "RETURN 1", "after", {})
+    assert "other" not in triggers.installed
+    session.fail.clear()
+    assert triggers.install("other", "RETURN 1", "after", {})
+
+
+def test_waiting_pause_raises_its_error(registry):
+    triggers, session = registry()
+    triggers.install("other", "RETURN 1", "after", {})
+    session.fail.add("trigger.pauseAll")
+    with pytest.raises(RuntimeError):
+        triggers.pauseAll(wait=True)
@@ -0,0 +1,132 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pox.lib.revent")
+# Imported by gox_warmstart, found in POX's ext/ directory
+pytest.importorskip("gox_db")
+
+import gox_warmstart
+from gox_topology import TopologyMirror
+from gox_warmstart import WarmStart
+
+S1 = "00-00-00-00-00-01"
+S2 = "00-00-00-00-00-02"
+S3 = "00-00-00-00-00-03"
+H1 = "02:00:00:00:00:01"
+H2 = "02:00:00:00:00:02"
+
+RECORD = {
+    "switches": [S1, S2, S3],
+    "hosts": [{"mac": H1, "ip": "10.0.0.1"}, {"mac": H2, "ip": None}],
+    "links": [{"name1": S1, "port1": 1, "name2": S2, "port2": 1},
+              {"name1": S2, "port1": 2, "name2": S3, "port2": 1},
+              {"name1": H1, "port1": 0, "name2": S1, "port2": 3},
+              {"name1": H2, "port1": 0, "name2": S3, "port2": 3}],
+    "paths": [{"mac1": H1, "mac2": H2, "switches": [S1, S2, S3], "in_ports": [3, 1, 1], "out_ports": [1, 2, 3]}],
+}
+
+
+class Handler(object):
+    """ Stands for the NetworkEventHandler, recording its topology mutations """
+
+    def __init__(self):
+        self.topology = TopologyMirror()
+        self.written = []
+
+    def _write(self, mutation, *args):
+        self.written.append((mutation,) + args)
+
+
+class Executor(object):
+    def __init__(self):
+        self.runs = []
+
+    def run(self, name, params=None, callback=None, key=None, errback=None):
+        self.runs.append((name, params, key))
+
+
+@pytest.fixture
+def warm(monkeypatch):
+    monkeypatch.setattr(gox_warmstart.core, "hasComponent", lambda name: False, raising=False)
+    monkeypatch.setattr(gox_warmstart.core, "callDelayed", lambda *args, **kwargs: None, raising=False)
+    handler = Handler()
+    executor = Executor()
+    return WarmStart(handler, None, executor, 30, RECORD), handler, executor
+
+
+def test_load(warm):
+    warm_start, handler, executor = warm
+    topology = handler.topology
+    assert topology.switches == set([S1, S2, S3])
+    assert topology.hosts[H2] == " "
+    assert topology.hostLocation(H1) == (S1, 3)
+    assert topology.linkExists(S2, 2, S3, 1)
+    assert warm_start.paths[(H1, H2)].switches == [S1, S2, S3]
+    assert handler.written == [] and executor.runs == []
+
+
+def test_confirm_once(warm):
+    warm_start, handler, executor = warm
+    assert warm_start.confirmSwitch(S1)
+    assert not warm_start.confirmSwitch(S1)
+    assert warm_start.confirmLink(S2, 1, S1, 1)
+    assert not warm_start.confirmLink(S1, 1, S2, 1)
+    assert warm_start.confirmHost(H1, S1, 3)
+    assert not warm_start.confirmSwitch("00-00-00-00-00-09")
+
+
+def test_moved_host_is_added_again(warm):
+    warm_start, handler, executor = warm
+    assert not warm_start.confirmHost(H1, S2, 5)
+    assert handler.written == [("delHost", H1)]
+    assert not handler.topology.hostExists(H1)
+
+
+def test_collect_deletes_the_unconfirmed_entities_at_once(warm):
+    warm_start, handler, executor = warm
+    for dpid in (S1, S2):
+        warm_start.confirmSwitch(dpid)
+    warm_start.confirmLink(S1, 1, S2, 1)
+    warm_start.confirmHost(H1, S1, 3)
+    warm_start.collect()
+
+    assert len(executor.runs) == 1
+    name, params, key = executor.runs[0]
+    assert name == "topology.delStale"
+    assert key == gox_warmstart.DB_KEY
+    assert params == {"rows": [{"links": [{"dpid1": S2, "port1": "2", "dpid2": S3, "port2": "1"}],
+                                "hosts": [H2], "switches": [S3]}]}
+    assert handler.written == []
+    topology = handler.topology
+    assert topology.switches == set([S1, S2])
+    assert not topology.hostExists(H2)
+    assert topology.linkExists(S1, 1, S2, 1) and not topology.linkExists(S2, 2, S3, 1)
+    assert warm_start.paths == {}
+    # Too late: seen again, they are added as new entities
+    assert not warm_start.confirmSwitch(S3)
+
+
+def test_collect_without_stale_entities(warm):
+    warm_start, handler, executor = warm
+    for dpid in (S1, S2, S3):
+        warm_start.confirmSwitch(dpid)
+    warm_start.confirmLink(S1, 1, S2, 1)
+    warm_start.confirmLink(S2, 2, S3, 1)
+    warm_start.confirmHost(H1, S1, 3)
+    warm_start.confirmHost(H2, S3, 3)
+    warm_start.collect()
+    assert executor.runs == []
+    assert len(handler.topology.switches) == 3
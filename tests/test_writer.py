@@ -0,0 +1,125 @@
+# Copyright 2021 <Alex DANDURAN--LEMBEZAT>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("neo4j")
+pytest.importorskip("pox.core")
+
+from neo4j.exceptions import ClientError, ServiceUnavailable
+
+import gox_queries
+import gox_writer
+from gox_writer import TopologyWriter
+
+NAMES = dict((text, name) for name, text in gox_queries.STATEMENTS.items())
+
+
+class Driver(object):
+    """ Fails the transactions with the queued errors, and records the rows of the other ones """
+
+    def __init__(self):
+        self.errors = []
+        self.attempts = 0
+        self.written = []       # (statement name, row), in commit order
+        self.tried = threading.Event()
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def write_transaction(self, function, *args):
+        self.attempts += 1
+        self.tried.set()
+        if self.errors:
+            raise self.errors.pop(0)
+        tx = Transaction()
+        function(tx, *args)
+        self.written.extend(tx.rows)
+
+    def close(self):
+        pass
+
+
+class Transaction(object):
+    def __init__(self):
+        self.rows = []
+
+    def run(self, text, params):
+        self.rows.extend((NAMES[text], row) for row in params["rows"])
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setattr(gox_writer, "RETRY_DELAY", 0.01)
+    monkeypatch.setattr(gox_writer.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    monkeypatch.setattr(gox_queries.core, "addListenerByName", lambda *args, **kwargs: None, raising=False)
+    driver = Driver()
+    writer = TopologyWriter(driver, gox_queries.QueryRegistry(None), max_batch=10, max_delay=0)
+    yield writer, driver
+    writer.stop()
+
+
+def test_batches_keep_their_order(writer):
+    writer, driver = writer
+    writer.addSwitch("s1")
+    writer.addSwitch("s2")
+    writer.addLink("s1", 1, "s2", 1)
+    writer.stop()
+    assert driver.written == [("topology.addSwitch", {"dpid": "s1"}), ("topology.addSwitch", {"dpid": "s2"}),
+                              ("topology.addLink", {"dpid1": "s1", "port1": "1", "dpid2": "s2", "port2": "1"})]
+    assert writer.written == 3 and writer.dropped == 0
+
+
+def test_unavailable_database_is_retried_in_order(writer):
+    writer, driver = writer
+    driver.errors = [ServiceUnavailable("down")] * 3
+    writer.addSwitch("s1")
+    assert driver.tried.wait(1)
+    # Queued while the first batch is retried: written after it
+    writer.delSwitch("s1")
+    deadline = time.time() + 5
+    while len(driver.written) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert driver.written == [("topology.addSwitch", {"dpid": "s1"}), ("topology.delSwitch", {"dpid": "s1"})]
+    assert writer.retries == 3 and writer.dropped == 0
+
+
+def test_rejected_batch_is_dropped(writer):
+    writer, driver = writer
+    driver.errors = [ClientError("constraint")]
+    writer.addSwitch("s1")
+    assert driver.tried.wait(1)
+    writer.addSwitch("s2")
+    writer.stop()
+    assert driver.written == [("topology.addSwitch", {"dpid": "s2"})]
+    assert writer.dropped == 1 and writer.retries == 0
+
+
+def test_stop_gives_up(writer):
+    writer, driver = writer
+    driver.errors = [ServiceUnavailable("down")] * 1000
+    writer.addSwitch("s1")
+    start = time.time()
+    writer.stop()
+    assert time.time() - start < 2
+    assert driver.written == [] and writer.dropped == 1